@@ -0,0 +1,445 @@
+"""
+Архив скачанных страниц: все ответы FBref хранятся сжатыми в одном файле только для дописывания.
+
+Каталог архива (PAGE_ARCHIVE_DIR):
+    pages.dat   записи подряд: заголовок (JSON: url, время, статус, ETag, кодек, словарь) + сжатое тело.
+                Каждая запись сжата отдельно, поэтому для чтения страницы распаковывается только она
+    pages.idx   индекс: запись фиксированной длины на каждую страницу (хэш URL, время, смещение
+                в pages.dat, номер предыдущей версии того же URL)
+    pages.hash  хэш-таблица с открытой адресацией: хэш URL -> последняя версия. Открывается через mmap,
+                поэтому поиск страницы - O(1) без чтения индекса и архива целиком
+    dict-*.bin  словари сжатия (python archive.py train); запись хранит id своего словаря
+
+Сжатие - zstd (пакет zstandard), без него - zlib; оба умеют словари, обученные на страницах FBref.
+Писать могут несколько процессов (воркеры jobs.py): запись идет под файловой блокировкой
+(locks.FileLock: flock на POSIX, msvcrt.locking на Windows). На Windows архивом пользуется один
+процесс: перестройка хэш-таблицы заменяет pages.hash, а Windows не дает заменить файл, который
+другой процесс держит отображенным в память.
+
+    python archive.py stats
+    python archive.py train                    # словарь по последним страницам архива
+    python archive.py show /en/squads/18bb7c10/Arsenal-Stats [--at 2024-01-01] > page.html
+"""
+
+import os
+import re
+import json
+import mmap
+import time
+import zlib
+import struct
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from locks import FileLock
+from config import PAGE_ARCHIVE_DIR, PAGE_ARCHIVE_LEVEL, PAGE_ARCHIVE_DICT_SIZE
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+RECORD_MAGIC = b'FBPG'
+# magic, длина заголовка, длина тела
+RECORD_HEAD = struct.Struct('<4sII')
+# хэш URL, время скачивания, смещение записи, номер предыдущей версии URL + 1 (0 - нет), длина записи
+INDEX_ENTRY = struct.Struct('<QdQQI4x')
+# magic, слотов, занято, учтено записей индекса
+TABLE_HEAD = struct.Struct('<8sQQQ')
+TABLE_MAGIC = b'FBPGHASH'
+# хэш URL, номер последней версии + 1
+TABLE_SLOT = struct.Struct('<QQ')
+TABLE_MIN_SLOTS = 4096
+
+def url_key(url):
+    """Ключ страницы - путь без схемы и хоста: архив заглушки и FBref совместимы"""
+    return re.sub(r'^https?://[^/]+', '', url)
+
+def url_hash(url):
+    digest = hashlib.blake2b(url_key(url).encode('utf-8'), digest_size=8).digest()
+    # 0 означает пустой слот хэш-таблицы
+    return int.from_bytes(digest, 'little') or 1
+
+class ArchivedPage:
+    """Страница из архива"""
+
+    def __init__(self, url, fetched_at, status, content, number, etag=None, last_modified=None):
+        self.url = url
+        self.fetched_at = fetched_at
+        self.status = status
+        self.content = content
+        self.number = number
+        # Валидаторы ответа для условного запроса (If-None-Match / If-Modified-Since)
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def fetched(self):
+        return datetime.fromtimestamp(self.fetched_at)
+
+class PageArchive:
+    """
+    Архив страниц в каталоге path. Объект можно делить между потоками; процессы синхронизируются
+    блокировкой файла, а хэш-таблица после перестройки другим процессом переоткрывается сама.
+    """
+
+    def __init__(self, path=PAGE_ARCHIVE_DIR, level=PAGE_ARCHIVE_LEVEL):
+        self.path = path
+        self.level = level
+        os.makedirs(path, exist_ok=True)
+        self.data_path = os.path.join(path, 'pages.dat')
+        self.index_path = os.path.join(path, 'pages.idx')
+        self.table_path = os.path.join(path, 'pages.hash')
+        self._lock = threading.RLock()
+        self._dicts = {}
+        self._table = self._table_file = self._table_inode = None
+        self._index = self._index_size = None
+        for name in (self.data_path, self.index_path):
+            open(name, 'ab').close()
+        # Чтение записи - seek + read по смещению из индекса (двоичный файл, под self._lock)
+        self._data_file = open(self.data_path, 'rb')
+        with self._locked():
+            if not os.path.exists(self.table_path):
+                self._rebuild_table()
+            self._sync_table()
+
+    # --- блокировки и mmap ---
+
+    def _locked(self):
+        return _FileLock(os.path.join(self.path, '.lock'), self._lock)
+
+    def _map_table(self):
+        """Открывает (или переоткрывает после перестройки другим процессом) хэш-таблицу"""
+        inode = os.stat(self.table_path).st_ino
+        if self._table is not None and inode == self._table_inode:
+            return self._table
+        self._unmap_table()
+        self._table_file = open(self.table_path, 'r+b')
+        self._table = mmap.mmap(self._table_file.fileno(), 0)
+        self._table_inode = inode
+        return self._table
+
+    def _unmap_table(self):
+        """Закрывает mmap хэш-таблицы: Windows не дает заменить отображенный файл"""
+        if self._table is not None:
+            self._table.close()
+            self._table_file.close()
+        self._table = self._table_file = self._table_inode = None
+
+    def _map_index(self):
+        """mmap индекса; переоткрывается, когда индекс вырос"""
+        size = os.path.getsize(self.index_path)
+        if self._index is not None and size == self._index_size:
+            return self._index
+        if isinstance(self._index, mmap.mmap):
+            self._index.close()
+        with open(self.index_path, 'rb') as f:
+            self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self._index_size = size
+        return self._index
+
+    def __len__(self):
+        return os.path.getsize(self.index_path) // INDEX_ENTRY.size
+
+    # --- хэш-таблица ---
+
+    def _slot(self, table, slots, key):
+        """Смещение слота ключа key (или первого пустого слота на его пути)"""
+        position = key % slots
+        while True:
+            offset = TABLE_HEAD.size + position * TABLE_SLOT.size
+            slot_key, _ = TABLE_SLOT.unpack_from(table, offset)
+            if slot_key in (0, key):
+                return offset
+            position = (position + 1) % slots
+
+    def _rebuild_table(self, slots=TABLE_MIN_SLOTS):
+        """Строит хэш-таблицу заново по индексу (не по архиву) и атомарно заменяет файл"""
+        count = len(self)
+        while slots < count * 2:
+            slots *= 2
+        table = bytearray(TABLE_HEAD.size + slots * TABLE_SLOT.size)
+        latest = {}
+        index = self._map_index()
+        for number in range(count):
+            key = INDEX_ENTRY.unpack_from(index, number * INDEX_ENTRY.size)[0]
+            latest[key] = number + 1
+        for key, head in latest.items():
+            TABLE_SLOT.pack_into(table, self._slot(table, slots, key), key, head)
+        TABLE_HEAD.pack_into(table, 0, TABLE_MAGIC, slots, len(latest), count)
+        tmp_path = self.table_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(table)
+        self._unmap_table()
+        os.replace(tmp_path, self.table_path)
+
+    def _sync_table(self):
+        """Досчитывает в хэш-таблицу записи индекса, которые в нее не попали (сбой между записями)"""
+        table = self._map_table()
+        _, slots, used, indexed = TABLE_HEAD.unpack_from(table, 0)
+        count = len(self)
+        if indexed >= count:
+            return
+        index = self._map_index()
+        for number in range(indexed, count):
+            key = INDEX_ENTRY.unpack_from(index, number * INDEX_ENTRY.size)[0]
+            self._set_head(key, number + 1)
+
+    def _set_head(self, key, head):
+        """Последняя версия URL -> head; при заполнении таблицы больше чем наполовину - перестройка"""
+        table = self._map_table()
+        _, slots, used, indexed = TABLE_HEAD.unpack_from(table, 0)
+        offset = self._slot(table, slots, key)
+        is_new = TABLE_SLOT.unpack_from(table, offset)[0] == 0
+        if is_new and (used + 1) * 2 > slots:
+            self._rebuild_table(slots * 2)
+            return
+        TABLE_SLOT.pack_into(table, offset, key, head)
+        TABLE_HEAD.pack_into(table, 0, TABLE_MAGIC, slots, used + is_new, max(indexed, head))
+
+    def _head(self, key):
+        """Номер последней версии URL + 1 или 0"""
+        with self._lock:
+            table = self._map_table()
+            _, slots, _, _ = TABLE_HEAD.unpack_from(table, 0)
+            return TABLE_SLOT.unpack_from(table, self._slot(table, slots, key))[1]
+
+    # --- сжатие ---
+
+    def _codec(self):
+        return 'zstd' if zstandard is not None else 'zlib'
+
+    def _current_dict(self):
+        """(id, байты) текущего словаря или (None, None)"""
+        current = os.path.join(self.path, 'dict.current')
+        if not os.path.exists(current):
+            return None, None
+        with open(current) as f:
+            dict_id = f.read().strip()
+        return dict_id, self._dictionary(dict_id)
+
+    def _dictionary(self, dict_id):
+        if dict_id not in self._dicts:
+            with open(os.path.join(self.path, f'dict-{dict_id}.bin'), 'rb') as f:
+                self._dicts[dict_id] = f.read()
+        return self._dicts[dict_id]
+
+    def _compress(self, content):
+        codec = self._codec()
+        dict_id, dictionary = self._current_dict()
+        if codec == 'zstd':
+            params = {'level': self.level}
+            if dictionary:
+                params['dict_data'] = zstandard.ZstdCompressionDict(dictionary)
+            return codec, dict_id, zstandard.ZstdCompressor(**params).compress(content)
+        level = min(self.level, 9)
+        compressor = zlib.compressobj(level, zdict=dictionary) if dictionary else zlib.compressobj(level)
+        return codec, dict_id, compressor.compress(content) + compressor.flush()
+
+    def _decompress(self, codec, dict_id, payload):
+        dictionary = self._dictionary(dict_id) if dict_id else None
+        if codec == 'zstd':
+            if zstandard is None:
+                raise RuntimeError('страница сжата zstd: нужен пакет zstandard')
+            params = {'dict_data': zstandard.ZstdCompressionDict(dictionary)} if dictionary else {}
+            return zstandard.ZstdDecompressor(**params).decompress(payload)
+        decompressor = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+        return decompressor.decompress(payload) + decompressor.flush()
+
+    # --- запись и чтение ---
+
+    def append(self, url, content, status=200, fetched_at=None, etag=None, last_modified=None):
+        """Дописывает страницу в архив. Возвращает ее номер"""
+        fetched_at = fetched_at or time.time()
+        codec, dict_id, payload = self._compress(content)
+        header = json.dumps({
+            'url': url, 'fetched_at': fetched_at, 'status': status, 'codec': codec, 'dict': dict_id,
+            'size': len(content), 'etag': etag, 'last_modified': last_modified,
+        }).encode('utf-8')
+        record = RECORD_HEAD.pack(RECORD_MAGIC, len(header), len(payload)) + header + payload
+        key = url_hash(url)
+
+        with self._locked():
+            self._sync_table()
+            with open(self.data_path, 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(record)
+            number = len(self)
+            entry = INDEX_ENTRY.pack(key, fetched_at, offset, self._head(key), len(record))
+            with open(self.index_path, 'ab') as f:
+                f.write(entry)
+            self._set_head(key, number + 1)
+        return number
+
+    def _entry(self, number):
+        with self._lock:
+            return INDEX_ENTRY.unpack_from(self._map_index(), number * INDEX_ENTRY.size)
+
+    def read(self, number):
+        """Страница по номеру записи (ArchivedPage)"""
+        _, _, offset, _, length = self._entry(number)
+        with self._lock:
+            self._data_file.seek(offset)
+            record = self._data_file.read(length)
+        magic, header_length, payload_length = RECORD_HEAD.unpack_from(record)
+        if magic != RECORD_MAGIC:
+            raise ValueError(f'поврежденная запись архива #{number}')
+        header = json.loads(record[RECORD_HEAD.size:RECORD_HEAD.size + header_length])
+        payload = record[RECORD_HEAD.size + header_length:RECORD_HEAD.size + header_length + payload_length]
+        content = self._decompress(header['codec'], header['dict'], payload)
+        return ArchivedPage(header['url'], header['fetched_at'], header['status'], content, number,
+                            header.get('etag'), header.get('last_modified'))
+
+    def versions(self, url):
+        """Номера и время всех версий страницы, от новой к старой: [(номер, fetched_at)]"""
+        key = url_hash(url)
+        versions = []
+        head = self._head(key)
+        while head:
+            entry_key, fetched_at, _, previous, _ = self._entry(head - 1)
+            if entry_key != key:
+                break
+            versions.append((head - 1, fetched_at))
+            head = previous
+        return versions
+
+    def get(self, url, at=None):
+        """
+        Последняя версия страницы или последняя, скачанная не позже at (datetime или timestamp).
+        None, если такой страницы в архиве нет.
+        """
+        if isinstance(at, datetime):
+            at = at.timestamp()
+        for number, fetched_at in self.versions(url):
+            if at is None or fetched_at <= at:
+                page = self.read(number)
+                return page if url_key(page.url) == url_key(url) else None
+        return None
+
+    def latest(self):
+        """Номер последней версии каждого URL (для повторного разбора), в порядке скачивания"""
+        index = self._map_index()
+        heads = {}
+        for number in range(len(self)):
+            heads[INDEX_ENTRY.unpack_from(index, number * INDEX_ENTRY.size)[0]] = number
+        return sorted(heads.values())
+
+    def train_dictionary(self, samples=200, size=PAGE_ARCHIVE_DICT_SIZE):
+        """
+        Обучает словарь сжатия по последним samples страницам и делает его текущим для новых записей.
+        zstd обучает словарь (zstandard.train_dictionary); zlib использует хвост образцов (до 32 КБ).
+        Возвращает id словаря.
+        """
+        count = len(self)
+        pages = [self.read(number).content for number in range(max(0, count - samples), count)]
+        if not pages:
+            raise ValueError('архив пуст - обучать словарь не на чем')
+        if zstandard is not None:
+            dictionary = zstandard.train_dictionary(size, pages).as_bytes()
+        else:
+            # zlib ищет совпадения в последних 32 КБ словаря: общая разметка страниц FBref
+            dictionary = b''.join(page[:4096] for page in pages[-8:])[-32768:]
+        dict_id = hashlib.blake2b(dictionary, digest_size=4).hexdigest()
+        with open(os.path.join(self.path, f'dict-{dict_id}.bin'), 'wb') as f:
+            f.write(dictionary)
+        with self._locked():
+            tmp_path = os.path.join(self.path, 'dict.current.tmp')
+            with open(tmp_path, 'w') as f:
+                f.write(dict_id)
+            os.replace(tmp_path, os.path.join(self.path, 'dict.current'))
+        logger.info(f"📚 Словарь сжатия {dict_id}: {len(dictionary)} байт, образцов {len(pages)}")
+        return dict_id
+
+    def stats(self):
+        """Количество записей, URL, размер архива и исходных страниц"""
+        table = self._map_table()
+        _, _, urls, _ = TABLE_HEAD.unpack_from(table, 0)
+        return {
+            'pages': len(self),
+            'urls': urls,
+            'archive_bytes': os.path.getsize(self.data_path),
+            'index_bytes': os.path.getsize(self.index_path) + os.path.getsize(self.table_path),
+            'codec': self._codec(),
+            'dict': self._current_dict()[0],
+        }
+
+class _FileLock:
+    """Блокировка между потоками (RLock) и процессами (locks.FileLock на файле)"""
+
+    def __init__(self, path, lock):
+        self.lock = lock
+        self.file_lock = FileLock(path)
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            self.file_lock.acquire()
+        except BaseException:
+            self.lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.file_lock.release()
+        finally:
+            self.lock.release()
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+def get_archive(path=PAGE_ARCHIVE_DIR):
+    """Общий на процесс PageArchive для каталога path"""
+    with _archives_lock:
+        key = (os.getpid(), os.path.abspath(path))
+        if key not in _archives:
+            _archives[key] = PageArchive(path)
+        return _archives[key]
+
+def archive_page(url, content, status=200, path=PAGE_ARCHIVE_DIR, etag=None, last_modified=None):
+    """Сохраняет скачанную страницу (FBRefScraper.get); ошибка архива не прерывает скачивание"""
+    try:
+        get_archive(path).append(url, content, status, etag=etag, last_modified=last_modified)
+    except OSError as e:
+        logger.error(f"❌ Не удалось сохранить страницу в архив: {e}")
+
+def main(argv=None):
+    import sys
+    import argparse
+    parser = argparse.ArgumentParser(description='Архив скачанных страниц')
+    parser.add_argument('--path', default=PAGE_ARCHIVE_DIR, help='каталог архива')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('stats', help='размер архива')
+    train = commands.add_parser('train', help='обучить словарь сжатия по последним страницам')
+    train.add_argument('--samples', type=int, default=200)
+    show = commands.add_parser('show', help='вывести страницу')
+    show.add_argument('url')
+    show.add_argument('--at', help='версия на дату YYYY-MM-DD[THH:MM]')
+    history = commands.add_parser('history', help='версии страницы')
+    history.add_argument('url')
+    args = parser.parse_args(argv)
+
+    from log_setup import setup_logging
+    setup_logging(log_file=None)
+    archive = PageArchive(args.path)
+
+    if args.command == 'stats':
+        for name, value in archive.stats().items():
+            print(f"{name:<14} {value}")
+    elif args.command == 'train':
+        archive.train_dictionary(args.samples)
+    elif args.command == 'history':
+        for number, fetched_at in archive.versions(args.url):
+            print(f"#{number:<8} {datetime.fromtimestamp(fetched_at):%Y-%m-%d %H:%M:%S}")
+    else:
+        page = archive.get(args.url, datetime.fromisoformat(args.at) if args.at else None)
+        if page is None:
+            print(f"Страницы нет в архиве: {args.url}", file=sys.stderr)
+            return 1
+        sys.stdout.buffer.write(page.content)
+
+if __name__ == '__main__':
+    raise SystemExit(main())
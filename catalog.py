@@ -0,0 +1,279 @@
+"""
+Каталог именованных SQL запросов (queries.sql).
+
+Запрос в queries.sql начинается строкой `-- name: <имя>`, за ней - описание в комментариях,
+необязательные `-- example: ключ=значение, ...` (параметры для bench и run) и
+`-- full-scan: таблица - причина` (полный просмотр таблицы нужен запросу по смыслу; причина обязательна).
+Параметры - в стиле :name, как у query_db.fetch_rows.
+Файл разбирается один раз за процесс; query_db.py берет SQL из каталога по имени.
+
+Проверки (только SQLite):
+    python catalog.py list
+    python catalog.py explain [--db football_data.db]     # код 1 при полном просмотре matches / player_stats
+    python catalog.py bench --db a.db --db b.db [--repeat 20]
+    python catalog.py run top_scorers --param limit=5
+
+explain строит EXPLAIN QUERY PLAN для каждого запроса. Индексным считается только шаг SEARCH:
+любой шаг 'SCAN <таблица>' по одной из QUERY_PLAN_TABLES, в том числе 'SCAN ... USING INDEX'
+(все строки, только в порядке индекса), у запроса без отметки full-scan означает, что не хватает индекса.
+bench выполняет все запросы на одном соединении: первое выполнение включает компиляцию
+запроса, повторные берут подготовленный запрос из кэша соединения sqlite3.
+"""
+
+import os
+import re
+import sqlite3
+import statistics
+import time
+from config import DB_PATH, QUERY_PLAN_TABLES
+
+QUERIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'queries.sql')
+
+PARAM_RE = re.compile(r'(?<![:\w]):([A-Za-z_]\w*)')
+# Таблица и псевдоним в FROM / JOIN: 'FROM matches m', 'JOIN teams AS t'
+TABLE_RE = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.I)
+SQL_KEYWORDS = {'on', 'where', 'join', 'left', 'inner', 'cross', 'group', 'order', 'limit', 'union', 'using'}
+# 'SCAN m', 'SCAN matches USING INDEX ix_matches_date', 'SCAN t USING COVERING INDEX ...' -
+# все три читают таблицу целиком; только SEARCH читает часть строк по индексу
+SCAN_RE = re.compile(r'^SCAN (\w+)')
+
+class Query:
+    """Именованный запрос каталога"""
+
+    def __init__(self, name, sql, description='', example=None, full_scan=None):
+        self.name = name
+        self.sql = sql
+        self.description = description
+        self.example = example or {}
+        # {таблица: причина полного просмотра}
+        self.full_scan = dict(full_scan or {})
+        self.params = list(dict.fromkeys(PARAM_RE.findall(sql)))
+
+    def tables(self):
+        """Псевдоним (или имя) -> таблица для всех таблиц в FROM / JOIN"""
+        tables = {}
+        for table, alias in TABLE_RE.findall(self.sql):
+            tables[table] = table
+            if alias and alias.lower() not in SQL_KEYWORDS:
+                tables[alias] = table
+        return tables
+
+    def bind(self, params=None):
+        """Значения всех параметров запроса: переданные, иначе из example, иначе None"""
+        params = params or {}
+        return {name: params.get(name, self.example.get(name)) for name in self.params}
+
+def _value(text):
+    text = text.strip()
+    return int(text) if re.fullmatch(r'-?\d+', text) else text
+
+def parse_catalog(text):
+    """Текст queries.sql -> {имя: Query} в порядке файла"""
+    queries = {}
+    for chunk in re.split(r'^-- name:', text, flags=re.M)[1:]:
+        lines = chunk.splitlines()
+        name = lines[0].strip()
+        description, example, full_scan, sql = [], {}, {}, []
+        for line in lines[1:]:
+            stripped = line.strip()
+            if not sql and stripped.startswith('--'):
+                comment = stripped[2:].strip()
+                if comment.startswith('example:'):
+                    for pair in comment[len('example:'):].split(','):
+                        key, _, value = pair.partition('=')
+                        example[key.strip()] = _value(value)
+                elif comment.startswith('full-scan:'):
+                    tables, _, reason = comment[len('full-scan:'):].partition(' - ')
+                    if not reason.strip():
+                        raise ValueError(f"Запрос '{name}': у full-scan нет причины ('-- full-scan: таблица - причина')")
+                    full_scan.update((table.strip(), reason.strip()) for table in tables.split(','))
+                else:
+                    description.append(comment)
+                continue
+            if not sql and not stripped:
+                continue
+            sql.append(line.rstrip())
+            if stripped.endswith(';'):
+                break
+        if name in queries:
+            raise ValueError(f"Запрос '{name}' объявлен в каталоге дважды")
+        if not sql:
+            raise ValueError(f"Запрос '{name}' без SQL")
+        queries[name] = Query(name, '\n'.join(sql).rstrip(';'), ' '.join(description), example, full_scan)
+    return queries
+
+_catalogs = {}
+
+def load_catalog(path=QUERIES_PATH):
+    """Каталог запросов; файл перечитывается, только если изменился"""
+    mtime = os.path.getmtime(path)
+    cached = _catalogs.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, encoding='utf-8') as f:
+            cached = _catalogs[path] = (mtime, parse_catalog(f.read()))
+    return cached[1]
+
+def get_query(name):
+    """Query по имени; KeyError с понятным текстом, если такого запроса нет"""
+    catalog = load_catalog()
+    if name not in catalog:
+        raise KeyError(f"Запроса '{name}' нет в {QUERIES_PATH}")
+    return catalog[name]
+
+def query_sql(name):
+    """SQL запроса каталога для query_db.fetch_rows / read_sql"""
+    return get_query(name).sql
+
+def expand_list(sql, name, values, params=None):
+    """
+    Параметр-список для IN (:name): (sql, params) с параметрами :name_0, :name_1, ... по одному
+    на значение - так запрос выполняется одинаково через sqlite3 и SQLAlchemy text().
+    """
+    params = dict(params or {})
+    values = list(values)
+    if not values:
+        # IN (NULL) - пустой результат
+        params[name] = None
+        return sql, params
+    names = [f'{name}_{i}' for i in range(len(values))]
+    params.update(zip(names, values))
+    return re.sub(rf':{name}\b', ', '.join(f':{n}' for n in names), sql), params
+
+def sqlite_path(db):
+    """'sqlite:///football_data.db' или путь к файлу -> путь к файлу SQLite"""
+    if db.startswith('sqlite:///'):
+        db = db[len('sqlite:///'):]
+    elif '://' in db:
+        raise ValueError(f"Проверка планов поддерживается только для SQLite: {db}")
+    if not os.path.exists(db):
+        raise FileNotFoundError(f"База данных не найдена: {db}")
+    return db
+
+def connect(db=DB_PATH):
+    """Соединение только для чтения; кэш подготовленных запросов вмещает весь каталог"""
+    conn = sqlite3.connect(f"file:{sqlite_path(db)}?mode=ro", uri=True,
+                           cached_statements=max(128, 2 * len(load_catalog())))
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def explain(conn, query, tables=QUERY_PLAN_TABLES):
+    """
+    План запроса: (шаги EXPLAIN QUERY PLAN, полные просмотры). Полный просмотр - шаг SCAN таблицы
+    из tables (с индексом или без), если запрос не отмечен full-scan для этой таблицы.
+    """
+    plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + query.sql, query.bind())]
+    aliases = query.tables()
+    scans = []
+    for step in plan:
+        found = SCAN_RE.match(step)
+        if not found:
+            continue
+        table = aliases.get(found.group(1), found.group(1))
+        if table in tables and table not in query.full_scan:
+            scans.append(table)
+    return plan, scans
+
+def check_plans(conn, catalog=None, tables=QUERY_PLAN_TABLES):
+    """{имя запроса: (план, полные просмотры)} для всех запросов каталога"""
+    catalog = catalog or load_catalog()
+    return {name: explain(conn, query, tables) for name, query in catalog.items()}
+
+def bench(conn, catalog=None, repeat=10):
+    """
+    Время запросов каталога на соединении conn: {имя: (строк, первое выполнение, медиана, максимум)}, мс.
+    Первое выполнение включает компиляцию запроса, повторные - из кэша подготовленных запросов.
+    """
+    catalog = catalog or load_catalog()
+    timings = {}
+    for name, query in catalog.items():
+        params = query.bind()
+        samples = []
+        for _ in range(repeat + 1):
+            started = time.perf_counter()
+            rows = conn.execute(query.sql, params).fetchall()
+            samples.append((time.perf_counter() - started) * 1000)
+        timings[name] = (len(rows), samples[0], statistics.median(samples[1:]), max(samples[1:]))
+    return timings
+
+def _print_plans(conn, catalog, verbose=False):
+    """Печатает запросы с полным просмотром (verbose - все планы). True, если такие есть"""
+    failed = False
+    for name, (plan, scans) in check_plans(conn, catalog).items():
+        if scans:
+            failed = True
+            print(f"❌ {name:<20} полный просмотр: {', '.join(sorted(set(scans)))}")
+        elif verbose:
+            print(f"✅ {name}")
+            for table, reason in catalog[name].full_scan.items():
+                print(f"      full-scan {table}: {reason}")
+        if scans or verbose:
+            for step in plan:
+                print(f"      {step}")
+    if not failed:
+        print(f"✅ Планы {len(catalog)} запросов без полного просмотра {', '.join(QUERY_PLAN_TABLES)}")
+    return failed
+
+def _print_bench(conn, catalog, repeat):
+    timings = bench(conn, catalog, repeat)
+    print(f"{'Запрос':<20} {'строк':>7} {'первый, мс':>11} {'медиана, мс':>12} {'макс, мс':>9}")
+    for name, (rows, first, median, worst) in sorted(timings.items(), key=lambda item: -item[1][2]):
+        print(f"{name:<20} {rows:>7} {first:>11.2f} {median:>12.2f} {worst:>9.2f}")
+
+def main(argv=None):
+    import sys
+    import argparse
+    parser = argparse.ArgumentParser(description='Каталог SQL запросов (queries.sql)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='запросы каталога и их параметры')
+    explain_parser = commands.add_parser('explain', help='проверить планы запросов')
+    explain_parser.add_argument('--db', action='append', help='база SQLite (можно несколько)')
+    explain_parser.add_argument('--verbose', action='store_true', help='показать планы целиком')
+    bench_parser = commands.add_parser('bench', help='время выполнения запросов')
+    bench_parser.add_argument('--db', action='append', help='база SQLite (можно несколько)')
+    bench_parser.add_argument('--repeat', type=int, default=10, help='повторов каждого запроса')
+    run_parser = commands.add_parser('run', help='выполнить запрос каталога')
+    run_parser.add_argument('name')
+    run_parser.add_argument('--db', default=DB_PATH)
+    run_parser.add_argument('--param', action='append', default=[], metavar='КЛЮЧ=ЗНАЧЕНИЕ')
+    args = parser.parse_args(argv)
+
+    catalog = load_catalog()
+    if args.command == 'list':
+        for name, query in catalog.items():
+            params = ', '.join(f':{param}' for param in query.params)
+            print(f"{name:<20} {params:<28} {query.description}")
+        return
+
+    if args.command == 'run':
+        params = {}
+        for pair in args.param:
+            key, _, value = pair.partition('=')
+            params[key] = _value(value)
+        query = get_query(args.name)
+        conn = connect(args.db)
+        try:
+            rows = conn.execute(query.sql, query.bind(params)).fetchall()
+        finally:
+            conn.close()
+        if rows:
+            print(' | '.join(rows[0].keys()))
+        for row in rows:
+            print(' | '.join('' if value is None else str(value) for value in row))
+        return
+
+    failed = False
+    for db in args.db or [DB_PATH]:
+        print(f"\n💾 {db}")
+        conn = connect(db)
+        try:
+            if args.command == 'explain':
+                failed = _print_plans(conn, catalog, args.verbose) or failed
+            else:
+                _print_bench(conn, catalog, args.repeat)
+        finally:
+            conn.close()
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Журнал изменений (change data capture) для инкрементальной синхронизации потребителей.
+
+Каждый запуск загрузки регистрируется в etl_runs (start_run / finish_run). Пока запуск открыт,
+триггеры SQLite (db.install_change_triggers) пишут в change_log каждую вставку, обновление
+и удаление строк teams, players, matches, team_match_stats, squad_stats, player_stats:
+ключ строки, измененные колонки и строку после изменения.
+
+Потребитель запоминает номер последнего обработанного запуска и забирает только новое:
+
+    python etl.py changes --since 41 > changes.ndjson
+
+В выдачу попадают только завершенные запуски; при загрузке через staging журнал
+публикуется вместе с данными.
+"""
+
+import sys
+import json
+import logging
+from datetime import datetime
+from sqlalchemy.orm import Session
+from db import EtlRun, ChangeLog, stream_query
+from config import DB_PATH, CDC_RETENTION_RUNS
+
+logger = logging.getLogger(__name__)
+
+def start_run(session: Session, kind='run'):
+    """
+    Открывает запуск и возвращает его id. Запуски, оставшиеся открытыми после сбоя,
+    закрываются со статусом 'failed'. Коммитит сессию.
+    """
+    now = datetime.now()
+    session.query(EtlRun).filter(EtlRun.finished_at.is_(None)).update(
+        {'finished_at': now, 'status': 'failed'}, synchronize_session=False
+    )
+    run = EtlRun(kind=kind, started_at=now, status='running')
+    session.add(run)
+    session.commit()
+    logger.info(f"📝 Запуск #{run.id} ({kind}): журнал изменений включен")
+    return run.id
+
+def finish_run(session: Session, run_id, status='success', retention=CDC_RETENTION_RUNS):
+    """Закрывает запуск и удаляет журнал запусков старше retention последних. Коммитит сессию."""
+    session.query(EtlRun).filter(EtlRun.id == run_id).update(
+        {'finished_at': datetime.now(), 'status': status}, synchronize_session=False
+    )
+    changes = session.query(ChangeLog).filter(ChangeLog.run_id == run_id).count()
+    if retention:
+        session.query(ChangeLog).filter(ChangeLog.run_id <= run_id - retention).delete(synchronize_session=False)
+    session.commit()
+    logger.info(f"📝 Запуск #{run_id} завершен ({status}): изменений {changes}")
+    return changes
+
+CHANGES_SQL = """
+SELECT c.id, c.run_id, c.table_name, c.operation, c.row_key, c.changed_columns, c.row_data
+FROM change_log c
+JOIN etl_runs r ON c.run_id = r.id
+WHERE c.run_id > :since AND r.finished_at IS NOT NULL
+ORDER BY c.id
+"""
+
+def changes_since(since=0, db_path=DB_PATH, tables=None):
+    """
+    Изменения завершенных запусков с id > since в порядке применения:
+    dict(change_id, run_id, table, operation, key, changed, data).
+    """
+    for row in stream_query(CHANGES_SQL, {'since': since}, db_path=db_path):
+        if tables and row[2] not in tables:
+            continue
+        yield {
+            'change_id': row[0],
+            'run_id': row[1],
+            'table': row[2],
+            'operation': row[3],
+            'key': json.loads(row[4]),
+            'changed': row[5].split(',') if row[5] else [],
+            'data': json.loads(row[6]) if row[6] else None,
+        }
+
+def export_ndjson(since=0, output=None, db_path=DB_PATH, tables=None):
+    """Пишет изменения (changes_since) в output построчно в JSON (по умолчанию stdout). Возвращает их количество."""
+    output = output or sys.stdout
+    count = 0
+    for change in changes_since(since, db_path, tables):
+        output.write(json.dumps(change, ensure_ascii=False) + '\n')
+        count += 1
+    return count
+
+def runs(db_path=DB_PATH, limit=20):
+    """Последние запуски: [(id, kind, started_at, finished_at, status, изменений)]"""
+    sql = """
+    SELECT r.id, r.kind, r.started_at, r.finished_at, r.status,
+           (SELECT COUNT(*) FROM change_log c WHERE c.run_id = r.id)
+    FROM etl_runs r ORDER BY r.id DESC LIMIT :limit
+    """
+    return [tuple(row) for row in stream_query(sql, {'limit': limit}, db_path=db_path)]
+
+def main(argv=None):
+    """Выгрузка журнала изменений в NDJSON"""
+    import argparse
+    parser = argparse.ArgumentParser(description='Журнал изменений (NDJSON)')
+    parser.add_argument('--since', type=int, default=0, help='номер последнего обработанного запуска')
+    parser.add_argument('--table', action='append', help='только эти таблицы (можно несколько)')
+    parser.add_argument('--output', help='файл (по умолчанию stdout)')
+    parser.add_argument('--runs', action='store_true', help='показать последние запуски')
+    args = parser.parse_args(argv)
+
+    if args.runs:
+        for run_id, kind, started, finished, status, changes in runs():
+            print(f"#{run_id:<5} {kind:<8} {str(started)[:19]:<20} {str(finished or '')[:19]:<20} {status:<8} {changes}")
+        return
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            count = export_ndjson(args.since, f, tables=args.table)
+        print(f"✅ Изменений: {count} -> {args.output}", file=sys.stderr)
+    else:
+        export_ndjson(args.since, tables=args.table)
+
+if __name__ == '__main__':
+    main()
@@ -19,6 +19,12 @@ def main():
     else:
         print(f"ℹ️  База данных не найдена: {db_file}")
     
+    # Служебные файлы WAL и staging база незавершенного запуска
+    for extra_file in (db_file + '-wal', db_file + '-shm', db_file + '.writer.lock', 'football_data.staging.db'):
+        if os.path.exists(extra_file):
+            os.remove(extra_file)
+            print(f"✅ Удален файл: {extra_file}")
+    
     # Удаляем лог файл
     if os.path.exists(log_file):
         os.remove(log_file)
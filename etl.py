@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Единая точка входа ETL:
+
+    python etl.py run                      # скачать и загрузить данные (main.py)
+    python etl.py schedule                 # обновления по календарю матчей (scheduler.py)
+    python etl.py jobs work                # воркер распределенного скачивания (jobs.py)
+    python etl.py query standings          # готовые запросы (query_db.py)
+    python etl.py query matches Arsenal
+    python etl.py query ratings --date 2024-01-01
+    python etl.py catalog explain          # планы запросов queries.sql без полных просмотров (catalog.py)
+    python etl.py reparse cache/archive    # повторный разбор сохраненных страниц (reparse.py)
+    python etl.py ratings                  # полный пересчет рейтингов Эло (ratings.py)
+    python etl.py metrics                  # полный пересчет формы и per-90 (metrics.py)
+    python etl.py features                 # выгрузка хранилища признаков (features.py)
+    python etl.py changes --since 41       # журнал изменений после запуска 41 в NDJSON (cdc.py)
+    python etl.py validate                 # сводка проверок качества последнего запуска (validate.py)
+    python etl.py clean                    # удалить базу и лог (clean_db.py)
+    python etl.py stats                    # количество строк в таблицах
+
+Модули подкоманд импортируются только при их вызове: запросам не нужны
+requests, BeautifulSoup и pandas, поэтому `query` и `stats` стартуют за доли секунды.
+"""
+
+import sys
+import argparse
+
+# Запросы: имя -> (функция query_db, аргументы командной строки)
+QUERIES = {
+    'teams': ('query_all_teams', []),
+    'matches': ('query_team_matches', ['team_name']),
+    'standings': ('query_squad_stats_from_matches', ['season', 'competition']),
+    'squads': ('query_squad_stats', ['season', 'competition']),
+    'scorers': ('query_top_scorers', ['limit']),
+    'player': ('query_find_player', ['player_name']),
+    'ratings': ('query_ratings', ['as_of', 'limit']),
+    'form': ('query_form', ['limit']),
+    'per90': ('query_per90', ['stat', 'limit']),
+    'similar': ('query_similar_players', ['player_name', 'limit', 'metric', 'position']),
+    'pandas': ('query_with_pandas', []),
+    'all': ('main', []),
+}
+
+def cmd_run(args):
+    from main import main
+    main()
+
+def cmd_schedule(args):
+    from scheduler import main
+    argv = []
+    if args.once:
+        argv.append('--once')
+    if args.dry_run:
+        argv.append('--dry-run')
+    main(argv)
+
+def cmd_jobs(args):
+    from jobs import main
+    main(args.args)
+
+def cmd_query(args):
+    import query_db
+    function_name, arg_names = QUERIES[args.name]
+    kwargs = {name: getattr(args, name) for name in arg_names if getattr(args, name) is not None}
+    getattr(query_db, function_name)(**kwargs)
+
+def cmd_catalog(args):
+    from catalog import main
+    main(args.args)
+
+def cmd_reparse(args):
+    from reparse import main
+    argv = list(args.sources)
+    if args.workers:
+        argv += ['--workers', str(args.workers)]
+    if args.db:
+        argv += ['--db', args.db]
+    main(argv)
+
+def cmd_ratings(args):
+    from ratings import main
+    main()
+
+def cmd_metrics(args):
+    from metrics import main
+    main()
+
+def cmd_features(args):
+    from features import main
+    main()
+
+def cmd_changes(args):
+    from cdc import main
+    argv = ['--since', str(args.since)]
+    for table in args.table or []:
+        argv += ['--table', table]
+    if args.output:
+        argv += ['--output', args.output]
+    if args.runs:
+        argv.append('--runs')
+    main(argv)
+
+def cmd_clean(args):
+    from clean_db import main
+    main()
+
+def cmd_validate(args):
+    from validate import main
+    argv = []
+    if args.run:
+        argv += ['--run', str(args.run)]
+    if args.season:
+        argv += ['--season', args.season]
+    main(argv)
+
+def cmd_stats(args):
+    from query_db import query_database_info
+    query_database_info()
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='etl', description='FBref ETL')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('run', help='скачать и загрузить данные').set_defaults(func=cmd_run)
+
+    schedule = commands.add_parser('schedule', help='обновлять команды после их матчей (демон)')
+    schedule.add_argument('--once', action='store_true', help='выполнить наступившие обновления и выйти')
+    schedule.add_argument('--dry-run', action='store_true', help='показать план и выйти')
+    schedule.set_defaults(func=cmd_schedule)
+
+    jobs = commands.add_parser('jobs', help='распределенное скачивание: seed, work, status')
+    jobs.add_argument('args', nargs=argparse.REMAINDER, help='аргументы jobs.py')
+    jobs.set_defaults(func=cmd_jobs)
+
+    query = commands.add_parser('query', help='готовые запросы к базе')
+    query.add_argument('name', choices=QUERIES)
+    query.add_argument('text', nargs='?', help='команда (matches) или игрок (player, similar)')
+    query.add_argument('--limit', type=int, help='количество строк (scorers, ratings, form, per90)')
+    query.add_argument('--date', dest='as_of', help='рейтинг на дату YYYY-MM-DD (ratings)')
+    query.add_argument('--metric', choices=['cosine', 'euclidean'], help='мера близости (similar)')
+    query.add_argument('--position', help='позиция, например FW или MF,FW (similar)')
+    query.add_argument('--stat', choices=['goals', 'assists', 'xg', 'npxg', 'xag'], help='показатель (per90)')
+    query.add_argument('--season', help='сезон, например 2023-2024 (standings, squads; по умолчанию SEASON)')
+    query.add_argument('--competition', help='турнир (standings, squads; по умолчанию COMPETITION)')
+    query.set_defaults(func=cmd_query)
+
+    catalog = commands.add_parser('catalog', help='каталог запросов queries.sql: list, explain, bench, run')
+    catalog.add_argument('args', nargs=argparse.REMAINDER, help='аргументы catalog.py')
+    catalog.set_defaults(func=cmd_catalog)
+
+    reparse = commands.add_parser('reparse', help='повторный разбор сохраненных страниц')
+    reparse.add_argument('sources', nargs='+', help='каталоги или .zip архивы со страницами')
+    reparse.add_argument('--workers', type=int, help='количество процессов')
+    reparse.add_argument('--db', help='URL базы данных')
+    reparse.set_defaults(func=cmd_reparse)
+
+    commands.add_parser('ratings', help='полный пересчет рейтингов Эло').set_defaults(func=cmd_ratings)
+    commands.add_parser('metrics', help='полный пересчет формы и per-90').set_defaults(func=cmd_metrics)
+    commands.add_parser('features', help='выгрузить хранилище признаков для моделей').set_defaults(func=cmd_features)
+    changes = commands.add_parser('changes', help='журнал изменений (NDJSON) после запуска N')
+    changes.add_argument('--since', type=int, default=0, help='номер последнего обработанного запуска')
+    changes.add_argument('--table', action='append', help='только эти таблицы')
+    changes.add_argument('--output', help='файл (по умолчанию stdout)')
+    changes.add_argument('--runs', action='store_true', help='показать последние запуски')
+    changes.set_defaults(func=cmd_changes)
+    validate = commands.add_parser('validate', help='проверки качества данных')
+    validate.add_argument('--run', type=int, help='сводка запуска N (по умолчанию - последнего)')
+    validate.add_argument('--season', help='проверить сезон по текущей базе')
+    validate.set_defaults(func=cmd_validate)
+    commands.add_parser('clean', help='удалить базу данных и лог').set_defaults(func=cmd_clean)
+    commands.add_parser('stats', help='количество строк в таблицах').set_defaults(func=cmd_stats)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == 'query':
+        # Позиционный аргумент запроса: название команды или имя игрока
+        args.team_name = args.player_name = args.text
+        if args.name in ('matches', 'player', 'similar') and not args.text:
+            build_parser().error(f"query {args.name}: не указано имя")
+    args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
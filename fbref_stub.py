@@ -0,0 +1,476 @@
+"""
+Локальная заглушка FBref для нагрузочных тестов и проверки повторных попыток.
+
+Отдает сгенерированные страницы лиги, команд и отчетов о матчах по тем же путям, что и
+fbref.com (PREMIER_LEAGUE_URL, /en/squads/<id>/<season>/<Name>-Stats, /en/matches/<id>/...),
+поэтому FBRefScraper работает с ней без изменений: FBRefScraper(base_url=server.url).
+
+Сбои включаются параметрами StubServer:
+    latency=(0.05, 0.2)     задержка ответа (секунды, равномерно)
+    error_rate=0.05         вероятность начала серии ошибок 403/429 (error_burst ответов подряд)
+    timeout_rate=0.02       ответ задерживается на hang секунд (дольше таймаута клиента)
+    truncate_rate=0.02      соединение обрывается посреди тела ответа
+    comment_tables=True     таблицы игроков и ударов внутри <!-- --> (как на FBref)
+
+Как и FBref, заглушка сжимает ответы (gzip, если клиент его принимает; compress=False - без сжатия),
+отдает ETag / Last-Modified и отвечает 304 на условный запрос неизменившейся страницы.
+В stats кроме статусов - 'bytes', отправлено байт тел ответов.
+
+    python fbref_stub.py --port 8765 --error-rate 0.1
+"""
+
+import re
+import gzip
+import time
+import zlib
+import hashlib
+import random
+import logging
+import argparse
+import threading
+from datetime import date, timedelta
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import SEASON, COMPETITION, PREMIER_LEAGUE_URL
+
+logger = logging.getLogger(__name__)
+
+TEAM_NAMES = [
+    'Arsenal', 'Aston Villa', 'Bournemouth', 'Brentford', 'Brighton', 'Burnley', 'Chelsea',
+    'Crystal Palace', 'Everton', 'Fulham', 'Liverpool', 'Luton Town', 'Manchester City',
+    'Manchester Utd', 'Newcastle Utd', "Nott'ham Forest", 'Sheffield Utd', 'Tottenham',
+    'West Ham', 'Wolves',
+]
+POSITIONS = ['GK'] + ['DF'] * 5 + ['MF'] * 5 + ['FW'] * 4
+
+def _fbref_id(*parts):
+    """Детерминированный 8-символьный id в стиле FBref"""
+    return f"{zlib.crc32('/'.join(map(str, parts)).encode()):08x}"
+
+def _slug(name):
+    return re.sub(r'[^A-Za-z0-9]+', '-', name).strip('-')
+
+class League:
+    """
+    Сгенерированная лига: команды, составы и двухкруговое расписание.
+    Сыграны первые played_rounds туров, остальные матчи - без счета (как будущие матчи на FBref).
+    """
+
+    def __init__(self, teams=20, players=15, played_rounds=30, seed=0, season=SEASON):
+        rnd = random.Random(seed)
+        self.season = season
+        self.teams = []
+        for name in TEAM_NAMES[:teams]:
+            team_id = _fbref_id('team', name)
+            squad = []
+            for i in range(players):
+                player_name = f"{name} Player {i + 1}"
+                squad.append({
+                    'id': _fbref_id('player', name, i),
+                    'name': player_name,
+                    'position': POSITIONS[i % len(POSITIONS)],
+                    'number': i + 1,
+                })
+            self.teams.append({
+                'id': team_id, 'name': name, 'players': squad,
+                'url': f"/en/squads/{team_id}/{season}/{_slug(name)}-Stats",
+            })
+        self.by_id = {team['id']: team for team in self.teams}
+
+        # Круговая система (метод вращения), второй круг - с обратным полем
+        ids = [team['id'] for team in self.teams]
+        rounds = []
+        for _ in range(len(ids) - 1):
+            rounds.append([(ids[i], ids[-1 - i]) for i in range(len(ids) // 2)])
+            ids = [ids[0], ids[-1]] + ids[1:-1]
+        rounds += [[(away, home) for home, away in pairs] for pairs in rounds]
+
+        start = date(int(season[:4]), 8, 12)
+        self.matches = []
+        for number, pairs in enumerate(rounds, start=1):
+            for home, away in pairs:
+                played = number <= played_rounds
+                self.matches.append({
+                    'id': _fbref_id('match', home, away, season),
+                    'round': number,
+                    'date': (start + timedelta(weeks=number - 1)).isoformat(),
+                    'home': home,
+                    'away': away,
+                    'home_goals': rnd.randint(0, 4) if played else None,
+                    'away_goals': rnd.randint(0, 3) if played else None,
+                    'home_xg': round(rnd.uniform(0.3, 3.0), 1) if played else None,
+                    'away_xg': round(rnd.uniform(0.2, 2.5), 1) if played else None,
+                })
+        self.match_by_id = {match['id']: match for match in self.matches}
+
+        # Сезонная статистика игроков: минут не больше, чем сыграно туров (проверки validate.py)
+        max_minutes = 90 * min(played_rounds, len(rounds))
+        self.player_stats = {}
+        for team in self.teams:
+            for player in team['players']:
+                minutes = rnd.randint(0, max_minutes)
+                scorer = minutes > 0 and player['position'] != 'GK'
+                goals = rnd.randint(0, 20) if scorer else 0
+                assists = rnd.randint(0, 12) if scorer else 0
+                self.player_stats[player['id']] = {
+                    'minutes': minutes,
+                    'goals': goals,
+                    'assists': assists,
+                    # Ожидаемые показатели - от голов и передач, без лишних вызовов rnd (сид дает те же данные)
+                    'xg': round(goals * 0.9 + (0.4 if scorer else 0), 1),
+                    'npxg': round(goals * 0.8 + (0.4 if scorer else 0), 1),
+                    'xag': round(assists * 0.9 + (0.2 if scorer else 0), 1),
+                }
+
+    def match_url(self, match):
+        home, away = self.by_id[match['home']], self.by_id[match['away']]
+        return f"/en/matches/{match['id']}/{_slug(home['name'])}-{_slug(away['name'])}"
+
+    def league_page(self):
+        rows = ''.join(
+            f'<tr><th data-stat="rank">{rank}</th><td data-stat="team">'
+            f'<a href="{team["url"]}">{team["name"]}</a></td></tr>'
+            for rank, team in enumerate(self.teams, start=1)
+        )
+        return (
+            f'<html><body><h1>{self.season} {COMPETITION} Stats</h1>'
+            f'<table id="results{self.season}91_overall" class="stats_table"><tbody>{rows}</tbody></table>'
+            '</body></html>'
+        )
+
+    def squad_page(self, team_id, comment_tables=True):
+        team = self.by_id[team_id]
+        logs = []
+        for match in self.matches:
+            if team_id not in (match['home'], match['away']):
+                continue
+            home = match['home'] == team_id
+            opponent = self.by_id[match['away'] if home else match['home']]
+            played = match['home_goals'] is not None
+            gf, ga = (match['home_goals'], match['away_goals']) if home else (match['away_goals'], match['home_goals'])
+            xg, xga = (match['home_xg'], match['away_xg']) if home else (match['away_xg'], match['home_xg'])
+            result = ('W' if gf > ga else 'D' if gf == ga else 'L') if played else ''
+            report = (
+                f'<a href="{self.match_url(match)}">Match Report</a>' if played
+                else '<a href="/en/stathead/matchup/teams/x">Head-to-Head</a>'
+            )
+            logs.append(
+                f'<tr><th data-stat="date"><a href="/en/matches/{match["date"]}">{match["date"]}</a></th>'
+                f'<td>15:00</td><td><a href="/en/comps/9/">{COMPETITION}</a></td><td>Matchweek {match["round"]}</td>'
+                f'<td>Sat</td><td>{"Home" if home else "Away"}</td><td>{result}</td>'
+                f'<td>{gf if played else ""}</td><td>{ga if played else ""}</td>'
+                f'<td><a href="{opponent["url"]}">{opponent["name"]}</a></td>'
+                f'<td>{xg if played else ""}</td><td>{xga if played else ""}</td><td>{50 if played else ""}</td>'
+                f'<td>{"40,000" if played and home else ""}</td><td></td><td>4-3-3</td><td>4-4-2</td>'
+                f'<td>{"Michael Oliver" if played else ""}</td><td>{report}</td><td></td></tr>'
+            )
+
+        players = ''.join(
+            f'<tr><th data-stat="player"><a href="/en/players/{p["id"]}/{_slug(p["name"])}">{p["name"]}</a></th>'
+            f'<td data-stat="nationality">eng ENG</td><td data-stat="position">{p["position"]}</td>'
+            f'<td data-stat="minutes">{self.player_stats[p["id"]]["minutes"]:,}</td>'
+            f'<td data-stat="goals">{self.player_stats[p["id"]]["goals"]}</td>'
+            f'<td data-stat="assists">{self.player_stats[p["id"]]["assists"]}</td>'
+            f'<td data-stat="xg">{self.player_stats[p["id"]]["xg"]}</td>'
+            f'<td data-stat="npxg">{self.player_stats[p["id"]]["npxg"]}</td>'
+            f'<td data-stat="xg_assist">{self.player_stats[p["id"]]["xag"]}</td></tr>'
+            for p in team['players']
+        )
+        players_table = (
+            '<table id="stats_standard_9" class="stats_table"><thead>'
+            '<tr><th></th><th></th><th></th><th colspan="1">Playing Time</th><th colspan="2">Performance</th>'
+            '<th colspan="3">Expected</th></tr>'
+            '<tr><th>Player</th><th>Nation</th><th>Pos</th><th>Min</th><th>Gls</th><th>Ast</th>'
+            '<th>xG</th><th>npxG</th><th>xAG</th></tr></thead>'
+            f'<tbody>{players}</tbody></table>'
+        )
+        if comment_tables:
+            players_table = f'<div><!--\n{players_table}\n--></div>'
+        goals = sum(self.player_stats[p['id']]['goals'] for p in team['players'])
+        assists = sum(self.player_stats[p['id']]['assists'] for p in team['players'])
+
+        return (
+            f'<html><head><link rel="canonical" href="https://fbref.com{team["url"]}"></head><body>'
+            f'<h1>{self.season} {team["name"]} Stats</h1>'
+            '<table id="matchlogs_for" class="stats_table"><thead><tr><th>Date</th><th>Time</th><th>Comp</th>'
+            '<th>Round</th><th>Day</th><th>Venue</th><th>Result</th><th>GF</th><th>GA</th><th>Opponent</th>'
+            '<th>xG</th><th>xGA</th><th>Poss</th><th>Attendance</th><th>Captain</th><th>Formation</th>'
+            '<th>Opp Formation</th><th>Referee</th><th>Match Report</th><th>Notes</th></tr></thead>'
+            f'<tbody>{"".join(logs)}</tbody></table>'
+            f'{players_table}'
+            '<table id="stats_squads_standard_for" class="stats_table"><thead>'
+            '<tr><th></th><th></th><th colspan="2">Performance</th></tr>'
+            '<tr><th>Squad</th><th>Poss</th><th>Gls</th><th>Ast</th></tr></thead>'
+            f'<tbody><tr><th>{team["name"]}</th><td>50.0</td><td>{goals}</td><td>{assists}</td></tr></tbody></table>'
+            '</body></html>'
+        )
+
+    def match_report_page(self, match_id, comment_tables=True):
+        match = self.match_by_id[match_id]
+        sides = (('a', self.by_id[match['home']]), ('b', self.by_id[match['away']]))
+
+        scorebox = ''.join(
+            f'<div><div><strong><a href="{team["url"]}">{team["name"]}</a></strong></div>'
+            f'<div class="scores"><div class="score">{goals}</div></div></div>'
+            for (_, team), goals in zip(sides, (match['home_goals'], match['away_goals']))
+        )
+        lineups, events, shots, summaries = [], [], [], []
+        for (side, team), goals in zip(sides, (match['home_goals'], match['away_goals'])):
+            rows = [f'<tr><th colspan="2">{team["name"]} (4-3-3)</th></tr>']
+            for i, player in enumerate(team['players']):
+                if i == 11:
+                    rows.append('<tr><th colspan="2">Bench</th></tr>')
+                rows.append(
+                    f'<tr><td>{player["number"]}</td>'
+                    f'<td><a href="/en/players/{player["id"]}/{_slug(player["name"])}">{player["name"]}</a></td></tr>'
+                )
+            lineups.append(f'<div class="lineup" id="{side}"><table>{"".join(rows)}</table></div>')
+
+            scorers = [p for p in team['players'][:11] if p['position'] == 'FW'] or team['players'][:1]
+            for goal in range(goals):
+                scorer = scorers[goal % len(scorers)]
+                minute = 10 + goal * 17
+                link = f'<a href="/en/players/{scorer["id"]}/{_slug(scorer["name"])}">{scorer["name"]}</a>'
+                events.append(
+                    f'<div class="event {side}"><div>&nbsp;{minute}&rsquo;</div>'
+                    f'<div class="event_icon goal"></div><div><div>{link}</div></div></div>'
+                )
+                shots.append(
+                    f'<tr><th data-stat="minute">{minute}</th><td data-stat="player">{link}</td>'
+                    f'<td data-stat="squad"><a href="{team["url"]}">{team["name"]}</a></td>'
+                    '<td data-stat="xg_shot">0.35</td><td data-stat="outcome">Goal</td>'
+                    '<td data-stat="distance">12</td><td data-stat="body_part">Right Foot</td></tr>'
+                )
+
+            summary = ''.join(
+                f'<tr><th data-stat="player"><a href="/en/players/{p["id"]}/{_slug(p["name"])}">{p["name"]}</a></th>'
+                f'<td data-stat="position">{p["position"]}</td><td data-stat="minutes">90</td></tr>'
+                for p in team['players'][:11]
+            )
+            summaries.append(f'<table id="stats_{team["id"]}_summary"><tbody>{summary}</tbody></table>')
+
+        shots_table = (
+            '<table id="shots_all"><thead><tr><th>Minute</th></tr></thead>'
+            f'<tbody>{"".join(shots)}</tbody></table>'
+        )
+        if comment_tables:
+            shots_table = f'<!--\n{shots_table}\n-->'
+        return (
+            f'<html><body><div class="scorebox">{scorebox}<div class="scorebox_meta"></div></div>'
+            f'<div id="field_wrap">{"".join(lineups)}</div>'
+            f'<div id="events_wrap">{"".join(events)}</div>'
+            f'{shots_table}{"".join(summaries)}</body></html>'
+        )
+
+    def page(self, path, comment_tables=True):
+        """HTML страницы по пути запроса или None (404)"""
+        if path == PREMIER_LEAGUE_URL:
+            return self.league_page()
+        found = re.match(r'^/en/squads/([0-9a-f]{8})/', path)
+        if found and found.group(1) in self.by_id:
+            return self.squad_page(found.group(1), comment_tables)
+        found = re.match(r'^/en/matches/([0-9a-f]{8})/', path)
+        if found and found.group(1) in self.match_by_id and self.match_by_id[found.group(1)]['home_goals'] is not None:
+            return self.match_report_page(found.group(1), comment_tables)
+        return None
+
+class StubServer:
+    """HTTP сервер-заглушка в фоновом потоке; stats - количество ответов по статусам"""
+
+    def __init__(self, league=None, host='127.0.0.1', port=0, latency=(0.0, 0.0), error_rate=0.0,
+                 error_burst=3, timeout_rate=0.0, hang=5.0, truncate_rate=0.0, comment_tables=True, seed=0,
+                 compress=True):
+        self.league = league or League(seed=seed)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_burst = error_burst
+        self.timeout_rate = timeout_rate
+        self.hang = hang
+        self.truncate_rate = truncate_rate
+        self.comment_tables = comment_tables
+        self.compress = compress
+        # Все страницы "изменены" при запуске заглушки
+        self.started = time.time()
+        self.last_modified = formatdate(self.started, usegmt=True)
+        self.stats = {}
+        self._random = random.Random(seed)
+        self._burst_left = 0
+        self._burst_status = 403
+        self._lock = threading.Lock()
+        self._pages = {}
+        self._etags = {}
+        self._gzipped = {}
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                stub._handle(self)
+
+            def log_message(self, format, *args):
+                logger.debug(f"stub: {format % args}")
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='fbref-stub', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        logger.info(f"🧪 Заглушка FBref: {self.url}")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + value
+
+    def _fault(self):
+        """Выбирает сбой для очередного ответа: 403/429, 'timeout', 'truncate' или None"""
+        with self._lock:
+            if self._burst_left:
+                self._burst_left -= 1
+                return self._burst_status
+            roll = self._random.random()
+            if roll < self.error_rate:
+                self._burst_status = self._random.choice((403, 429))
+                self._burst_left = self.error_burst - 1
+                return self._burst_status
+            roll -= self.error_rate
+            if roll < self.timeout_rate:
+                return 'timeout'
+            if roll - self.timeout_rate < self.truncate_rate:
+                return 'truncate'
+            return None
+
+    def _body(self, path):
+        """Страницы генерируются один раз: нагрузку создает сеть, а не генератор"""
+        if path not in self._pages:
+            page = self.league.page(path, self.comment_tables)
+            self._pages[path] = page.encode('utf-8') if page is not None else None
+        return self._pages[path]
+
+    def _etag(self, path, body):
+        if path not in self._etags:
+            self._etags[path] = '"%s"' % hashlib.blake2b(body, digest_size=8).hexdigest()
+        return self._etags[path]
+
+    def _gzip(self, path, body):
+        if path not in self._gzipped:
+            self._gzipped[path] = gzip.compress(body, compresslevel=6, mtime=0)
+        return self._gzipped[path]
+
+    def _not_modified(self, handler, etag):
+        """Условный запрос к неизменившейся странице: If-None-Match важнее If-Modified-Since"""
+        if_none_match = handler.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return etag in [tag.strip() for tag in if_none_match.split(',')]
+        if_modified_since = handler.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                return parsedate_to_datetime(if_modified_since).timestamp() >= int(self.started)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _handle(self, handler):
+        if self.latency[1] > 0:
+            time.sleep(self._random.uniform(*self.latency))
+        path = handler.path.split('?')[0]
+        fault = self._fault()
+
+        if fault in (403, 429):
+            self._count(fault)
+            handler.send_response(fault)
+            if fault == 429:
+                handler.send_header('Retry-After', '1')
+            handler.send_header('Content-Length', '0')
+            handler.end_headers()
+            return
+        if fault == 'timeout':
+            self._count('timeout')
+            time.sleep(self.hang)
+            handler.close_connection = True
+            return
+
+        body = self._body(path)
+        if body is None:
+            self._count(404)
+            handler.send_response(404)
+            handler.send_header('Content-Length', '0')
+            handler.end_headers()
+            return
+
+        etag = self._etag(path, body)
+        if self._not_modified(handler, etag):
+            self._count(304)
+            handler.send_response(304)
+            handler.send_header('ETag', etag)
+            handler.send_header('Last-Modified', self.last_modified)
+            handler.end_headers()
+            return
+
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/html; charset=utf-8')
+        handler.send_header('ETag', etag)
+        handler.send_header('Last-Modified', self.last_modified)
+        if self.compress and 'gzip' in handler.headers.get('Accept-Encoding', ''):
+            body = self._gzip(path, body)
+            handler.send_header('Content-Encoding', 'gzip')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        if fault == 'truncate':
+            self._count('truncate')
+            handler.wfile.write(body[:len(body) // 2])
+            handler.wfile.flush()
+            handler.close_connection = True
+            return
+        handler.wfile.write(body)
+        self._count(200)
+        self._count('bytes', len(body))
+
+def main(argv=None):
+    """Запуск заглушки в foreground"""
+    parser = argparse.ArgumentParser(description='Локальная заглушка FBref со сбоями')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--teams', type=int, default=20)
+    parser.add_argument('--played-rounds', type=int, default=30)
+    parser.add_argument('--latency', type=float, nargs=2, default=(0.0, 0.0), metavar=('MIN', 'MAX'))
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-burst', type=int, default=3)
+    parser.add_argument('--timeout-rate', type=float, default=0.0)
+    parser.add_argument('--hang', type=float, default=5.0)
+    parser.add_argument('--truncate-rate', type=float, default=0.0)
+    parser.add_argument('--plain-tables', action='store_true', help='не оборачивать таблицы в комментарии')
+    parser.add_argument('--no-compress', action='store_true', help='отдавать страницы без gzip')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    from log_setup import setup_logging
+    setup_logging(log_file=None)
+    server = StubServer(
+        League(teams=args.teams, played_rounds=args.played_rounds, seed=args.seed), port=args.port,
+        latency=tuple(args.latency), error_rate=args.error_rate, error_burst=args.error_burst,
+        timeout_rate=args.timeout_rate, hang=args.hang, truncate_rate=args.truncate_rate,
+        comment_tables=not args.plain_tables, seed=args.seed, compress=not args.no_compress,
+    ).start()
+    logger.info(f"   Лига: {PREMIER_LEAGUE_URL}, команд {len(server.league.teams)}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""
+Колоночное хранилище признаков для обучения моделей (FEATURE_STORE_DIR).
+
+Наборы player_season и team_season выгружаются из базы один раз и раскладываются по колонкам
+фиксированного типа (.npy): числа - float32 (NULL -> NaN), строки - int32 коды словаря
+(NULL -> -1). Словари сущностей (player, team, season, competition) общие для всех наборов,
+поэтому коды можно соединять между наборами без строк.
+
+Читатели открывают колонки через mmap без копирования: несколько процессов обучения
+на одной машине используют общий page cache вместо собственной копии из SQLite.
+Каждая выгрузка - версия каталога (versions.py): читатель открывает текущую версию целиком,
+выгрузка подменяет ее атомарно.
+
+    store = FeatureStore()
+    goals = store.columns('player_season')['goals']        # np.memmap
+    df = store.frame('team_season', ['team', 'season', 'elo'])
+"""
+
+import os
+import json
+import logging
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from config import FEATURE_STORE_DIR
+from versions import current_version, new_version, publish_version, discard_version
+
+logger = logging.getLogger(__name__)
+
+# Строковые колонки наборов (кодируются словарем); остальные - числовые
+STRING_COLUMNS = {'player', 'player_name', 'position', 'nationality', 'team', 'team_name', 'season', 'competition'}
+# Колонки-сущности с общими словарями: колонка -> словарь
+ENTITY_DICTIONARIES = {'player': 'player', 'team': 'team', 'season': 'season', 'competition': 'competition'}
+
+PLAYER_SEASON_SQL = """
+SELECT
+    p.fbref_id AS player, p.name AS player_name, p.position, p.nationality,
+    t.fbref_id AS team, ps.season, ps.competition,
+    ps.minutes, ps.goals, ps.assists, ps.yellow_cards, ps.red_cards, ps.xg, ps.npxg, ps.xag,
+    pp.goals AS goals_per90, pp.assists AS assists_per90, pp.xg AS xg_per90,
+    pp.npxg AS npxg_per90, pp.xag AS xag_per90
+FROM player_stats ps
+JOIN players p ON ps.player_id = p.id
+LEFT JOIN teams t ON ps.team_id = t.id
+LEFT JOIN player_per90 pp ON pp.player_id = ps.player_id AND pp.team_id = ps.team_id
+    AND pp.season = ps.season AND pp.competition = ps.competition
+ORDER BY ps.season, ps.competition, t.fbref_id, p.fbref_id
+"""
+
+TEAM_SEASON_SQL = """
+SELECT
+    t.fbref_id AS team, t.name AS team_name, m.season, m.competition,
+    COUNT(*) AS matches,
+    SUM(CASE WHEN tms.goals_for > tms.goals_against THEN 3
+             WHEN tms.goals_for = tms.goals_against THEN 1 ELSE 0 END) AS points,
+    SUM(tms.goals_for) AS goals_for, SUM(tms.goals_against) AS goals_against,
+    AVG(tms.xg) AS xg, AVG(tms.xga) AS xga, AVG(tms.possession) AS possession,
+    (SELECT r.elo FROM team_ratings r JOIN matches rm ON r.match_id = rm.id
+     WHERE r.team_id = t.id AND rm.season = m.season AND rm.competition = m.competition
+     ORDER BY r.date DESC, r.id DESC LIMIT 1) AS elo
+FROM team_match_stats tms
+JOIN matches m ON tms.match_id = m.id
+JOIN teams t ON tms.team_id = t.id
+WHERE tms.goals_for IS NOT NULL
+GROUP BY t.id, t.fbref_id, t.name, m.season, m.competition
+ORDER BY m.season, m.competition, t.fbref_id
+"""
+
+DATASETS = {'player_season': PLAYER_SEASON_SQL, 'team_season': TEAM_SEASON_SQL}
+
+def _encode(values, dictionary):
+    """Строки -> int32 коды словаря (словарь дополняется новыми значениями), None -> -1"""
+    index = {value: code for code, value in enumerate(dictionary)}
+    codes = np.empty(len(values), dtype=np.int32)
+    for i, value in enumerate(values):
+        if value is None or value != value:
+            codes[i] = -1
+            continue
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(dictionary)
+            dictionary.append(value)
+        codes[i] = code
+    return codes
+
+def _save_array(path, array):
+    with open(path, 'wb') as f:
+        np.save(f, np.ascontiguousarray(array))
+
+def export_features(engine, directory=FEATURE_STORE_DIR):
+    """
+    Выгружает наборы DATASETS в колоночное хранилище. Новая версия пишется в свой подкаталог
+    и становится текущей атомарной заменой указателя (versions.py); уже открытые mmap читателей
+    остаются валидными.
+    """
+    path = new_version(directory)
+    try:
+        manifest = _export(engine, path)
+    except Exception:
+        discard_version(path)
+        raise
+    publish_version(directory, path)
+
+    logger.info("🗃️  Хранилище признаков: " + ", ".join(
+        f"{dataset} {info['rows']} строк" for dataset, info in manifest['datasets'].items()
+    ))
+    return manifest
+
+def _export(engine, path):
+    """Наборы и словари в каталог версии path; возвращает манифест"""
+    os.makedirs(os.path.join(path, 'dictionaries'))
+
+    dictionaries = {}
+    manifest = {'built_at': datetime.now().isoformat(timespec='seconds'), 'datasets': {}}
+
+    with engine.connect() as conn:
+        for dataset, query in DATASETS.items():
+            df = pd.read_sql_query(query, conn)
+            os.makedirs(os.path.join(path, dataset))
+            columns = {}
+            for column in df.columns:
+                values = df[column]
+                if column in STRING_COLUMNS:
+                    # Колонки-сущности - в общих словарях, остальные строки - в словаре набора
+                    name = ENTITY_DICTIONARIES.get(column, f'{dataset}.{column}')
+                    array = _encode(values.tolist(), dictionaries.setdefault(name, []))
+                    columns[column] = {'dtype': 'int32', 'dictionary': name}
+                else:
+                    array = pd.to_numeric(values).to_numpy(dtype=np.float32, na_value=np.nan)
+                    columns[column] = {'dtype': 'float32'}
+                _save_array(os.path.join(path, dataset, f'{column}.npy'), array)
+            manifest['datasets'][dataset] = {'rows': len(df), 'columns': columns}
+
+    for name, values in dictionaries.items():
+        _save_array(os.path.join(path, 'dictionaries', f'{name}.npy'), np.array(values, dtype=str))
+    manifest['dictionaries'] = sorted(dictionaries)
+    with open(os.path.join(path, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+class FeatureStore:
+    """Чтение хранилища признаков через mmap"""
+
+    def __init__(self, directory=FEATURE_STORE_DIR):
+        # Версия фиксируется при открытии: следующая выгрузка не меняет файлы открытого хранилища
+        self.directory = current_version(directory)
+        if self.directory is None:
+            raise FileNotFoundError(f"Хранилище признаков не выгружено: {directory}")
+        with open(os.path.join(self.directory, 'manifest.json'), encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self._dictionaries = {}
+
+    def datasets(self):
+        return list(self.manifest['datasets'])
+
+    def columns(self, dataset, names=None):
+        """Колонки набора как np.memmap (строковые - коды словаря): {имя: массив}"""
+        info = self.manifest['datasets'][dataset]
+        names = names or list(info['columns'])
+        return {
+            name: np.load(os.path.join(self.directory, dataset, f'{name}.npy'), mmap_mode='r')
+            for name in names
+        }
+
+    def dictionary(self, name):
+        """Словарь (массив строк) по имени; код -> dictionary[code]"""
+        if name not in self._dictionaries:
+            self._dictionaries[name] = np.load(os.path.join(self.directory, 'dictionaries', f'{name}.npy'))
+        return self._dictionaries[name]
+
+    def code(self, dictionary, value):
+        """Код значения в словаре (или -1), например store.code('team', '18bb7c10')"""
+        found = np.flatnonzero(self.dictionary(dictionary) == value)
+        return int(found[0]) if len(found) else -1
+
+    def frame(self, dataset, names=None):
+        """DataFrame набора: числа - поверх mmap, строковые колонки - pd.Categorical по кодам"""
+        info = self.manifest['datasets'][dataset]['columns']
+        data = {}
+        for name, array in self.columns(dataset, names).items():
+            dictionary = info[name].get('dictionary')
+            if dictionary:
+                data[name] = pd.Categorical.from_codes(array, categories=self.dictionary(dictionary))
+            else:
+                data[name] = array
+        return pd.DataFrame(data, copy=False)
+
+def main():
+    """Выгрузка хранилища признаков из DB_PATH"""
+    from db import get_engine
+    from config import DB_PATH
+    from log_setup import setup_logging
+    setup_logging(log_file=None)
+    export_features(get_engine(DB_PATH))
+
+if __name__ == '__main__':
+    main()
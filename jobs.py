@@ -0,0 +1,451 @@
+"""
+Распределенное скачивание: воркеры на нескольких машинах берут задания из общей очереди.
+
+Очередь - SQLite база JOB_STORE_PATH (на общем диске или локально для нескольких процессов).
+Журнал очереди - обычный rollback (journal_mode=DELETE): WAL держит индекс в общей памяти
+одной машины и на сетевом диске не работает.
+Воркер арендует задание (lease) на JOB_LEASE_SECONDS и продлевает аренду heartbeat'ом,
+пока скачивает и загружает страницу; если воркер упал, аренда истекает и задание забирает
+другой. У каждого воркера свой FBRefScraper - своя сессия, свои паузы и (--proxy) свой выход
+в сеть, поэтому общий темп запросов растет с числом воркеров.
+
+Повторное выполнение задания (после истечения аренды) не дублирует строк: команды, матчи
+и статистика пишутся upsert'ом по естественным ключам, отчет о матче не загружается повторно
+(report_loaded проверяется в той же транзакции), а задание закрывает только текущий арендатор.
+Перед коммитом воркер проверяет аренду: если задание уже забрал другой, транзакция
+откатывается и задание бросается.
+
+Воркеры пишут прямо в рабочую базу, без staging, и предполагают, что других писателей
+со своим запуском журнала изменений у нее нет. Задание выполняется под разделяемой
+блокировкой писателей (staging.writer_lock): воркеры работают параллельно, а main.py, проход
+планировщика и reparse.py ждут, пока не закончатся выполняемые задания (и наоборот) - иначе
+публикация staging затерла бы строки воркеров. Между заданиями такой писатель может начаться
+и закроет открытый запуск 'jobs' (cdc.start_run), поэтому их запускают после окончания очереди.
+
+    python jobs.py seed                        # задания на все команды лиги PREMIER_LEAGUE_URL
+    python jobs.py work --id node1-a           # воркер (запускается на каждой машине)
+    python jobs.py status
+"""
+
+import os
+import json
+import time
+import random
+import socket
+import sqlite3
+import logging
+import argparse
+import threading
+from config import (
+    DB_PATH, JOB_STORE_PATH, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, PREMIER_LEAGUE_URL, SEASON, COMPETITION
+)
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,              -- 'team', 'report'
+    key TEXT NOT NULL UNIQUE,        -- 'team:<fbref_id>:<season>', 'report:<match_id>'
+    url TEXT NOT NULL,
+    payload TEXT,                    -- JSON
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'pending',  -- pending, leased, done, failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    error TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_state ON jobs (state, priority, id);
+CREATE TABLE IF NOT EXISTS seeds (
+    season TEXT NOT NULL,
+    competition TEXT NOT NULL,
+    seeded_at REAL NOT NULL,
+    PRIMARY KEY (season, competition)
+);
+"""
+
+class JobStore:
+    """Очередь заданий с арендой. Каждый вызов - свое соединение, поэтому объект можно делить между потоками."""
+
+    def __init__(self, path=JOB_STORE_PATH, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        with self._connect() as conn:
+            # Не WAL: очередь может лежать на общем сетевом диске
+            conn.execute('PRAGMA journal_mode=DELETE')
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return _Closing(conn)
+
+    def enqueue(self, kind, key, url, payload=None, priority=0):
+        """Добавляет задание; уже существующее (по key) не меняется. Возвращает True, если добавлено"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO jobs (kind, key, url, payload, priority, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (kind, key, url, json.dumps(payload or {}, ensure_ascii=False), priority, time.time()),
+            )
+            return cursor.rowcount > 0
+
+    def lease(self, owner, kinds=None):
+        """
+        Арендует следующее задание (свободное или с истекшей арендой) и возвращает dict или None.
+        Задания, исчерпавшие JOB_MAX_ATTEMPTS, помечаются failed.
+        """
+        now = time.time()
+        kind_filter = f"AND kind IN ({', '.join('?' * len(kinds))})" if kinds else ''
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute(
+                    "UPDATE jobs SET state = 'failed', updated_at = ? "
+                    "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+                    (now, now, self.max_attempts),
+                )
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE (state = 'pending' OR (state = 'leased' AND lease_expires < ?)) "
+                    f"{kind_filter} ORDER BY priority, id LIMIT 1",
+                    (now, *(kinds or ())),
+                ).fetchone()
+                if row is None:
+                    conn.execute('COMMIT')
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET state = 'leased', lease_owner = ?, lease_expires = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (owner, now + self.lease_seconds, now, row['id']),
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'] or '{}')
+        job['attempts'] += 1
+        return job
+
+    def heartbeat(self, job_id, owner):
+        """Продлевает аренду; False - аренда потеряна (задание забрал другой воркер)"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ? AND state = 'leased'",
+                (time.time() + self.lease_seconds, time.time(), job_id, owner),
+            )
+            return cursor.rowcount > 0
+
+    def complete(self, job_id, owner):
+        """Закрывает задание, если аренда еще у owner"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = 'done', lease_expires = NULL, error = NULL, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ? AND state = 'leased'",
+                (time.time(), job_id, owner),
+            )
+            return cursor.rowcount > 0
+
+    def fail(self, job_id, owner, error):
+        """Возвращает задание в очередь (или failed после JOB_MAX_ATTEMPTS попыток)"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "lease_owner = NULL, lease_expires = NULL, error = ?, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ? AND state = 'leased'",
+                (self.max_attempts, str(error)[:500], time.time(), job_id, owner),
+            )
+
+    def record_seed(self, season, competition):
+        """Запоминает сезон, на который поставлены задания (для проверок в finish_jobs_run)"""
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO seeds (season, competition, seeded_at) VALUES (?, ?, ?)',
+                (season, competition, time.time()),
+            )
+
+    def seeds_since(self, timestamp):
+        """[(season, competition)] - сезоны, задания на которые ставились начиная с timestamp"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT season, competition FROM seeds WHERE seeded_at >= ? ORDER BY season, competition',
+                (timestamp,),
+            ).fetchall()
+        return [(season, competition) for season, competition in rows]
+
+    def counts(self):
+        """{(kind, state): количество}"""
+        with self._connect() as conn:
+            rows = conn.execute('SELECT kind, state, COUNT(*) FROM jobs GROUP BY kind, state').fetchall()
+        return {(kind, state): count for kind, state, count in rows}
+
+    def active(self):
+        """Количество заданий, которые еще могут быть выполнены (pending и leased)"""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE state IN ('pending', 'leased')").fetchone()[0]
+
+class _Closing:
+    """sqlite3.Connection как контекстный менеджер, который закрывает соединение"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.close()
+
+class LeaseLost(Exception):
+    """Аренду задания забрал другой воркер - результат этого воркера не записывается"""
+
+class _Heartbeat(threading.Thread):
+    """Продлевает аренду задания, пока воркер его выполняет"""
+
+    def __init__(self, store, job_id, owner):
+        super().__init__(name=f'heartbeat-{job_id}', daemon=True)
+        self.store, self.job_id, self.owner = store, job_id, owner
+        self.lost = False
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.store.lease_seconds / 3):
+            if not self.store.heartbeat(self.job_id, self.owner):
+                self.lost = True
+                return
+
+    def check(self):
+        """Перед коммитом: продлевает аренду или поднимает LeaseLost, если ее забрал другой воркер"""
+        if self.lost or not self.store.heartbeat(self.job_id, self.owner):
+            self.lost = True
+            raise LeaseLost(f"аренда задания {self.job_id} потеряна")
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+def seed(store, scraper, league_url=PREMIER_LEAGUE_URL, season=SEASON, competition=COMPETITION, db_path=DB_PATH):
+    """
+    Ставит в очередь задания на страницы всех команд лиги и открывает запуск журнала
+    изменений (cdc.py), который закроет воркер, выполнивший последнее задание.
+    Возвращает количество новых заданий.
+    """
+    from db import init_db, EtlRun
+    from cdc import start_run
+    from staging import writer_lock
+    teams = scraper.get_league_teams(league_url)
+    if not teams:
+        logger.error("❌ Не удалось получить список команд")
+        return 0
+    # Открытие запуска закрывает чужие открытые запуски - исключительная блокировка, как у main.py
+    with writer_lock(db_path):
+        session = init_db(db_path)()
+        if not session.query(EtlRun.id).filter(EtlRun.finished_at.is_(None), EtlRun.kind == 'jobs').first():
+            start_run(session, 'jobs')
+        session.close()
+    store.record_seed(season, competition)
+    added = sum(
+        store.enqueue('team', f"team:{team['fbref_id']}:{season}", team['url'],
+                      {'team': team, 'season': season, 'competition': competition})
+        for team in teams
+    )
+    logger.info(f"📥 Команд в лиге: {len(teams)}, новых заданий: {added}")
+    return added
+
+def _load(SessionLocal, cache, fn, *args, heartbeat=None, retries=5):
+    """
+    Загрузка в отдельной транзакции. Другие воркеры пишут в ту же базу, поэтому при конфликте
+    (строку уже вставил другой воркер, база занята) транзакция повторяется. После любой ошибки
+    кэш прогревается заново, как в DBWriter: id из откатанной транзакции не должны попасть
+    в следующие задания. heartbeat: перед коммитом проверяется аренда задания.
+    """
+    from sqlalchemy.exc import IntegrityError, OperationalError
+    for attempt in range(1, retries + 1):
+        session = SessionLocal()
+        try:
+            fn(session, cache, *args)
+            if heartbeat is not None:
+                heartbeat.check()
+            session.commit()
+            return
+        except Exception as e:
+            session.rollback()
+            _rewarm(SessionLocal, cache)
+            if not isinstance(e, (IntegrityError, OperationalError)) or attempt == retries:
+                raise
+            logger.warning(f"⚠️  Конфликт записи ({type(e).__name__}), повтор {attempt}/{retries - 1}")
+            # Случайная пауза разводит воркеров, одновременно пишущих одни и те же матчи
+            time.sleep(random.uniform(0.5, 1.5) * attempt)
+        finally:
+            session.close()
+
+def _rewarm(SessionLocal, cache):
+    """Откатанные записи не должны остаться в кэше: прогрев на свежей сессии"""
+    session = SessionLocal()
+    try:
+        cache.warm(session)
+    finally:
+        session.close()
+
+def finish_jobs_run(store, SessionLocal, db_path=DB_PATH):
+    """
+    Закрывает открытый запуск 'jobs', когда очередь выполнена, и обновляет производные файлы
+    базы (main.refresh_derived). Запуск закрывает один воркер
+    """
+    from db import EtlRun
+    from cdc import finish_run
+    from validate import run_season_checks
+    from main import refresh_derived
+    session = SessionLocal()
+    try:
+        run = session.query(EtlRun.id, EtlRun.started_at).filter(
+            EtlRun.finished_at.is_(None), EtlRun.kind == 'jobs'
+        ).first()
+        if run is None:
+            return
+        started_at = run.started_at
+        failed = sum(count for (kind, state), count in store.counts().items() if state == 'failed')
+        # Закрывает только тот воркер, чей UPDATE сменил статус (остальные увидят finished_at)
+        closed = session.query(EtlRun).filter(EtlRun.id == run.id, EtlRun.finished_at.is_(None)).update(
+            {'status': 'closing'}, synchronize_session=False
+        )
+        session.commit()
+        if closed:
+            # Только сезоны, поставленные в очередь за время запуска, а не вся база
+            for season, competition in store.seeds_since(started_at.timestamp()) or [(SEASON, COMPETITION)]:
+                run_season_checks(session, run.id, season, competition)
+            finish_run(session, run.id, 'failed' if failed else 'success')
+    finally:
+        session.close()
+    if closed:
+        refresh_derived(db_path)
+
+def process_job(job, scraper, store, SessionLocal, cache, heartbeat=None):
+    """
+    Скачивает и загружает страницу задания; для команды ставит в очередь ее новые отчеты.
+    Вызывается под разделяемой блокировкой писателей (work); heartbeat - аренда задания,
+    проверяется перед коммитом (LeaseLost, если ее забрал другой воркер).
+    """
+    from main import scrape_team, load_team, load_report, load_table_hashes
+    from scraper import MatchReportQueue
+
+    payload = job['payload']
+    if job['kind'] == 'team':
+        team = payload['team']
+        season = payload.get('season', SEASON)
+        session = SessionLocal()
+        known_hashes = load_table_hashes(session, season, team['fbref_id']).get(team['fbref_id'])
+        session.close()
+        report_queue = MatchReportQueue()
+        matches, squad, players, table_hashes = scrape_team(scraper, team, report_queue, known_hashes)
+        _load(SessionLocal, cache, load_team, team, matches, squad, players,
+              season, payload.get('competition', COMPETITION), table_hashes, heartbeat=heartbeat)
+        # Отчеты - отдельными заданиями: их скачают все воркеры, свежие - раньше
+        while len(report_queue):
+            match_id, url = report_queue.pop()
+            store.enqueue('report', f"report:{match_id}", url, {'match_id': match_id}, priority=1)
+    elif job['kind'] == 'report':
+        report = scraper.get_match_report(payload['match_id'], job['url'])
+        if report is None:
+            raise RuntimeError(f"отчет {payload['match_id']} не получен")
+        _load(SessionLocal, cache, load_report, payload['match_id'], report, heartbeat=heartbeat)
+    else:
+        raise ValueError(f"Неизвестный тип задания: {job['kind']}")
+
+def work(store, scraper, db_path=DB_PATH, owner=None, idle_exit=True, poll_seconds=5.0):
+    """
+    Цикл воркера: аренда -> скачивание и загрузка -> complete. idle_exit: выйти, когда
+    выполнимых заданий не осталось (иначе ждать новые). Возвращает количество выполненных.
+    """
+    from db import init_db
+    from main import LoaderCache
+    from log_setup import log_context
+    from staging import writer_lock
+
+    owner = owner or f"{socket.gethostname()}-{os.getpid()}"
+    SessionLocal = init_db(db_path)
+    cache = LoaderCache()
+    session = SessionLocal()
+    cache.warm(session)
+    session.close()
+
+    done = 0
+    while True:
+        job = store.lease(owner)
+        if job is None:
+            if not store.active():
+                with writer_lock(db_path, shared=True):
+                    finish_jobs_run(store, SessionLocal, db_path)
+                if idle_exit:
+                    break
+            # Остальные задания арендованы другими воркерами - ждем их завершения или истечения аренды
+            time.sleep(poll_seconds)
+            continue
+
+        heartbeat = _Heartbeat(store, job['id'], owner)
+        heartbeat.start()
+        try:
+            with log_context(task=job['key'], stage='job'), writer_lock(db_path, shared=True):
+                process_job(job, scraper, store, SessionLocal, cache, heartbeat)
+        except LeaseLost:
+            heartbeat.stop()
+            # Задание выполняет другой воркер - транзакция откатана, задание бросаем
+            logger.warning(f"⚠️  Аренда задания {job['key']} потеряна, результат не записан")
+            continue
+        except Exception as e:
+            heartbeat.stop()
+            logger.error(f"❌ Задание {job['key']} (попытка {job['attempts']}): {e}")
+            store.fail(job['id'], owner, e)
+            continue
+        heartbeat.stop()
+        if store.complete(job['id'], owner):
+            done += 1
+        else:
+            # Аренда истекла после коммита: задание повторит другой воркер, строки не задвоятся
+            logger.warning(f"⚠️  Аренда задания {job['key']} потеряна")
+
+    logger.info(f"✅ Воркер {owner}: выполнено заданий {done}")
+    return done
+
+def main(argv=None):
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--store', default=JOB_STORE_PATH, help='файл очереди заданий (SQLite)')
+    common.add_argument('--base-url', default='https://fbref.com', help='адрес FBref (или заглушки)')
+    common.add_argument('--db', default=DB_PATH, help='URL базы данных')
+    parser = argparse.ArgumentParser(description='Распределенное скачивание через общую очередь заданий')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    seed_parser = commands.add_parser('seed', parents=[common], help='задания на команды лиги')
+    seed_parser.add_argument('league_url', nargs='?', default=PREMIER_LEAGUE_URL)
+    seed_parser.add_argument('--season', default=SEASON)
+    seed_parser.add_argument('--competition', default=COMPETITION)
+
+    work_parser = commands.add_parser('work', parents=[common], help='запустить воркер')
+    work_parser.add_argument('--id', help='имя воркера (по умолчанию host-pid)')
+    work_parser.add_argument('--proxy', help='HTTP(S) прокси этого воркера')
+    work_parser.add_argument('--wait', action='store_true', help='не выходить, когда задания кончились')
+
+    commands.add_parser('status', parents=[common], help='состояние очереди')
+    args = parser.parse_args(argv)
+
+    from log_setup import setup_logging
+    setup_logging(log_file=None)
+    store = JobStore(args.store)
+
+    if args.command == 'status':
+        for (kind, state), count in sorted(store.counts().items()):
+            print(f"{kind:<8} {state:<8} {count}")
+        return
+
+    from scraper import FBRefScraper
+    scraper = FBRefScraper(base_url=args.base_url, proxy=getattr(args, 'proxy', None))
+    if args.command == 'seed':
+        seed(store, scraper, args.league_url, args.season, args.competition, args.db)
+    else:
+        work(store, scraper, args.db, owner=args.id, idle_exit=not args.wait)
+
+if __name__ == '__main__':
+    main()
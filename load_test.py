@@ -0,0 +1,166 @@
+"""
+Нагрузочный прогон FBRefScraper против локальной заглушки (fbref_stub.py).
+
+Скачивает лигу, страницы всех команд и отчеты о сыгранных матчах без задержек
+«имитации человека» и сравнивает разобранное с тем, что сгенерировала заглушка.
+Печатает пропускную способность, накладные расходы повторов (лишние запросы к серверу)
+и количество потерянных или неверно разобранных страниц.
+
+    python load_test.py                                   # без сбоев, один поток
+    python load_test.py --error-rate 0.05 --truncate-rate 0.02 --workers 4
+"""
+
+import time
+import queue
+import logging
+import argparse
+import threading
+import scraper as scraper_module
+from scraper import FBRefScraper, parse_team_stats, parse_match_logs, parse_match_report
+from fbref_stub import League, StubServer
+from config import PREMIER_LEAGUE_URL
+
+logger = logging.getLogger(__name__)
+
+def fast_scraper(base_url, timeout=2.0):
+    """Скрапер без пауз между запросами и с коротким таймаутом (для заглушки)"""
+    scraper = FBRefScraper(base_url=base_url)
+    scraper.request_delay_min = scraper.request_delay_max = 0
+    scraper.long_pause_min = scraper.long_pause_max = 0
+    scraper.read_delay_min = scraper.read_delay_max = 0
+    scraper.retry_base_delay = 0
+    scraper.timeout = timeout
+    return scraper
+
+def check_team(league, team_id, content):
+    """Ошибка разбора страницы команды или None"""
+    team = league.by_id[team_id]
+    stats = parse_team_stats(content)
+    logs = parse_match_logs(content)
+    if len(stats['player_ids']) != len(team['players']):
+        return f"игроков {len(stats['player_ids'])} из {len(team['players'])}"
+    expected = sum(team_id in (m['home'], m['away']) for m in league.matches)
+    if logs is None or len(logs) != expected:
+        return f"матчей {0 if logs is None else len(logs)} из {expected}"
+    return None
+
+def check_report(league, match_id, content):
+    """Ошибка разбора отчета о матче или None"""
+    match = league.match_by_id[match_id]
+    report = parse_match_report(content)
+    players = len(league.by_id[match['home']]['players']) + len(league.by_id[match['away']]['players'])
+    if len(report['lineups']) != players:
+        return f"составы {len(report['lineups'])} из {players}"
+    goals = match['home_goals'] + match['away_goals']
+    if len(report['shots']) != goals:
+        return f"удары {len(report['shots'])} из {goals}"
+    return None
+
+def run(server, workers=1, timeout=2.0, reports=True):
+    """
+    Прогон по всем страницам заглушки в workers потоках (у каждого потока свой скрапер).
+    Возвращает dict с результатами.
+    """
+    league = server.league
+    # Сохранение страниц на диск мерило бы диск, а не скрапер
+    scraper_module.PAGE_ARCHIVE_DIR = None
+
+    started = time.perf_counter()
+    teams = fast_scraper(server.url, timeout).get_league_teams(PREMIER_LEAGUE_URL)
+
+    jobs = queue.Queue()
+    for team in teams:
+        jobs.put(('team', team['fbref_id'], team['url']))
+    if reports:
+        for match in league.matches:
+            if match['home_goals'] is not None:
+                jobs.put(('report', match['id'], league.match_url(match)))
+    total = jobs.qsize() + 1
+
+    lock = threading.Lock()
+    result = {'pages': 1 if teams else 0, 'failed': [] if teams else ['league'], 'incorrect': []}
+
+    def worker():
+        scraper = fast_scraper(server.url, timeout)
+        while True:
+            try:
+                kind, fbref_id, url = jobs.get_nowait()
+            except queue.Empty:
+                return
+            response = scraper.get(url)
+            if response is None:
+                with lock:
+                    result['failed'].append(url)
+                continue
+            content = response.content.decode('utf-8')
+            try:
+                error = (check_team if kind == 'team' else check_report)(league, fbref_id, content)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            with lock:
+                result['pages'] += 1
+                if error:
+                    result['incorrect'].append(f"{url}: {error}")
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.perf_counter() - started
+    requests_made = sum(count for key, count in server.stats.items() if key != 'bytes')
+    result.update({
+        'total': total,
+        'seconds': elapsed,
+        'pages_per_second': result['pages'] / elapsed if elapsed else 0.0,
+        'requests': requests_made,
+        'retry_overhead': requests_made / total - 1 if total else 0.0,
+        'server': dict(server.stats),
+    })
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Нагрузочный прогон скрапера против заглушки FBref')
+    parser.add_argument('--workers', type=int, default=1, help='параллельных скраперов')
+    parser.add_argument('--teams', type=int, default=20)
+    parser.add_argument('--played-rounds', type=int, default=30)
+    parser.add_argument('--no-reports', action='store_true', help='только лига и страницы команд')
+    parser.add_argument('--latency', type=float, nargs=2, default=(0.0, 0.0), metavar=('MIN', 'MAX'))
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-burst', type=int, default=3)
+    parser.add_argument('--timeout-rate', type=float, default=0.0)
+    parser.add_argument('--truncate-rate', type=float, default=0.0)
+    parser.add_argument('--timeout', type=float, default=2.0, help='таймаут запроса скрапера')
+    parser.add_argument('--plain-tables', action='store_true', help='таблицы без комментариев')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true', help='логи скрапера')
+    args = parser.parse_args(argv)
+
+    from log_setup import setup_logging
+    setup_logging(log_file=None)
+    if not args.verbose:
+        logging.getLogger('scraper').setLevel(logging.CRITICAL)
+
+    league = League(teams=args.teams, played_rounds=args.played_rounds, seed=args.seed)
+    with StubServer(
+        league, latency=tuple(args.latency), error_rate=args.error_rate, error_burst=args.error_burst,
+        timeout_rate=args.timeout_rate, hang=args.timeout * 1.5, truncate_rate=args.truncate_rate,
+        comment_tables=not args.plain_tables, seed=args.seed,
+    ) as server:
+        result = run(server, workers=args.workers, timeout=args.timeout, reports=not args.no_reports)
+
+    logger.info(f"📊 Страниц: {result['pages']}/{result['total']} за {result['seconds']:.2f}с "
+                f"({result['pages_per_second']:.1f} стр/с, потоков {args.workers})")
+    logger.info(f"🔁 Запросов к серверу: {result['requests']} (повторы +{result['retry_overhead']:.1%}), "
+                f"ответы: {result['server']}")
+    for url in result['failed']:
+        logger.error(f"❌ Не скачано: {url}")
+    for error in result['incorrect']:
+        logger.error(f"❌ Неверный разбор {error}")
+    if not result['failed'] and not result['incorrect']:
+        logger.info("✅ Все страницы скачаны и разобраны верно")
+    return 1 if result['failed'] or result['incorrect'] else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
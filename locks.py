@@ -0,0 +1,79 @@
+"""
+Межпроцессная блокировка на файле.
+
+POSIX - flock: исключительная (один владелец) или разделяемая (несколько владельцев, пока нет
+исключительной). Windows - msvcrt.locking: только исключительная, разделяемая блокировка
+там тоже исключительная (владельцы выполняются по очереди, а не одновременно).
+Блокировка снимается и при падении процесса - ее держит открытый файл, а не его наличие.
+"""
+
+import os
+import time
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+class FileLock:
+    """Блокировка файла path; контекстный менеджер. Файл создается при первом захвате и не удаляется"""
+
+    def __init__(self, path, shared=False):
+        self.path = path
+        self.shared = shared
+        self.file = None
+
+    def _try_lock(self):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.file, (fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def acquire(self, blocking=True, poll_seconds=0.5):
+        """Захватывает блокировку; blocking=False - не ждет и возвращает False, если она занята"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(self.path, 'a+b')
+        if self._try_lock():
+            return True
+        if not blocking:
+            self.file.close()
+            self.file = None
+            return False
+        logger.info(f"⏳ Ожидание блокировки {self.path}")
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        else:
+            while not self._try_lock():
+                time.sleep(poll_seconds)
+        return True
+
+    def release(self):
+        if self.file is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.file, fcntl.LOCK_UN)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
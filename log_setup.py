@@ -0,0 +1,154 @@
+"""
+Настройка логирования ETL: один раз на процесс, вне горячего пути.
+
+Код логирует в QueueHandler: запись только кладется в очередь, а форматирование сообщения
+и запись в файл/консоль выполняет поток QueueListener. Поэтому сообщения в циклах
+пишутся в ленивом стиле logger.info("... %s", value) - строка собирается только для
+записей, которые дошли до вывода.
+
+Поля записи stage, team, table, match, task передаются через extra= или log_context()
+и попадают в JSON (LOG_JSON = True) отдельными ключами:
+
+    with log_context(team='Arsenal', stage='parse'):
+        logger.info("Таблица %s", table_id, extra={'stage': 'table', 'table': table_id})
+
+Шумные стадии прореживаются (LOG_SAMPLING = {'table': 10} - каждая 10-я запись
+INFO/DEBUG стадии table); WARNING и выше пишутся всегда.
+"""
+
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+from config import LOG_FILE, LOG_LEVEL, LOG_JSON, LOG_SAMPLING
+
+CONTEXT_FIELDS = ('stage', 'team', 'table', 'match', 'task')
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_context = contextvars.ContextVar('log_context', default={})
+_listener = None
+_handler = None
+_pid = None
+
+@contextmanager
+def log_context(**fields):
+    """Добавляет поля (team=..., stage=...) ко всем записям внутри блока в текущем потоке"""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+class ContextFilter(logging.Filter):
+    """Переносит поля log_context() в запись (поля из extra= имеют приоритет)"""
+
+    def filter(self, record):
+        for field, value in _context.get().items():
+            if not hasattr(record, field):
+                setattr(record, field, value)
+        return True
+
+class StageSampler(logging.Filter):
+    """Пропускает каждую N-ю запись INFO/DEBUG стадии (sampling: стадия -> N)"""
+
+    def __init__(self, sampling):
+        super().__init__()
+        self.sampling = dict(sampling or {})
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        every = self.sampling.get(getattr(record, 'stage', None))
+        if not every or every <= 1 or record.levelno >= logging.WARNING:
+            return True
+        with self._lock:
+            count = self._counters.get(record.stage, 0)
+            self._counters[record.stage] = count + 1
+        return count % every == 0
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON: ts, level, logger, msg и поля CONTEXT_FIELDS"""
+
+    def format(self, record):
+        data = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler без форматирования в вызывающем потоке: стандартный prepare() собирает
+    сообщение сразу, здесь это делает поток QueueListener.
+    """
+
+    def prepare(self, record):
+        return record
+
+def _stop():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def setup_logging(log_file=LOG_FILE, level=LOG_LEVEL, json_format=LOG_JSON, sampling=LOG_SAMPLING):
+    """
+    Настраивает корневой логгер: DeferredQueueHandler -> QueueListener -> консоль (+ log_file).
+    Повторный вызов в том же процессе ничего не меняет.
+    """
+    global _listener, _handler, _pid
+    if _handler is not None and _pid == os.getpid():
+        return
+    root = logging.getLogger()
+    if _handler is not None:
+        # Дочерний процесс (fork) унаследовал обработчик без потока-слушателя
+        root.removeHandler(_handler)
+
+    formatter = JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    _handler = DeferredQueueHandler(log_queue)
+    _handler.addFilter(ContextFilter())
+    _handler.addFilter(StageSampler(sampling))
+    root.addHandler(_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    if _pid is None:
+        atexit.register(_stop)
+    _pid = os.getpid()
+
+def setup_worker_logging(level=logging.WARNING):
+    """
+    Логирование в процессах пула (reparse): только предупреждения и ошибки, синхронно в stderr.
+    Результаты воркеры возвращают родителю, который их и логирует.
+    """
+    global _handler
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    _handler = None
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if LOG_JSON else logging.Formatter(TEXT_FORMAT))
+    root.addHandler(handler)
+    root.setLevel(level)
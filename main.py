@@ -1,25 +1,182 @@
 import logging
+from datetime import datetime
 import pandas as pd
 from sqlalchemy.orm import Session
-from db import init_db, Team, Player, Match, SquadStat, PlayerStat
-from scraper import FBRefScraper
-from config import PREMIER_LEAGUE_URL, SEASON, COMPETITION, DEBUG_MODE, DEBUG_TEAM_LIMIT
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO, 
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('scraper.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
+from db import (
+    init_db, get_engine, upsert, copy_rows, Team, Player, Match, SquadStat, PlayerStat, Referee, Formation, TeamMatchStat,
+    MatchLineup, MatchEvent, MatchShot, TableHash
+)
+from scraper import FBRefScraper, MatchReportQueue
+from writer import DBWriter
+from log_setup import setup_logging, log_context
+from cdc import start_run, finish_run
+from ratings import update_for_matches
+from metrics import refresh_team_form, refresh_player_per90
+from similarity import refresh_index as refresh_similarity_index
+from features import export_features
+from versions import derived_dirs
+from validate import validate_team, check_squad, check_players, save_issues, run_season_checks
+from transform import (
+    normalize_match_logs, normalize_squad_stats, normalize_player_stats, to_str,
+    is_squad_standard_table, is_player_standard_table
+)
+from config import (
+    PREMIER_LEAGUE_URL, SEASON, COMPETITION, DEBUG_MODE, DEBUG_TEAM_LIMIT,
+    SCRAPE_MATCH_REPORTS, MATCH_REPORT_LIMIT, DB_PATH, USE_STAGING, STAGING_DB_PATH, SKIP_UNCHANGED_TABLES
 )
+
 logger = logging.getLogger(__name__)
 
-def process_team(session: Session, team_data: dict):
+class PlayerCache:
+    """
+    In-process кэш fbref_id игрока -> players.id.
+    Прогревается одним запросом за запуск, поэтому поиск игрока не требует запросов к БД.
+    """
+
+    def __init__(self):
+        # fbref_id -> (players.id, players.team_id)
+        self._ids = {}
+
+    def warm(self, session: Session):
+        """Загружает все известные игроки одним запросом"""
+        self._ids = {
+            fbref_id: (player_id, team_id)
+            for fbref_id, player_id, team_id in session.query(Player.fbref_id, Player.id, Player.team_id)
+        }
+        logger.info(f"👤 Кэш игроков прогрет: {len(self._ids)} записей")
+
+    def get_or_create(self, session: Session, fbref_id: str, name: str, team_id: int,
+                      position=None, nationality=None):
+        """Возвращает players.id, создавая игрока при первом появлении"""
+        cached = self._ids.get(fbref_id)
+        if cached is not None:
+            player_id, known_team_id = cached
+            if team_id is not None and known_team_id != team_id:
+                # Переход в другую команду: обновляем текущую команду игрока
+                session.query(Player).filter_by(id=player_id).update({'team_id': team_id})
+                self._ids[fbref_id] = (player_id, team_id)
+            return player_id
+
+        player = Player(
+            fbref_id=fbref_id,
+            name=name or fbref_id,
+            position=position,
+            nationality=nationality,
+            team_id=team_id
+        )
+        session.add(player)
+        session.flush()  # Получаем ID
+        self._ids[fbref_id] = (player.id, team_id)
+        return player.id
+
+class DimensionCache:
+    """
+    Кэш ключ -> id для справочников (команды, судьи, схемы).
+    Прогревается одним запросом, новые значения создаются по мере появления.
+    """
+
+    def __init__(self, model, key='name'):
+        self.model = model
+        self.key = key
+        self._ids = {}
+
+    def warm(self, session: Session):
+        column = getattr(self.model, self.key)
+        self._ids = dict(session.query(column, self.model.id))
+
+    def get_or_create(self, session: Session, key, **fields):
+        """Возвращает id записи справочника (None для пустого ключа)"""
+        key = to_str(key)
+        if key is None:
+            return None
+        row_id = self._ids.get(key)
+        if row_id is None:
+            obj = self.model(**{self.key: key}, **fields)
+            session.add(obj)
+            session.flush()
+            row_id = self._ids[key] = obj.id
+        return row_id
+
+class MatchCache:
+    """
+    Кэш матчей по естественному ключу (сезон, турнир, хозяева, гости) -> (id, fbref_id, сыгран ли).
+    Позволяет загрузить матч один раз, хотя он встречается в логах обеих команд.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        # Матчи, ставшие сыгранными с последнего take_completed (для пересчета рейтингов)
+        self._completed = set()
+
+    def warm(self, session: Session):
+        self._completed = set()
+        rows = session.query(
+            Match.id, Match.fbref_id, Match.season, Match.competition,
+            Match.home_team_id, Match.away_team_id, Match.home_score
+        )
+        self._ids = {
+            (season, competition, home_id, away_id): (match_id, fbref_id, home_score is not None)
+            for match_id, fbref_id, season, competition, home_id, away_id, home_score in rows
+        }
+
+    def upsert(self, session: Session, fields: dict):
+        """
+        Создает матч или обновляет еще не сыгранный (перенос даты, появившийся счет и ID).
+        Сыгранные матчи повторно не трогаются.
+        """
+        key = (fields['season'], fields['competition'], fields['home_team_id'], fields['away_team_id'])
+        played = fields['home_score'] is not None
+        cached = self._ids.get(key)
+        
+        if cached is None:
+            match = Match(**fields)
+            session.add(match)
+            session.flush()
+            self._ids[key] = (match.id, match.fbref_id, played)
+            if played:
+                self._completed.add(match.id)
+            return match.id
+        
+        match_id, fbref_id, was_played = cached
+        if not was_played or (fields['fbref_id'] and not fbref_id):
+            session.query(Match).filter_by(id=match_id).update(fields)
+            self._ids[key] = (match_id, fields['fbref_id'] or fbref_id, played or was_played)
+            if played and not was_played:
+                self._completed.add(match_id)
+        return match_id
+
+    def take_completed(self):
+        completed, self._completed = self._completed, set()
+        return completed
+
+class LoaderCache:
+    """Все in-process кэши загрузчика; прогреваются один раз за запуск"""
+
+    def __init__(self):
+        self.players = PlayerCache()
+        self.teams = DimensionCache(Team, key='fbref_id')
+        self.referees = DimensionCache(Referee)
+        self.formations = DimensionCache(Formation)
+        self.matches = MatchCache()
+
+    def warm(self, session: Session):
+        self.players.warm(session)
+        self.teams.warm(session)
+        self.referees.warm(session)
+        self.formations.warm(session)
+        self.matches.warm(session)
+
+def process_team(session: Session, team_data: dict, cache: LoaderCache = None):
     """
     Upserts team data into the database.
+    The team may already exist as an opponent created from another team's match log.
     """
+    if cache is not None:
+        team_id = cache.teams.get_or_create(
+            session, team_data['fbref_id'], name=team_data['name'], url=team_data['url']
+        )
+        return session.get(Team, team_id)
+
     team = session.query(Team).filter_by(fbref_id=team_data['fbref_id']).first()
     if not team:
         team = Team(
@@ -31,311 +188,422 @@ def process_team(session: Session, team_data: dict):
         session.commit()
     return team
 
-def process_matches(session: Session, team: Team, df: pd.DataFrame):
+def load_matches(session: Session, team: Team, records: list, cache: LoaderCache,
+                 season=SEASON, competition=COMPETITION):
     """
-    Processes match logs dataframe and stores in DB.
+    Stores normalized match log records (normalize_match_logs) of one team.
+    Each fixture is stored once in matches (both teams' logs resolve to the same row),
+    the team's side of it goes to team_match_stats.
     """
-    if df is None or df.empty:
-        return
-
-    # Filter for valid matches (Result is not null usually means played)
-    # FBref match logs include future fixtures too.
+    fact_rows = []
     
-    for _, row in df.iterrows():
-        # Basic validation
-        if pd.isna(row.get('Date')) or row.get('Comp') != 'Premier League':
-            continue
-
-        # Parse scores
-        gf = row.get('GF')
-        ga = row.get('GA')
-        
-        # Handle future matches where scores are NaN
-        if pd.isna(gf): gf = None
-        else: gf = int(gf) if str(gf).isdigit() else None
-            
-        if pd.isna(ga): ga = None
-        else: ga = int(ga) if str(ga).isdigit() else None
-
-        attendance = row.get('Attendance')
-        if pd.isna(attendance): attendance = None
-        else: attendance = int(str(attendance).replace(',', '')) if str(attendance).replace(',', '').isdigit() else None
-
-        # Create or Update Match
-        # Identify match by Date and Teams. 
-        # Since we iterate by team, we might process the same match twice (once for home, once for away).
-        # We should check if it exists.
+    for record in records:
+        # Соперник может быть еще не загружен - создаем команду по ссылке
+        opponent_id = cache.teams.get_or_create(
+            session, record['opponent_fbref_id'],
+            name=record['opponent_name'] or record['opponent_fbref_id'],
+            url=record['opponent_url']
+        )
         
-        # This is a simplification. Ideally we resolve opponent to a Team ID.
-        # For now, we will just store the match context from this team's perspective 
-        # or try to avoid duplicates if we had a robust unique ID (like FBref match ID).
-        # FBref match logs have a 'Match Report' link which contains the Match ID.
+        is_home = record['is_home']
+        gf, ga = record['goals_for'], record['goals_against']
         
-        # Let's try to extract opponent name
-        opponent_name = row.get('Opponent')
+        match_id = cache.matches.upsert(session, {
+            'fbref_id': record['match_fbref_id'],
+            'season': season,
+            'competition': competition,
+            'date': record['date'],
+            'start_time': record['start_time'],
+            'round': record['round'],
+            'home_team_id': team.id if is_home else opponent_id,
+            'away_team_id': opponent_id if is_home else team.id,
+            'home_score': gf if is_home else ga,
+            'away_score': ga if is_home else gf,
+            'attendance': record['attendance'],
+            'referee_id': cache.referees.get_or_create(session, record['referee']),
+        })
         
-        # Check duplicate by date and team (simple heuristic)
-        existing = session.query(Match).filter_by(
-            date=pd.to_datetime(row['Date']), 
-            home_team_id=team.id if row.get('Venue') == 'Home' else None
-        ).first()
+        captain_id = None
+        if record['captain_fbref_id']:
+            captain_id = cache.players.get_or_create(
+                session, record['captain_fbref_id'], record['captain_name'], team.id
+            )
         
-        if not existing:
-            # We only insert if we are the home team to avoid double counting?
-            # Or just insert everything and handle duplicates later. 
-            # Let's insert if Venue is Home for now to ensure unique matches in DB, 
-            # or if we want full logs, we treat them as "Team Match Performance".
-            # The DB model 'Match' looks like a single event.
-            
-            match = Match(
-                date=pd.to_datetime(row['Date']),
-                home_team_id=team.id,
-                # away_team_id = ... need to lookup opponent by name
-                home_score=gf,
-                away_score=ga,
-                competition=row.get('Comp'),
-                round=row.get('Round'),
-                venue=row.get('Venue'),
-                attendance=attendance
-                )
-            session.add(match)
+        fact_rows.append({
+            'match_id': match_id,
+            'team_id': team.id,
+            'opponent_id': opponent_id,
+            'date': record['date'],
+            'is_home': is_home,
+            'goals_for': gf,
+            'goals_against': ga,
+            'xg': record['xg'],
+            'xga': record['xga'],
+            'possession': record['possession'],
+            'formation_id': cache.formations.get_or_create(session, record['formation']),
+            'opp_formation_id': cache.formations.get_or_create(session, record['opp_formation']),
+            'captain_id': captain_id,
+        })
+
+    # Одним пакетом: новые строки вставляются, строки будущих матчей получают результат,
+    # строки сыгранных матчей не меняются
+    upsert(
+        session, TeamMatchStat, fact_rows, ['match_id', 'team_id'],
+        update_columns=[c for c in fact_rows[0] if c not in ('match_id', 'team_id')] if fact_rows else None,
+        update_where=TeamMatchStat.goals_for.is_(None)
+    )
+    update_for_matches(session, cache.matches.take_completed())
+    refresh_team_form(session, [team.id], season, competition)
+    logger.info("📅 Обработано матчей: %d", len(fact_rows), extra={'stage': 'load'})
+
+def load_squad_stats(session: Session, team: Team, record: dict,
+                     season=SEASON, competition=COMPETITION):
+    """
+    Stores normalized squad stats (normalize_squad_stats).
+    Существующая строка перезаписывается: record - None, только если таблица не изменилась (scrape_team)
+    """
+    if record is None:
+        return
+    
+    upsert(session, SquadStat, [{
+        'team_id': team.id,
+        'season': season,
+        'competition': competition,
+        'goals_for': record['goals_for'],
+        'possession': record['possession'],
+    }], ['team_id', 'season', 'competition'], update_columns=['goals_for', 'possession'])
+    logger.info("✅ Статистика команды сохранена: голы=%s, владение=%s%%", record['goals_for'], record['possession'],
+                extra={'stage': 'load'})
 
+def load_player_stats(session: Session, team: Team, records: list, player_cache: PlayerCache,
+                      season=SEASON, competition=COMPETITION):
+    """Stores normalized player stats (normalize_player_stats) of one team"""
+    if records is None:
+        # Таблица игроков не изменилась с прошлой загрузки (scrape_team)
+        return
+    stat_rows = []
+    for record in records:
+        player_id = player_cache.get_or_create(
+            session, record['fbref_id'], record['name'], team.id,
+            position=record['position'], nationality=record['nationality']
+        )
+        stat_rows.append({
+            'player_id': player_id,
+            'team_id': team.id,
+            'season': season,
+            'competition': competition,
+            'goals': record['goals'],
+            'assists': record['assists'],
+            'minutes': record['minutes'],
+            'xg': record.get('xg'),
+            'npxg': record.get('npxg'),
+            'xag': record.get('xag'),
+        })
+    
+    # Таблица изменилась с прошлой загрузки (scrape_team) - значения перезаписываются, per-90 пересчитывается
+    upsert(session, PlayerStat, stat_rows, ['player_id', 'team_id', 'season', 'competition'],
+           update_columns=['goals', 'assists', 'minutes', 'xg', 'npxg', 'xag'])
+    refresh_player_per90(session, [team.id], season, competition)
+    
+    if stat_rows:
+        logger.info("✅ Обработано статистики игроков: %d", len(stat_rows), extra={'stage': 'load'})
+    else:
+        logger.warning("⚠️  Не удалось добавить статистику игроков", extra={'stage': 'load'})
+
+def process_matches(session: Session, team: Team, df: pd.DataFrame, cache: LoaderCache = None):
+    """
+    Processes match logs dataframe and stores in DB.
+    """
+    if df is None or df.empty:
+        return
+    
+    if cache is None:
+        cache = LoaderCache()
+        cache.warm(session)
+    
+    load_matches(session, team, normalize_match_logs(df), cache)
     session.commit()
 
-def process_squad_stats(session: Session, team: Team, stats_data: dict):
+def process_squad_stats(session: Session, team: Team, stats_data: dict,
+                        cache: LoaderCache = None):
     """
-    Processes squad and player stats.
+    Processes squad and player stats: проверки качества (validate.py) и запись в одной транзакции,
+    коммит - как в process_matches.
     """
     if not stats_data:
         logger.warning(f"⚠️  Нет данных статистики для команды {team.name}")
         return
 
-    # Process Squad Stats (Standard Table)
     squad_tables = stats_data.get('squad', {})
     player_tables = stats_data.get('players', {})
     
-    logger.info(f"📊 Найдено таблиц команды: {len(squad_tables)}, игроков: {len(player_tables)}")
-    
-    # Debug: выводим все найденные таблицы
-    if squad_tables:
-        logger.info(f"   Таблицы команды: {list(squad_tables.keys())}")
-    if player_tables:
-        logger.info(f"   Таблицы игроков: {list(player_tables.keys())[:5]}...")
-    
-    # Find standard table
-    standard_df = None
-    for table_id, df in squad_tables.items():
-        if 'standard' in table_id.lower() and 'squad' in table_id.lower():
-            standard_df = df
-            logger.info(f"✅ Найдена таблица статистики: {table_id}")
-            break
-            
-    if standard_df is not None and not standard_df.empty:
-        logger.info(f"📋 Обработка статистики команды, строк: {len(standard_df)}, колонок: {len(standard_df.columns)}")
-        
-        # Usually row 0 is the team stats
-        row = standard_df.iloc[0]
-        
-        # Flatten columns if multi-index
-        if isinstance(standard_df.columns, pd.MultiIndex):
-            new_cols = []
-            for col in standard_df.columns:
-                if isinstance(col, tuple):
-                    # Объединяем непустые части
-                    parts = [str(c).strip() for c in col if str(c).strip() and not str(c).startswith('Unnamed')]
-                    new_cols.append('_'.join(parts) if parts else str(col[-1]))
-                else:
-                    new_cols.append(str(col))
-            standard_df.columns = new_cols
-            row = standard_df.iloc[0]
-
-        # Debug: показываем колонки
-        logger.info(f"   Колонки: {list(standard_df.columns)[:10]}...")
-        
-        # Extract basic stats
-        gls = None
-        poss = None
-        
-        for col in standard_df.columns:
-            col_str = str(col)
-            if 'Gls' in col_str and gls is None: 
-                gls = row[col]
-                logger.info(f"   Найдено голов: {gls} (колонка: {col})")
-            if 'Poss' in col_str and poss is None: 
-                poss = row[col]
-                logger.info(f"   Найдено владение: {poss} (колонка: {col})")
-
-        # Upsert SquadStat
-        existing_stat = session.query(SquadStat).filter_by(
-            team_id=team.id, season=SEASON, competition=COMPETITION
-        ).first()
-        
-        if not existing_stat:
-            try:
-                goals_for_val = int(float(gls)) if gls is not None and str(gls).replace('.','').isdigit() else 0
-                poss_val = float(str(poss).replace('%','')) if poss is not None else 0.0
-                
-                stat = SquadStat(
-                    team_id=team.id,
-                    season=SEASON,
-                    competition=COMPETITION,
-                    goals_for=goals_for_val,
-                    possession=poss_val
-                )
-                session.add(stat)
-                logger.info(f"✅ Статистика команды сохранена: голы={goals_for_val}, владение={poss_val}%")
-            except Exception as e:
-                logger.error(f"❌ Ошибка при сохранении статистики: {e}")
-        else:
-            logger.info(f"ℹ️  Статистика команды уже существует")
-    else:
-        logger.warning(f"⚠️  Таблица статистики команды не найдена")
+    logger.info("📊 Найдено таблиц команды: %d, игроков: %d", len(squad_tables), len(player_tables),
+                extra={'stage': 'table'})
+    logger.debug("   Таблицы команды: %s, игроков: %s", list(squad_tables), list(player_tables),
+                 extra={'stage': 'table'})
+    
+    squad, issues = check_squad(normalize_squad_stats(squad_tables), team.fbref_id)
+    save_issues(session, issues)
+    load_squad_stats(session, team, squad)
     
     # Process player stats
-    process_player_stats(session, team, player_tables)
+    process_player_stats(session, team, player_tables,
+                         stats_data.get('player_ids'), cache.players if cache else None)
+    session.commit()
 
-def process_player_stats(session: Session, team: Team, player_tables: dict):
-    """Обрабатывает статистику игроков"""
+def process_player_stats(session: Session, team: Team, player_tables: dict,
+                         player_ids: dict = None, player_cache: PlayerCache = None):
+    """
+    Обрабатывает статистику игроков: строки с ошибками проверок уходят в карантин, остальные
+    записываются и коммитятся.
+    Игроки идентифицируются по FBref ID (player_ids: имя -> fbref_id), а не по имени и команде.
+    """
     if not player_tables:
         return
     
-    # Ищем таблицу со стандартной статистикой игроков
-    standard_table = None
-    for table_id, df in player_tables.items():
-        if 'standard' in table_id.lower() and 'stats_' in table_id.lower():
-            standard_table = df
-            logger.info(f"✅ Найдена таблица игроков: {table_id}, строк: {len(df)}")
-            break
+    if player_cache is None:
+        player_cache = PlayerCache()
+        player_cache.warm(session)
     
-    if standard_table is None or standard_table.empty:
-        logger.warning("⚠️  Таблица статистики игроков не найдена")
-        return
+    players, issues = check_players(normalize_player_stats(player_tables, player_ids), team.fbref_id)
+    save_issues(session, issues)
+    load_player_stats(session, team, players, player_cache)
+    session.commit()
+
+def process_match_report(session: Session, match_fbref_id: str, report: dict, cache: LoaderCache):
+    """
+    Сохраняет составы, события и удары из отчета о матче (parse_match_report)
+    пакетными вставками и помечает матч как загруженный. Коммит - на стороне вызывающего кода,
+    поэтому отчет и отметка о загрузке попадают в одну транзакцию.
+    """
+    match = session.query(Match.id, Match.report_loaded).filter_by(fbref_id=match_fbref_id).first()
+    if match is None:
+        logger.warning(f"⚠️  Матч {match_fbref_id} не найден в БД, отчет пропущен")
+        return False
+    if match.report_loaded:
+        # Повторная загрузка (например, задание выполнено двумя воркерами) не дублирует составы
+        logger.info(f"ℹ️  Отчет {match_fbref_id} уже загружен")
+        return False
+    match_id = match.id
     
-    # Flatten multi-index columns
-    if isinstance(standard_table.columns, pd.MultiIndex):
-        # Правильно обрабатываем MultiIndex - берем последний уровень или объединяем
-        new_cols = []
-        for col in standard_table.columns:
-            if isinstance(col, tuple):
-                # Объединяем непустые части
-                parts = [str(c).strip() for c in col if str(c).strip() and not str(c).startswith('Unnamed')]
-                new_cols.append('_'.join(parts) if parts else str(col[-1]))
-            else:
-                new_cols.append(str(col))
-        standard_table.columns = new_cols
-    
-    # Debug: показываем первые колонки
-    logger.info(f"   Колонки таблицы игроков: {list(standard_table.columns)[:10]}...")
-    
-    players_added = 0
-    
-    for idx, row in standard_table.iterrows():
-        try:
-            # Пропускаем заголовки и итоговые строки
-            # Ищем колонку с именем игрока (может быть 'Player', 'player', или с префиксом)
-            player_name = None
-            for col in standard_table.columns:
-                if 'player' in str(col).lower() and 'Player' in str(col):
-                    player_name = row[col]
-                    break
-            
-            if player_name is None:
-                # Пробуем стандартные варианты
-                player_name = row.get('Player') or row.get('player')
-            
-            player_name_str = str(player_name).strip()
-            
-            # Пропускаем заголовки, итоговые строки и пустые значения
-            if (pd.isna(player_name) or 
-                player_name_str == '' or 
-                player_name_str == 'Player' or
-                'Squad Total' in player_name_str or
-                'Total' in player_name_str):
-                continue
-            
-            # Создаем или находим игрока
-            player = session.query(Player).filter_by(
-                name=str(player_name).strip(),
-                team_id=team.id
-            ).first()
-            
-            if not player:
-                player = Player(
-                    fbref_id=f"{team.fbref_id}_{idx}",  # Временный ID
-                    name=str(player_name).strip(),
-                    team_id=team.id
+    team_names = {
+        report['home_team_id']: report['home_team_name'],
+        report['away_team_id']: report['away_team_name'],
+    }
+    
+    def team_id(fbref_id):
+        if not fbref_id:
+            return None
+        return cache.teams.get_or_create(session, fbref_id, name=team_names.get(fbref_id) or fbref_id)
+    
+    def player_id(fbref_id, name, team):
+        return cache.players.get_or_create(session, fbref_id, name, team) if fbref_id else None
+    
+    lineups = []
+    for row in report['lineups']:
+        team = team_id(row['team_id'])
+        lineups.append({
+            'match_id': match_id,
+            'team_id': team,
+            'player_id': player_id(row['player_id'], row['player_name'], team),
+            'shirt_number': row['shirt_number'],
+            'is_starter': row['is_starter'],
+            'position': row['position'],
+            'minutes': row['minutes'],
+        })
+    
+    events = []
+    for row in report['events']:
+        team = team_id(row['team_id'])
+        events.append({
+            'match_id': match_id,
+            'team_id': team,
+            'minute': row['minute'],
+            'added_time': row['added_time'],
+            'event_type': row['event_type'],
+            'player_id': player_id(row['player_id'], row['player_name'], team),
+            # Ассистент/заменяемый мог играть за другую команду - текущую команду не меняем
+            'secondary_player_id': player_id(row['secondary_player_id'], row['secondary_player_name'], None),
+        })
+    
+    shots = []
+    for row in report['shots']:
+        team = team_id(row['team_id'])
+        shots.append({
+            'match_id': match_id,
+            'team_id': team,
+            'player_id': player_id(row['player_id'], row['player_name'], team),
+            'minute': row['minute'],
+            'added_time': row['added_time'],
+            'xg': row['xg'],
+            'outcome': row['outcome'],
+            'distance': row['distance'],
+            'body_part': row['body_part'],
+        })
+    
+    copy_rows(session, MatchLineup, lineups)
+    copy_rows(session, MatchEvent, events)
+    copy_rows(session, MatchShot, shots)
+    session.query(Match).filter_by(id=match_id).update({'report_loaded': True})
+    
+    logger.info("✅ Отчет сохранен: составы %d, события %d, удары %d", len(lineups), len(events), len(shots),
+                extra={'stage': 'report', 'match': match_fbref_id})
+    return True
+
+def load_table_hashes(session: Session, season=SEASON, team_fbref_id=None):
+    """
+    Хэши таблиц страниц команд с последней загрузки: {team_fbref_id: {table_id: hash}}.
+    Пусто, если SKIP_UNCHANGED_TABLES выключен.
+    """
+    if not SKIP_UNCHANGED_TABLES:
+        return {}
+    query = session.query(TableHash.team_fbref_id, TableHash.table_id, TableHash.hash).filter(
+        TableHash.season == season
+    )
+    if team_fbref_id is not None:
+        query = query.filter(TableHash.team_fbref_id == team_fbref_id)
+    hashes = {}
+    for team, table_id, digest in query:
+        hashes.setdefault(team, {})[table_id] = digest
+    return hashes
+
+def save_table_hashes(session: Session, team_fbref_id: str, season, table_hashes: dict):
+    """Запоминает хэши загруженных таблиц команды (коммит - на стороне вызывающего кода)"""
+    now = datetime.now()
+    rows = [
+        {'team_fbref_id': team_fbref_id, 'season': season, 'table_id': table_id, 'hash': digest, 'updated_at': now}
+        for table_id, digest in table_hashes.items()
+    ]
+    upsert(session, TableHash, rows, ['team_fbref_id', 'season', 'table_id'], update_columns=['hash', 'updated_at'])
+
+def load_team(session: Session, cache: LoaderCache, team_data: dict, matches: list, squad: dict,
+              players: list, season=SEASON, competition=COMPETITION, table_hashes: dict = None):
+    """
+    Загружает нормализованные данные одной команды (transform.py): матчи, статистику команды и игроков.
+    Задача писателя БД (writer.py) и reparse.py; коммит - на стороне вызывающего кода.
+    Записи, не прошедшие проверки (validate.py), не загружаются, а попадают в карантин.
+    table_hashes - хэши разобранных таблиц страницы (scrape_team); они сохраняются вместе с данными.
+    """
+    matches, squad, players, issues = validate_team(team_data, matches, squad, players)
+    save_issues(session, issues)
+    team = process_team(session, team_data, cache)
+    load_matches(session, team, matches, cache, season=season, competition=competition)
+    load_squad_stats(session, team, squad, season=season, competition=competition)
+    load_player_stats(session, team, players, cache.players, season=season, competition=competition)
+    # Если часть записей в карантине, таблицы разберутся заново при следующей загрузке
+    if table_hashes and not any(issue['action'] == 'quarantined' for issue in issues):
+        save_table_hashes(session, team_data['fbref_id'], season, table_hashes)
+    logger.info("💾 Данные команды %s записаны", team_data['name'], extra={'stage': 'load'})
+
+def load_report(session: Session, cache: LoaderCache, match_fbref_id: str, report: dict):
+    """Задача писателя БД: отчет о матче"""
+    process_match_report(session, match_fbref_id, report, cache)
+
+def scrape_team(scraper: FBRefScraper, team_info: dict, report_queue: MatchReportQueue, known_hashes: dict = None):
+    """
+    Скачивает и нормализует страницу команды: (matches, squad, players, table_hashes) для load_team.
+    Ссылки на отчеты о сыгранных матчах добавляются в report_queue.
+    known_hashes - хэши таблиц команды с прошлой загрузки (load_table_hashes): таблицы, которые
+    не изменились, не разбираются, а squad / players для них - None (в базе уже актуальные данные).
+    """
+    # Лог матчей и статистика - с одной страницы, скачиваем ее один раз
+    logger.info("📊 Получение логов матчей и статистики команды...")
+    match_df, stats = scraper.get_team_data(team_info['url'], known_hashes)
+    matches = normalize_match_logs(match_df) if match_df is not None and not match_df.empty else []
+    report_queue.push_match_logs(match_df)
+
+    stats = stats or {}
+    unchanged = stats.get('unchanged', set())
+    squad = players = None
+    if not any(is_squad_standard_table(table_id) for table_id in unchanged):
+        squad = normalize_squad_stats(stats.get('squad', {}))
+    if not any(is_player_standard_table(table_id) for table_id in unchanged):
+        players = normalize_player_stats(stats.get('players', {}), stats.get('player_ids'))
+    table_hashes = {
+        table_id: digest for table_id, digest in stats.get('hashes', {}).items() if table_id not in unchanged
+    }
+    return matches, squad, players, table_hashes
+
+def refresh_derived(db_path=DB_PATH):
+    """
+    Производные файлы по опубликованным данным db_path: индекс похожих игроков и хранилище признаков.
+    Каталоги - versions.derived_dirs(db_path); вызывается в конце main.py, scheduler.py, jobs.py и reparse.py.
+    """
+    similarity_dir, features_dir = derived_dirs(db_path)
+    refresh_similarity_index(db_path, similarity_dir)
+    export_features(get_engine(db_path), features_dir)
+
+def load_match_reports(writer: DBWriter, scraper: FBRefScraper, queue: MatchReportQueue):
+    """Скачивает отчеты о матчах из очереди (сначала свежие) и передает их писателю БД"""
+    logger.info(f"🧾 Отчетов о матчах в очереди: {len(queue)}")
+    
+    def handler(match_fbref_id, report):
+        writer.submit(f"отчет {match_fbref_id}", load_report, match_fbref_id, report)
+    
+    processed = scraper.fetch_match_reports(queue, handler, limit=MATCH_REPORT_LIMIT)
+    logger.info(f"✅ Скачано отчетов: {processed}, осталось в очереди: {len(queue)}")
+
+def load_league_teams(SessionLocal, scraper: FBRefScraper, teams: list, report_queue: MatchReportQueue,
+                      known_hashes: dict):
+    """Шаги 4-5 main(): страницы команд и отчеты о матчах -> писатель БД. Возвращает не загруженные команды"""
+    # 4. Process each team
+    # Запись в БД идет в отдельном потоке, скачивание ее не ждет
+    writer = DBWriter(SessionLocal).start()
+    failed_teams = []
+    for idx, team_info in enumerate(teams, 1):
+        logger.info("")
+        logger.info("=" * 60)
+        logger.info(f"⚽ [{idx}/{len(teams)}] Обработка команды: {team_info['name']}")
+        logger.info("=" * 60)
+        
+        # Поле team во всех записях обработки команды (LOG_JSON)
+        with log_context(team=team_info['name']):
+            try:
+                matches, squad, players, table_hashes = scrape_team(
+                    scraper, team_info, report_queue, known_hashes.get(team_info['fbref_id'])
                 )
-                session.add(player)
-                session.flush()  # Получаем ID
-            
-            # Проверяем существующую статистику
-            existing_stat = session.query(PlayerStat).filter_by(
-                player_id=player.id,
-                season=SEASON,
-                competition=COMPETITION
-            ).first()
+                # Запись - в потоке писателя; при отставании писателя submit ждет
+                writer.submit(team_info['name'], load_team, team_info, matches, squad, players,
+                              SEASON, COMPETITION, table_hashes)
+                logger.info(f"✅ Данные команды {team_info['name']} переданы на запись")
             
-            if not existing_stat:
-                # Извлекаем статистику - ищем колонки с нужными данными
-                goals = 0
-                assists = 0
-                minutes = 0
-                
-                for col in standard_table.columns:
-                    col_str = str(col)
-                    
-                    # Ищем ТОЛЬКО Performance_Gls (не Per 90 Minutes)
-                    if 'Performance' in col_str and col_str.endswith('Gls'):
-                        try:
-                            goals = int(float(row[col])) if not pd.isna(row[col]) else 0
-                        except:
-                            pass
-                    
-                    # Ищем ТОЛЬКО Performance_Ast
-                    elif 'Performance' in col_str and col_str.endswith('Ast'):
-                        try:
-                            assists = int(float(row[col])) if not pd.isna(row[col]) else 0
-                        except:
-                            pass
-                    
-                    # Ищем Playing Time_Min
-                    elif 'Playing Time' in col_str and 'Min' in col_str:
-                        try:
-                            min_val = str(row[col]).replace(',', '')
-                            minutes = int(float(min_val)) if min_val.replace('.','').isdigit() else 0
-                        except:
-                            pass
-                
-                stat = PlayerStat(
-                    player_id=player.id,
-                    season=SEASON,
-                    competition=COMPETITION,
-                    goals=goals,
-                    assists=assists,
-                    minutes=minutes
-                )
-                session.add(stat)
-                players_added += 1
-                
-        except Exception as e:
-            logger.error(f"❌ Ошибка при обработке игрока: {e}")
-            continue
-    
-    if players_added > 0:
-        logger.info(f"✅ Добавлено статистики игроков: {players_added}")
-    else:
-        logger.warning("⚠️  Не удалось добавить статистику игроков")
-
-def main():
-    logger.info("=" * 60)
-    logger.info("🚀 Запуск FBref ETL процесса")
-    logger.info("=" * 60)
+            except Exception as e:
+                logger.error(f"❌ Ошибка при обработке {team_info['name']}: {e}")
+                failed_teams.append(team_info['name'])
+                continue
     
+    # 5. Match reports
+    if SCRAPE_MATCH_REPORTS:
+        load_match_reports(writer, scraper, report_queue)
+    
+    writer.close()
+    team_names = {team_info['name'] for team_info in teams}
+    failed_teams += [name for name in writer.failed if name in team_names]
+    return failed_teams
+
+def run_league(use_staging: bool):
+    """
+    Загрузка лиги: шаги 1-6 main(). Вызывается под staging.writer_lock.
+    Возвращает False, если данные не загружены или не опубликованы.
+    """
     # 1. Init DB
-    SessionLocal = init_db()
-    session = SessionLocal()
+    if use_staging:
+        import staging
+        SessionLocal = init_db(staging.prepare_staging(DB_PATH, STAGING_DB_PATH), bulk_load=True)
+    else:
+        SessionLocal = init_db(DB_PATH)
     logger.info("✅ База данных инициализирована")
     
+    # Отчеты, загруженные в прошлых запусках, повторно не скачиваются
+    session = SessionLocal()
+    loaded_reports = {
+        fbref_id for (fbref_id,) in session.query(Match.fbref_id).filter(Match.report_loaded.is_(True))
+    }
+    # Таблицы страниц команд, не изменившиеся с прошлой загрузки, не разбираются
+    known_hashes = load_table_hashes(session)
+    session.close()
+    report_queue = MatchReportQueue(done=loaded_reports)
+    
     # 2. Init Scraper
     scraper = FBRefScraper()
     logger.info("✅ Скрапер инициализирован")
@@ -346,7 +614,7 @@ def main():
     
     if not teams:
         logger.error("❌ Не удалось получить список команд. Выход.")
-        return
+        return False
 
     logger.info(f"✅ Найдено {len(teams)} команд")
     
@@ -355,38 +623,53 @@ def main():
         teams = teams[:DEBUG_TEAM_LIMIT]
         logger.info(f"🐛 Режим отладки: обрабатываем только {DEBUG_TEAM_LIMIT} команду(ы)")
     
-    # 4. Process each team
-    for idx, team_info in enumerate(teams, 1):
-        logger.info("")
-        logger.info("=" * 60)
-        logger.info(f"⚽ [{idx}/{len(teams)}] Обработка команды: {team_info['name']}")
-        logger.info("=" * 60)
-        
+    # Изменения этого запуска пишутся в change_log (cdc.py). Запуск закрывается и при исключении:
+    # пока он открыт, триггеры журнала записывают в него изменения следующих загрузок
+    session = SessionLocal()
+    run_id = start_run(session, 'run')
+    session.close()
+    status = 'failed'
+    try:
+        failed_teams = load_league_teams(SessionLocal, scraper, teams, report_queue, known_hashes)
+        session = SessionLocal()
         try:
-            # Upsert Team
-            team = process_team(session, team_info)
-            logger.info(f"✅ Команда сохранена в БД")
-            
-            # Get Match Logs
-            logger.info("📊 Получение логов матчей...")
-            match_df = scraper.get_match_logs(team_info['url'])
-            process_matches(session, team, match_df)
-            logger.info(f"✅ Матчи обработаны")
-            
-            # Get Stats
-            logger.info("📈 Получение статистики команды...")
-            stats = scraper.get_team_stats(team_info['url'])
-            process_squad_stats(session, team, stats)
-            logger.info(f"✅ Статистика обработана")
-            
-            # Checkpointing
-            session.commit()
-            logger.info(f"💾 Данные команды {team_info['name']} сохранены")
-            
-        except Exception as e:
-            logger.error(f"❌ Ошибка при обработке {team_info['name']}: {e}")
-            session.rollback()
-            continue
+            run_season_checks(session, run_id, SEASON, COMPETITION)
+        finally:
+            session.close()
+        status = 'failed' if failed_teams else 'success'
+    finally:
+        session = SessionLocal()
+        try:
+            finish_run(session, run_id, status)
+        finally:
+            session.close()
+    
+    # 6. Publish
+    if use_staging:
+        if failed_teams:
+            # Частично загруженная лига не публикуется - рабочая база остается прежней
+            logger.error(f"❌ Не обработаны команды: {', '.join(failed_teams)}. "
+                         f"Данные не опубликованы, staging база: {STAGING_DB_PATH}")
+            return False
+        staging.publish(STAGING_DB_PATH, DB_PATH, SEASON, COMPETITION)
+    return True
+
+def main():
+    setup_logging()
+    logger.info("=" * 60)
+    logger.info("🚀 Запуск FBref ETL процесса")
+    logger.info("=" * 60)
+    
+    use_staging = USE_STAGING and DB_PATH.startswith('sqlite')
+    from staging import writer_lock
+    # Запуск через staging держит рабочую базу от копирования до публикации: иначе публикация
+    # затерла бы то, что за это время записали планировщик и воркеры (scheduler.py, jobs.py)
+    with writer_lock(DB_PATH):
+        if not run_league(use_staging):
+            return
+    
+    # 7. Производные файлы по опубликованным данным: индекс похожих игроков и хранилище признаков
+    refresh_derived(DB_PATH)
     
     logger.info("")
     logger.info("=" * 60)
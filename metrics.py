@@ -0,0 +1,131 @@
+"""
+Производные показатели: форма команд (скользящее окно по матчам) и показатели игроков на 90 минут.
+
+Считаются векторно (groupby + rolling pandas) за один проход на турнир-сезон и хранятся
+в узких индексированных таблицах team_form и player_per90 - дашборды читают готовые
+значения вместо оконных запросов по всей истории. Загрузчик обновляет их только для
+команды, чьи данные только что загружены (refresh_team_form / refresh_player_per90 с team_ids).
+"""
+
+import logging
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+from db import Match, TeamMatchStat, PlayerStat, TeamForm, PlayerPer90, copy_rows
+from config import FORM_WINDOW, PER90_MIN_MINUTES
+
+logger = logging.getLogger(__name__)
+
+PER90_COLUMNS = ['goals', 'assists', 'xg', 'npxg', 'xag']
+
+def compute_team_form(df: pd.DataFrame, window=FORM_WINDOW):
+    """
+    Форма по сыгранным матчам (колонки team_id, match_id, date, goals_for, goals_against, xg, xga).
+    Возвращает DataFrame с колонками form, points, goals_for, goals_against, xg, xga за последние window матчей.
+    """
+    df = df.sort_values(['team_id', 'date', 'match_id']).reset_index(drop=True)
+    gf, ga = df['goals_for'].to_numpy(), df['goals_against'].to_numpy()
+    df['result'] = np.select([gf > ga, gf == ga], ['W', 'D'], 'L')
+    df['points'] = np.select([gf > ga, gf == ga], [3, 1], 0)
+
+    groups = df.groupby('team_id', sort=False)
+    rolled = groups[['goals_for', 'goals_against', 'xg', 'xga']].rolling(window, min_periods=1).mean()
+    df[['goals_for', 'goals_against', 'xg', 'xga']] = rolled.reset_index(level=0, drop=True)
+    df['points'] = groups['points'].rolling(window, min_periods=1).sum().reset_index(level=0, drop=True).astype(int)
+
+    # Строка формы: сдвинутые на 0..window-1 матчей результаты, самый старый слева
+    form = pd.Series('', index=df.index)
+    for lag in range(window - 1, -1, -1):
+        form = form + groups['result'].shift(lag).fillna('')
+    df['form'] = form
+    return df.drop(columns='result')
+
+def compute_per90(df: pd.DataFrame, min_minutes=PER90_MIN_MINUTES):
+    """Показатели PER90_COLUMNS на 90 минут; игроки с минутами меньше min_minutes отбрасываются"""
+    df = df[df['minutes'].fillna(0) >= max(min_minutes, 1)].copy()
+    df[PER90_COLUMNS] = df[PER90_COLUMNS].astype(float).div(df['minutes'].astype(float), axis=0) * 90
+    return df
+
+def _as_records(df: pd.DataFrame, columns):
+    """DataFrame -> list of dict без NaN (NULL в базе)"""
+    df = df[columns].astype(object).where(df[columns].notna(), None)
+    return df.to_dict('records')
+
+def refresh_team_form(session: Session, team_ids=None, season=None, competition=None):
+    """
+    Пересчитывает team_form для команд team_ids (None - все) в турнире-сезоне (None - все).
+    Коммит - на стороне вызывающего кода.
+    """
+    query = session.query(
+        TeamMatchStat.team_id, TeamMatchStat.match_id, TeamMatchStat.date, Match.season, Match.competition,
+        TeamMatchStat.goals_for, TeamMatchStat.goals_against, TeamMatchStat.xg, TeamMatchStat.xga,
+    ).join(Match, TeamMatchStat.match_id == Match.id).filter(TeamMatchStat.goals_for.isnot(None))
+    deleted = session.query(TeamForm)
+    if team_ids is not None:
+        query = query.filter(TeamMatchStat.team_id.in_(list(team_ids)))
+        deleted = deleted.filter(TeamForm.team_id.in_(list(team_ids)))
+    if season is not None:
+        query = query.filter(Match.season == season)
+        deleted = deleted.filter(TeamForm.season == season)
+    if competition is not None:
+        query = query.filter(Match.competition == competition)
+        deleted = deleted.filter(TeamForm.competition == competition)
+    deleted.delete(synchronize_session=False)
+
+    df = pd.DataFrame(query.all(), columns=[
+        'team_id', 'match_id', 'date', 'season', 'competition', 'goals_for', 'goals_against', 'xg', 'xga'
+    ])
+    if df.empty:
+        return 0
+
+    # Окно не переходит через границу турнира-сезона
+    frames = [compute_team_form(group) for _, group in df.groupby(['season', 'competition'], dropna=False)]
+    form = pd.concat(frames, ignore_index=True)
+    copy_rows(session, TeamForm, _as_records(form, [
+        'team_id', 'match_id', 'date', 'season', 'competition',
+        'form', 'points', 'goals_for', 'goals_against', 'xg', 'xga'
+    ]))
+    return len(form)
+
+def refresh_player_per90(session: Session, team_ids=None, season=None, competition=None):
+    """Пересчитывает player_per90 для команд team_ids (None - все) в турнире-сезоне (None - все)"""
+    query = session.query(
+        PlayerStat.player_id, PlayerStat.team_id, PlayerStat.season, PlayerStat.competition,
+        PlayerStat.minutes, *(getattr(PlayerStat, column) for column in PER90_COLUMNS)
+    )
+    deleted = session.query(PlayerPer90)
+    if team_ids is not None:
+        query = query.filter(PlayerStat.team_id.in_(list(team_ids)))
+        deleted = deleted.filter(PlayerPer90.team_id.in_(list(team_ids)))
+    if season is not None:
+        query = query.filter(PlayerStat.season == season)
+        deleted = deleted.filter(PlayerPer90.season == season)
+    if competition is not None:
+        query = query.filter(PlayerStat.competition == competition)
+        deleted = deleted.filter(PlayerPer90.competition == competition)
+    deleted.delete(synchronize_session=False)
+
+    df = pd.DataFrame(query.all(), columns=['player_id', 'team_id', 'season', 'competition', 'minutes', *PER90_COLUMNS])
+    per90 = compute_per90(df)
+    if per90.empty:
+        return 0
+    copy_rows(session, PlayerPer90, _as_records(
+        per90, ['player_id', 'team_id', 'season', 'competition', 'minutes', *PER90_COLUMNS]
+    ))
+    return len(per90)
+
+def main():
+    """Полный пересчет производных показателей"""
+    from db import init_db
+    from config import DB_PATH
+    from log_setup import setup_logging
+    setup_logging(log_file=None)
+    session = init_db(DB_PATH)()
+    forms = refresh_team_form(session)
+    per90 = refresh_player_per90(session)
+    session.commit()
+    session.close()
+    logger.info(f"✅ Пересчитано: форма {forms} строк, per-90 {per90} строк")
+
+if __name__ == '__main__':
+    main()
@@ -1,68 +1,102 @@
--- Примеры SQL запросов для football_data.db
--- Можно выполнять через sqlite3 или любой SQL клиент
+-- Каталог SQL запросов для football_data.db (catalog.py, query_db.py)
+-- Запросы совместимы с SQLite и PostgreSQL. Формат:
+--   -- name: <имя>                  начало запроса
+--   -- <текст>                      описание
+--   -- example: limit=10, team=...  значения параметров для python catalog.py bench / run
+--   -- full-scan: matches - <почему> запросу по смыслу нужен полный просмотр таблицы (причина обязательна)
+-- Параметры - в стиле :name (sqlite3: .param set :limit 10; psql - через SQLAlchemy text()).
+-- python catalog.py explain проверяет план каждого запроса: шаг SCAN по matches или player_stats
+-- (в том числе SCAN ... USING INDEX - все строки в порядке индекса) без отметки full-scan
+-- означает, что не хватает индекса. Индексным считается только SEARCH.
 
 -- ============================================
 -- 🏆 ТУРНИРНАЯ ТАБЛИЦА (ГЛАВНЫЙ ЗАПРОС)
 -- ============================================
 
--- Полная турнирная таблица с очками, победами, ничьими, поражениями
--- ВАЖНО: home_score = ВСЕГДА голы команды (GF), away_score = ВСЕГДА голы соперника (GA)
-SELECT 
-    t.name as "Команда",
-    COUNT(m.id) as "М",
-    SUM(CASE WHEN m.home_score > m.away_score THEN 1 ELSE 0 END) as "В",
-    SUM(CASE WHEN m.home_score = m.away_score THEN 1 ELSE 0 END) as "Н",
-    SUM(CASE WHEN m.home_score < m.away_score THEN 1 ELSE 0 END) as "П",
-    SUM(m.home_score) as "ГЗ",
-    SUM(m.away_score) as "ГП",
-    SUM(m.home_score) - SUM(m.away_score) as "РМ",
-    SUM(CASE 
-        WHEN m.home_score > m.away_score THEN 3
-        WHEN m.home_score = m.away_score THEN 1
-        ELSE 0 
-    END) as "Очки"
+-- name: standings
+-- Полная турнирная таблица с очками, победами, ничьими, поражениями.
+-- ВАЖНО: team_match_stats хранит матч с точки зрения каждой команды:
+-- goals_for = голы команды (GF), goals_against = голы соперника (GA)
+-- Таблица одного турнира одного сезона: в базе их может быть несколько
+-- example: season=2023-2024, competition=Premier League
+SELECT
+    t.name as team,
+    COUNT(tms.match_id) as matches,
+    SUM(tms.goals_for) as goals_scored,
+    SUM(tms.goals_against) as goals_conceded,
+    SUM(tms.goals_for) - SUM(tms.goals_against) as gd,
+    SUM(CASE
+        WHEN tms.goals_for > tms.goals_against THEN 3
+        WHEN tms.goals_for = tms.goals_against THEN 1
+        ELSE 0
+    END) as points,
+    SUM(CASE WHEN tms.goals_for > tms.goals_against THEN 1 ELSE 0 END) as wins,
+    SUM(CASE WHEN tms.goals_for = tms.goals_against THEN 1 ELSE 0 END) as draws,
+    SUM(CASE WHEN tms.goals_for < tms.goals_against THEN 1 ELSE 0 END) as losses
 FROM matches m
-JOIN teams t ON m.home_team_id = t.id
-WHERE m.home_score IS NOT NULL
+JOIN team_match_stats tms ON tms.match_id = m.id
+JOIN teams t ON tms.team_id = t.id
+WHERE m.season = :season AND m.competition = :competition AND tms.goals_for IS NOT NULL
 GROUP BY t.id
-ORDER BY "Очки" DESC, "РМ" DESC, "ГЗ" DESC;
+ORDER BY points DESC, (SUM(tms.goals_for) - SUM(tms.goals_against)) DESC, SUM(tms.goals_for) DESC;
 
 -- ============================================
 -- 📊 АГРЕГИРОВАННАЯ СТАТИСТИКА КОМАНД (из игроков)
 -- ============================================
 
-SELECT 
-    t.name as "Команда",
-    COUNT(DISTINCT p.id) as "Игроков",
-    SUM(ps.goals) as "Всего голов",
-    SUM(ps.assists) as "Всего ассистов",
-    SUM(ps.minutes) as "Всего минут",
-    MAX(ps.goals) as "Топ голов"
+-- name: squad_totals
+-- Голы, ассисты и минуты команды за сезон турнира - суммы по ее игрокам (индекс ix_player_stats_season)
+-- example: season=2023-2024, competition=Premier League
+SELECT
+    t.name as team,
+    COUNT(DISTINCT p.id) as players,
+    SUM(ps.goals) as total_goals,
+    SUM(ps.assists) as total_assists,
+    SUM(ps.minutes) as total_minutes,
+    ROUND(AVG(ps.goals), 2) as avg_goals_per_player,
+    MAX(ps.goals) as top_scorer_goals
 FROM player_stats ps
 JOIN players p ON ps.player_id = p.id
-JOIN teams t ON p.team_id = t.id
+JOIN teams t ON ps.team_id = t.id
+WHERE ps.season = :season AND ps.competition = :competition
 GROUP BY t.id
-ORDER BY "Всего голов" DESC;
+ORDER BY total_goals DESC;
 
 -- ============================================
 -- 1. БАЗОВЫЕ ЗАПРОСЫ
 -- ============================================
 
+-- name: teams
 -- Все команды
-SELECT * FROM teams;
+SELECT id, name, fbref_id FROM teams ORDER BY id;
 
--- Все матчи
+-- name: matches
+-- Все матчи, сначала последние
+-- full-scan: matches - запрос возвращает таблицу целиком
 SELECT * FROM matches ORDER BY date DESC;
 
+-- name: players
 -- Все игроки
 SELECT * FROM players;
 
+-- name: database_info
+-- Количество записей в основных таблицах
+-- full-scan: matches, player_stats - COUNT(*) по всей таблице
+SELECT
+    (SELECT COUNT(*) FROM teams) AS teams,
+    (SELECT COUNT(*) FROM players) AS players,
+    (SELECT COUNT(*) FROM matches) AS matches,
+    (SELECT COUNT(*) FROM team_match_stats) AS team_match_stats,
+    (SELECT COUNT(*) FROM squad_stats) AS squad_stats,
+    (SELECT COUNT(*) FROM player_stats) AS player_stats;
+
 -- ============================================
 -- 2. СТАТИСТИКА КОМАНД
 -- ============================================
 
+-- name: squad_attack
 -- Команды с наибольшим количеством голов
-SELECT 
+SELECT
     t.name,
     ss.goals_for,
     ss.goals_against,
@@ -72,8 +106,9 @@ FROM squad_stats ss
 JOIN teams t ON ss.team_id = t.id
 ORDER BY ss.goals_for DESC;
 
+-- name: squad_defense
 -- Команды с лучшей защитой (меньше пропущенных)
-SELECT 
+SELECT
     t.name,
     ss.goals_against,
     ss.tackles,
@@ -87,23 +122,19 @@ ORDER BY ss.goals_against ASC;
 -- 3. АНАЛИЗ МАТЧЕЙ
 -- ============================================
 
--- Матчи конкретной команды (например, Arsenal)
-SELECT 
-    m.date,
-    CASE 
-        WHEN m.home_team_id = t.id THEN 'Дома'
-        ELSE 'В гостях'
-    END as venue,
-    m.home_score || '-' || m.away_score as score,
-    m.competition,
-    m.attendance
-FROM matches m
-JOIN teams t ON (m.home_team_id = t.id OR m.away_team_id = t.id)
-WHERE t.name LIKE '%Arsenal%'
-ORDER BY m.date DESC;
+-- name: team_matches
+-- Матчи команды с ее точки зрения (индекс team_match_stats по team_id, date)
+-- example: team_id=1
+SELECT tms.date, tms.goals_for, tms.goals_against, tms.is_home, m.competition, m.attendance
+FROM team_match_stats tms
+JOIN matches m ON tms.match_id = m.id
+WHERE tms.team_id = :team_id
+ORDER BY tms.date DESC;
 
--- Матчи с наибольшей посещаемостью
-SELECT 
+-- name: top_attendance
+-- Матчи с наибольшей посещаемостью (индекс ix_matches_attendance: первые :limit строк по убыванию)
+-- example: limit=10
+SELECT
     m.date,
     ht.name as home_team,
     at.name as away_team,
@@ -114,10 +145,13 @@ JOIN teams ht ON m.home_team_id = ht.id
 LEFT JOIN teams at ON m.away_team_id = at.id
 WHERE m.attendance IS NOT NULL
 ORDER BY m.attendance DESC
-LIMIT 10;
+LIMIT :limit;
 
--- Результативные матчи (больше всего голов)
-SELECT 
+-- name: highest_scoring
+-- Результативные матчи (больше всего голов). Индекс по выражению home_score + away_score;
+-- условие по тому же выражению дает SEARCH (сумма не NULL - счет известен)
+-- example: limit=10
+SELECT
     m.date,
     ht.name as home_team,
     at.name as away_team,
@@ -126,45 +160,103 @@ SELECT
 FROM matches m
 JOIN teams ht ON m.home_team_id = ht.id
 LEFT JOIN teams at ON m.away_team_id = at.id
-WHERE m.home_score IS NOT NULL
+WHERE m.home_score + m.away_score >= 0
 ORDER BY total_goals DESC
-LIMIT 10;
+LIMIT :limit;
+
+-- name: head_to_head
+-- Личные встречи двух команд (индекс по opponent_id, team_id)
+-- example: team=Arsenal, opponent=Tottenham
+SELECT
+    tms.date,
+    t.name as team,
+    o.name as opponent,
+    CASE WHEN tms.is_home THEN 'Дома' ELSE 'В гостях' END as venue,
+    tms.goals_for || '-' || tms.goals_against as score,
+    tms.xg,
+    tms.xga
+FROM team_match_stats tms
+JOIN teams t ON tms.team_id = t.id
+JOIN teams o ON tms.opponent_id = o.id
+WHERE t.name = :team AND o.name = :opponent
+ORDER BY tms.date DESC;
+
+-- name: home_away
+-- Дома/в гостях за сезон турнира: очки и xG
+-- example: season=2023-2024, competition=Premier League
+SELECT
+    t.name,
+    CASE WHEN tms.is_home THEN 'Дома' ELSE 'В гостях' END as venue,
+    COUNT(*) as matches,
+    SUM(CASE
+        WHEN tms.goals_for > tms.goals_against THEN 3
+        WHEN tms.goals_for = tms.goals_against THEN 1
+        ELSE 0
+    END) as points,
+    ROUND(CAST(AVG(tms.xg) AS NUMERIC), 2) as avg_xg,
+    ROUND(CAST(AVG(tms.xga) AS NUMERIC), 2) as avg_xga
+FROM matches m
+JOIN team_match_stats tms ON tms.match_id = m.id
+JOIN teams t ON tms.team_id = t.id
+WHERE m.season = :season AND m.competition = :competition AND tms.goals_for IS NOT NULL
+GROUP BY t.id, tms.is_home
+ORDER BY t.name, venue;
+
+-- name: matches_between
+-- Матчи в определенный период (индекс по дате)
+-- example: date_from=2024-01-01, date_to=2024-12-31
+SELECT
+    m.date,
+    ht.name as home_team,
+    at.name as away_team,
+    m.home_score || '-' || m.away_score as score
+FROM matches m
+JOIN teams ht ON m.home_team_id = ht.id
+LEFT JOIN teams at ON m.away_team_id = at.id
+WHERE m.date BETWEEN :date_from AND :date_to
+ORDER BY m.date DESC;
 
 -- ============================================
 -- 4. СТАТИСТИКА ИГРОКОВ
 -- ============================================
 
--- Топ бомбардиров
-SELECT 
+-- name: top_scorers
+-- Топ бомбардиров (индекс ix_player_stats_goals: первые :limit строк по убыванию)
+-- example: limit=20
+SELECT
     p.name,
-    t.name as team,
+    t.name as team_name,
     ps.goals,
     ps.assists,
     ps.minutes,
     ps.season
 FROM player_stats ps
 JOIN players p ON ps.player_id = p.id
-JOIN teams t ON p.team_id = t.id
+JOIN teams t ON ps.team_id = t.id
 WHERE ps.goals IS NOT NULL
 ORDER BY ps.goals DESC
-LIMIT 20;
+LIMIT :limit;
 
--- Игроки с лучшим соотношением голы/минуты
-SELECT 
+-- name: minutes_per_goal
+-- Игроки с лучшим соотношением голы/минуты (индекс ix_player_stats_goals отбирает забивших)
+-- example: limit=20
+SELECT
     p.name,
     t.name as team,
     ps.goals,
     ps.minutes,
-    ROUND(CAST(ps.minutes AS FLOAT) / ps.goals, 2) as minutes_per_goal
+    ROUND(CAST(ps.minutes AS NUMERIC) / ps.goals, 2) as minutes_per_goal
 FROM player_stats ps
 JOIN players p ON ps.player_id = p.id
-JOIN teams t ON p.team_id = t.id
+JOIN teams t ON ps.team_id = t.id
 WHERE ps.goals > 0 AND ps.minutes > 0
 ORDER BY minutes_per_goal ASC
-LIMIT 20;
+LIMIT :limit;
 
--- Лучшие ассистенты
-SELECT 
+-- name: top_assists
+-- Лучшие ассистенты (индекс ix_player_stats_assists: первые :limit строк по убыванию)
+-- example: limit=20
+SELECT
     p.name,
     t.name as team,
     ps.assists,
@@ -173,28 +265,35 @@ SELECT
     ps.season
 FROM player_stats ps
 JOIN players p ON ps.player_id = p.id
-JOIN teams t ON p.team_id = t.id
+JOIN teams t ON ps.team_id = t.id
 WHERE ps.assists IS NOT NULL
 ORDER BY ps.assists DESC
-LIMIT 20;
+LIMIT :limit;
+
+-- name: discipline
+-- Игроки с желтыми/красными карточками
+-- Без LIMIT и с OR по двум колонкам: карточки есть у большинства игроков, поэтому индексы
+-- по yellow_cards и red_cards не сократили бы чтение, а только замедлили бы загрузку
+-- full-scan: player_stats - выборка большей части таблицы без LIMIT
+SELECT
+    p.name,
+    t.name as team,
+    ps.yellow_cards,
+    ps.red_cards,
+    (ps.yellow_cards + ps.red_cards * 2) as discipline_score
+FROM player_stats ps
+JOIN players p ON ps.player_id = p.id
+JOIN teams t ON ps.team_id = t.id
+WHERE ps.yellow_cards > 0 OR ps.red_cards > 0
+ORDER BY discipline_score DESC;
 
 -- ============================================
 -- 5. АГРЕГИРОВАННАЯ СТАТИСТИКА
 -- ============================================
 
--- Общее количество записей в каждой таблице
-SELECT 'Teams' as table_name, COUNT(*) as count FROM teams
-UNION ALL
-SELECT 'Players', COUNT(*) FROM players
-UNION ALL
-SELECT 'Matches', COUNT(*) FROM matches
-UNION ALL
-SELECT 'Squad Stats', COUNT(*) FROM squad_stats
-UNION ALL
-SELECT 'Player Stats', COUNT(*) FROM player_stats;
-
--- Средняя посещаемость по командам (домашние матчи)
-SELECT 
+-- name: home_attendance
+-- Средняя посещаемость по командам (домашние матчи; матчи команды - по индексу home_team_id)
+SELECT
     t.name,
     COUNT(m.id) as home_matches,
     ROUND(AVG(m.attendance), 0) as avg_attendance,
@@ -205,60 +304,73 @@ WHERE m.attendance IS NOT NULL
 GROUP BY t.id
 ORDER BY avg_attendance DESC;
 
--- Статистика голов по командам из матчей
-SELECT 
-    t.name,
+-- name: goals_from_matches
+-- Голы забитые и пропущенные по командам из счета матчей
+-- (JOIN ... OR: SQLite ищет матчи команды по двум индексам, MULTI-INDEX OR)
+SELECT
+    t.name as team,
     COUNT(DISTINCT m.id) as matches_played,
-    SUM(CASE WHEN m.home_team_id = t.id THEN m.home_score 
+    SUM(CASE WHEN m.home_team_id = t.id THEN m.home_score
              WHEN m.away_team_id = t.id THEN m.away_score END) as goals_scored,
-    SUM(CASE WHEN m.home_team_id = t.id THEN m.away_score 
-             WHEN m.away_team_id = t.id THEN m.home_score END) as goals_conceded,
-    SUM(CASE WHEN m.home_team_id = t.id THEN m.home_score 
-             WHEN m.away_team_id = t.id THEN m.away_score END) - 
-    SUM(CASE WHEN m.home_team_id = t.id THEN m.away_score 
-             WHEN m.away_team_id = t.id THEN m.home_score END) as goal_difference
+    SUM(CASE WHEN m.home_team_id = t.id THEN m.away_score
+             WHEN m.away_team_id = t.id THEN m.home_score END) as goals_conceded
 FROM teams t
 LEFT JOIN matches m ON (m.home_team_id = t.id OR m.away_team_id = t.id)
 WHERE m.home_score IS NOT NULL
 GROUP BY t.id
-ORDER BY goal_difference DESC;
+ORDER BY goals_scored DESC;
 
 -- ============================================
 -- 6. ПОИСК И ФИЛЬТРАЦИЯ
 -- ============================================
 
--- Найти игрока по имени
-SELECT 
+-- name: find_player
+-- Найти игрока по имени (шаблон LIKE)
+-- example: pattern=%Saka%
+SELECT
     p.name,
     p.position,
     p.nationality,
     t.name as team
 FROM players p
 JOIN teams t ON p.team_id = t.id
-WHERE p.name LIKE '%Saka%';
+WHERE p.name LIKE :pattern;
 
--- Матчи в определенный период
-SELECT 
-    m.date,
-    ht.name as home_team,
-    at.name as away_team,
-    m.home_score || '-' || m.away_score as score
-FROM matches m
-JOIN teams ht ON m.home_team_id = ht.id
-LEFT JOIN teams at ON m.away_team_id = at.id
-WHERE m.date BETWEEN '2024-01-01' AND '2024-12-31'
-ORDER BY m.date DESC;
+-- name: player_details
+-- Позиция и команда игроков по списку id (один запрос на все найденные; список - catalog.expand_list)
+-- example: player_ids=1
+SELECT p.id, p.position, t.name AS team_name
+FROM players p LEFT JOIN teams t ON p.team_id = t.id
+WHERE p.id IN (:player_ids);
 
--- Игроки с желтыми/красными карточками
-SELECT 
-    p.name,
-    t.name as team,
-    ps.yellow_cards,
-    ps.red_cards,
-    (ps.yellow_cards + ps.red_cards * 2) as discipline_score
-FROM player_stats ps
-JOIN players p ON ps.player_id = p.id
-JOIN teams t ON p.team_id = t.id
-WHERE ps.yellow_cards > 0 OR ps.red_cards > 0
-ORDER BY discipline_score DESC;
+-- ============================================
+-- 7. РЕЙТИНГИ И ФОРМА (ratings.py, metrics.py)
+-- ============================================
+
+-- name: ratings_as_of
+-- Рейтинг Эло команд на дату: последняя строка team_ratings до даты
+-- example: as_of=9999-12-31, limit=20
+SELECT t.name AS team, r.elo, r.xg_elo, r.date
+FROM teams t
+JOIN team_ratings r ON r.id = (
+    SELECT r2.id FROM team_ratings r2
+    WHERE r2.team_id = t.id AND r2.date <= :as_of
+    ORDER BY r2.date DESC, r2.id DESC
+    LIMIT 1
+)
+ORDER BY r.elo DESC
+LIMIT :limit;
 
+-- name: current_form
+-- Текущая форма команд (последние матчи) из предрасчитанной таблицы team_form
+-- example: limit=20
+SELECT t.name AS team, f.form, f.points, f.goals_for, f.goals_against, f.xg, f.xga
+FROM teams t
+JOIN team_form f ON f.id = (
+    SELECT f2.id FROM team_form f2
+    WHERE f2.team_id = t.id
+    ORDER BY f2.date DESC, f2.id DESC
+    LIMIT 1
+)
+ORDER BY f.points DESC, f.goals_for - f.goals_against DESC
+LIMIT :limit;
@@ -1,166 +1,170 @@
 """
 Примеры запросов к базе данных football_data.db
+
+Простые запросы выполняются напрямую через DB-API (для SQLite - модуль sqlite3),
+pandas и SQLAlchemy импортируются только там, где они действительно нужны,
+поэтому `python etl.py query ...` стартует быстро.
+SQL запросов берется по имени из каталога queries.sql (catalog.py), где их планы
+проверяет `python catalog.py explain`.
 """
 
+import os
 import sqlite3
-import pandas as pd
-from db import init_db, Team, Player, Match, SquadStat, PlayerStat
-from sqlalchemy import func, desc
+from catalog import query_sql, expand_list
+from config import DB_PATH, TEAM_ALIASES, SEASON, COMPETITION
 
 def connect_db():
-    """Подключение к базе данных"""
-    SessionLocal = init_db()
+    """Подключение к базе данных через ORM (SQLite или PostgreSQL - см. DB_PATH в config.py)"""
+    from db import init_db
+    SessionLocal = init_db(DB_PATH)
     return SessionLocal()
 
+def fetch_rows(query, params=None):
+    """
+    Выполняет SQL запрос (параметры в стиле :name) и возвращает список dict.
+    SQLite читается модулем sqlite3 в режиме только для чтения, без SQLAlchemy.
+    """
+    if DB_PATH.startswith('sqlite:///'):
+        path = DB_PATH[len('sqlite:///'):]
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"База данных не найдена: {path}")
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            return [dict(row) for row in conn.execute(query, params or {})]
+        finally:
+            conn.close()
+    
+    from sqlalchemy import text
+    from db import get_engine
+    with get_engine(DB_PATH).connect() as conn:
+        return [dict(row) for row in conn.execute(text(query), params or {}).mappings()]
+
+_search_indexes = {}
+
+def get_search_index(kind):
+    """Индекс поиска ('team' или 'player'), строится один раз за процесс"""
+    if kind not in _search_indexes:
+        from search import build_team_index, build_player_index
+        build = build_team_index if kind == 'team' else build_player_index
+        table = 'teams' if kind == 'team' else 'players'
+        rows = fetch_rows(f"SELECT id, name FROM {table}")
+        _search_indexes[kind] = build((row['id'], row['name']) for row in rows)
+    return _search_indexes[kind]
+
+def find_team(team_name):
+    """
+    Находит команду по имени/псевдониму (нечеткий поиск без учета регистра и диакритики).
+    Возвращает dict (id, name) или None.
+    """
+    # Точное совпадение с названием или псевдонимом не требует построения индекса (и импорта NumPy)
+    wanted = team_name.strip().casefold()
+    for team in fetch_rows("SELECT id, name FROM teams"):
+        if wanted in (name.casefold() for name in (team['name'], *TEAM_ALIASES.get(team['name'], ()))):
+            return team
+    
+    hits = get_search_index('team').search(team_name, limit=3)
+    if not hits:
+        return None
+    if len(hits) > 1 and hits[1][0] >= hits[0][0] - 0.05:
+        # Неоднозначный запрос вроде 'Manchester' - берем лучший, но показываем варианты
+        print(f"ℹ️  Найдено несколько команд: {', '.join(name for _, _, name in hits)}")
+    return {'id': hits[0][1], 'name': hits[0][2]}
+
+def read_sql(query, params=None):
+    """Выполняет SQL запрос через SQLAlchemy и возвращает DataFrame"""
+    import pandas as pd
+    from sqlalchemy import text
+    from db import get_engine
+    with get_engine(DB_PATH).connect() as conn:
+        return pd.read_sql_query(text(query), conn, params=params)
+
 def query_all_teams():
     """Получить все команды"""
-    session = connect_db()
-    teams = session.query(Team).all()
+    teams = fetch_rows(query_sql('teams'))
     
     print("\n" + "=" * 60)
     print("⚽ ВСЕ КОМАНДЫ В БАЗЕ ДАННЫХ")
     print("=" * 60)
     
     for team in teams:
-        print(f"ID: {team.id:2d} | {team.name:20s} | FBRef ID: {team.fbref_id}")
+        print(f"ID: {team['id']:2d} | {team['name']:20s} | FBRef ID: {team['fbref_id']}")
     
     print(f"\nВсего команд: {len(teams)}")
     return teams
 
 def query_team_matches(team_name="Arsenal"):
     """Получить все матчи конкретной команды"""
-    session = connect_db()
-    
-    team = session.query(Team).filter(Team.name.like(f"%{team_name}%")).first()
+    team = find_team(team_name)
     
     if not team:
         print(f"❌ Команда '{team_name}' не найдена")
         return
     
-    matches = session.query(Match).filter(
-        (Match.home_team_id == team.id) | (Match.away_team_id == team.id)
-    ).order_by(Match.date.desc()).all()
+    # Матчи с точки зрения команды - из таблицы фактов (индекс team_id, date)
+    matches = fetch_rows(query_sql('team_matches'), {'team_id': team['id']})
     
     print("\n" + "=" * 60)
-    print(f"📅 МАТЧИ КОМАНДЫ: {team.name}")
+    print(f"📅 МАТЧИ КОМАНДЫ: {team['name']}")
     print("=" * 60)
     
     for match in matches:
-        date = match.date.strftime("%Y-%m-%d") if match.date else "N/A"
-        score = f"{match.home_score}-{match.away_score}" if match.home_score is not None else "vs"
-        # Используем поле venue напрямую
-        venue = "🏠 Дома" if match.venue == 'Home' else "✈️  В гостях"
-        print(f"{date} | {score:5s} | {venue} | {match.competition}")
+        date = str(match['date']) if match['date'] else "N/A"
+        score = f"{match['goals_for']}-{match['goals_against']}" if match['goals_for'] is not None else "vs"
+        venue = "🏠 Дома" if match['is_home'] else "✈️  В гостях"
+        print(f"{date} | {score:5s} | {venue} | {match['competition']}")
     
     print(f"\nВсего матчей: {len(matches)}")
     return matches
 
-def query_squad_stats():
-    """Получить агрегированную статистику команд из данных игроков"""
-    conn = sqlite3.connect('football_data.db')
-    
-    # SQL запрос для агрегированной статистики команд
-    query = """
-    SELECT 
-        t.name as team,
-        COUNT(DISTINCT p.id) as players,
-        SUM(ps.goals) as total_goals,
-        SUM(ps.assists) as total_assists,
-        SUM(ps.minutes) as total_minutes,
-        ROUND(AVG(ps.goals), 2) as avg_goals_per_player,
-        MAX(ps.goals) as top_scorer_goals
-    FROM player_stats ps
-    JOIN players p ON ps.player_id = p.id
-    JOIN teams t ON p.team_id = t.id
-    GROUP BY t.id
-    ORDER BY total_goals DESC
-    """
-    
-    df = pd.read_sql_query(query, conn)
-    conn.close()
+def query_squad_stats(season=SEASON, competition=COMPETITION):
+    """Получить агрегированную статистику команд за сезон турнира из данных игроков"""
+    rows = fetch_rows(query_sql('squad_totals'), {'season': season, 'competition': competition})
     
     print("\n" + "=" * 70)
-    print("📊 АГРЕГИРОВАННАЯ СТАТИСТИКА КОМАНД (из данных игроков)")
+    print(f"📊 АГРЕГИРОВАННАЯ СТАТИСТИКА КОМАНД (из данных игроков), {competition} {season}")
     print("=" * 70)
     
-    if not df.empty:
+    if rows:
         print(f"{'Команда':<20} | {'Игроков':<8} | {'Голы':<6} | {'Ассисты':<8} | {'Минуты':<10} | {'Топ'}")
         print("-" * 70)
         
-        for _, row in df.iterrows():
+        for row in rows:
             print(f"{row['team']:<20} | {row['players']:<8} | {row['total_goals']:<6} | {row['total_assists']:<8} | {row['total_minutes']:<10} | {row['top_scorer_goals']}")
         
-        print(f"\nВсего команд: {len(df)}")
+        print(f"\nВсего команд: {len(rows)}")
     else:
         print("⚠️  Нет данных о статистике игроков")
     
-    return df
+    return rows
 
-def query_squad_stats_from_matches():
-    """Получить статистику команд из результатов матчей"""
-    conn = sqlite3.connect('football_data.db')
-    
-    # SQL запрос для статистики из матчей
-    # ВАЖНО: В нашей модели данных home_score = ВСЕГДА голы команды (GF),
-    # away_score = ВСЕГДА голы соперника (GA), независимо от venue
-    query = """
-    SELECT 
-        t.name as team,
-        COUNT(m.id) as matches,
-        SUM(m.home_score) as goals_scored,
-        SUM(m.away_score) as goals_conceded,
-        SUM(CASE 
-            WHEN m.home_score > m.away_score THEN 3
-            WHEN m.home_score = m.away_score THEN 1
-            ELSE 0 
-        END) as points,
-        SUM(CASE WHEN m.home_score > m.away_score THEN 1 ELSE 0 END) as wins,
-        SUM(CASE WHEN m.home_score = m.away_score THEN 1 ELSE 0 END) as draws,
-        SUM(CASE WHEN m.home_score < m.away_score THEN 1 ELSE 0 END) as losses
-    FROM matches m
-    JOIN teams t ON m.home_team_id = t.id
-    WHERE m.home_score IS NOT NULL
-    GROUP BY t.id
-    ORDER BY points DESC, (SUM(m.home_score) - SUM(m.away_score)) DESC, SUM(m.home_score) DESC
-    """
-    
-    df = pd.read_sql_query(query, conn)
-    conn.close()
+def query_squad_stats_from_matches(season=SEASON, competition=COMPETITION):
+    """Получить турнирную таблицу сезона из результатов матчей"""
+    # team_match_stats хранит каждый матч с точки зрения каждой из команд:
+    # goals_for = голы команды, goals_against = голы соперника
+    rows = fetch_rows(query_sql('standings'), {'season': season, 'competition': competition})
     
     print("\n" + "=" * 90)
-    print("🏆 ТУРНИРНАЯ ТАБЛИЦА (из результатов матчей)")
+    print(f"🏆 ТУРНИРНАЯ ТАБЛИЦА (из результатов матчей), {competition} {season}")
     print("=" * 90)
     
-    if not df.empty:
-        # Добавляем разницу мячей
-        df['gd'] = df['goals_scored'] - df['goals_conceded']
-        
+    if rows:
         print(f"{'#':<3} {'Команда':<20} | {'М':<3} | {'В':<3} | {'Н':<3} | {'П':<3} | {'ГЗ':<4} | {'ГП':<4} | {'РМ':<4} | {'Очки'}")
         print("-" * 90)
         
-        for idx, row in df.iterrows():
+        for idx, row in enumerate(rows):
             print(f"{idx+1:<3} {row['team']:<20} | {row['matches']:<3} | {row['wins']:<3} | {row['draws']:<3} | {row['losses']:<3} | {row['goals_scored']:<4} | {row['goals_conceded']:<4} | {row['gd']:<4} | {row['points']}")
         
-        print(f"\nВсего команд: {len(df)}")
+        print(f"\nВсего команд: {len(rows)}")
         print("\nЛегенда: М=Матчи, В=Победы, Н=Ничьи, П=Поражения, ГЗ=Голы забиты, ГП=Голы пропущены, РМ=Разница мячей")
     else:
         print("⚠️  Нет данных о матчах")
     
-    return df
+    return rows
 
 def query_top_scorers(limit=10):
     """Топ бомбардиров"""
-    session = connect_db()
-    
-    top_players = session.query(
-        Player.name,
-        Team.name.label('team_name'),
-        PlayerStat.goals,
-        PlayerStat.assists,
-        PlayerStat.minutes
-    ).join(Team).join(PlayerStat).filter(
-        PlayerStat.goals.isnot(None)
-    ).order_by(desc(PlayerStat.goals)).limit(limit).all()
+    top_players = fetch_rows(query_sql('top_scorers'), {'limit': limit})
     
     print("\n" + "=" * 60)
     print(f"🏆 ТОП-{limit} БОМБАРДИРОВ")
@@ -169,38 +173,20 @@ def query_top_scorers(limit=10):
     print("-" * 60)
     
     for idx, player in enumerate(top_players, 1):
-        name, team, goals, assists, minutes = player
-        assists_str = str(assists) if assists else "0"
-        minutes_str = str(minutes) if minutes else "N/A"
-        print(f"{idx:2d}. {name:<22} | {team:<20} | {goals:<6} | {assists_str:<8} | {minutes_str}")
+        assists_str = str(player['assists']) if player['assists'] else "0"
+        minutes_str = str(player['minutes']) if player['minutes'] else "N/A"
+        print(f"{idx:2d}. {player['name']:<22} | {player['team_name']:<20} | {player['goals']:<6} | {assists_str:<8} | {minutes_str}")
     
     return top_players
 
 def query_with_pandas():
     """Использование pandas для SQL запросов"""
-    conn = sqlite3.connect('football_data.db')
-    
     print("\n" + "=" * 60)
     print("📈 АНАЛИЗ С PANDAS")
     print("=" * 60)
     
-    # Запрос 1: Статистика команд
-    query1 = """
-    SELECT 
-        t.name as team,
-        COUNT(DISTINCT m.id) as matches_played,
-        SUM(CASE WHEN m.home_team_id = t.id THEN m.home_score 
-                 WHEN m.away_team_id = t.id THEN m.away_score END) as goals_scored,
-        SUM(CASE WHEN m.home_team_id = t.id THEN m.away_score 
-                 WHEN m.away_team_id = t.id THEN m.home_score END) as goals_conceded
-    FROM teams t
-    LEFT JOIN matches m ON (m.home_team_id = t.id OR m.away_team_id = t.id)
-    WHERE m.home_score IS NOT NULL
-    GROUP BY t.id
-    ORDER BY goals_scored DESC
-    """
-    
-    df = pd.read_sql_query(query1, conn)
+    # Голы забитые и пропущенные по счету матчей
+    df = read_sql(query_sql('goals_from_matches'))
     
     if not df.empty:
         print("\n🎯 Голы забитые и пропущенные:")
@@ -213,28 +199,136 @@ def query_with_pandas():
     else:
         print("⚠️  Нет данных о матчах в базе")
     
-    conn.close()
     return df
 
+def query_find_player(player_name, limit=10):
+    """Поиск игроков по имени (нечеткий, без учета диакритики)"""
+    hits = get_search_index('player').search(player_name, limit=limit)
+    
+    print("\n" + "=" * 60)
+    print(f"🔎 ПОИСК ИГРОКА: {player_name}")
+    print("=" * 60)
+    
+    # Команда и позиция всех найденных игроков - одним запросом
+    details = {}
+    if hits:
+        sql, params = expand_list(query_sql('player_details'), 'player_ids', [player_id for _, player_id, _ in hits])
+        details = {row['id']: row for row in fetch_rows(sql, params)}
+    for score, player_id, name in hits:
+        player = details[player_id]
+        print(f"{name:<30} | {player['team_name'] or 'N/A':<20} | {player['position'] or '':<6} | {score:.2f}")
+    
+    if not hits:
+        print(f"❌ Игрок '{player_name}' не найден")
+    return hits
+
+def query_ratings(as_of=None, limit=20):
+    """Рейтинг Эло команд на дату (по умолчанию - текущий): последняя строка team_ratings до даты"""
+    as_of = as_of or '9999-12-31'
+    ratings = fetch_rows(query_sql('ratings_as_of'), {'as_of': str(as_of), 'limit': limit})
+    
+    print("\n" + "=" * 60)
+    print(f"📈 РЕЙТИНГ ЭЛО{' НА ' + str(as_of) if as_of != '9999-12-31' else ''}")
+    print("=" * 60)
+    print(f"{'#':<3} {'Команда':<20} | {'Эло':<7} | {'xG-Эло':<7} | {'Последний матч'}")
+    print("-" * 60)
+    
+    for idx, row in enumerate(ratings, 1):
+        print(f"{idx:<3} {row['team']:<20} | {row['elo']:<7.1f} | {row['xg_elo']:<7.1f} | {row['date']}")
+    
+    if not ratings:
+        print("⚠️  Нет рейтингов (python ratings.py пересчитает их по загруженным матчам)")
+    return ratings
+
+def query_form(limit=20):
+    """Текущая форма команд (последние матчи) из предрасчитанной таблицы team_form"""
+    forms = fetch_rows(query_sql('current_form'), {'limit': limit})
+    
+    print("\n" + "=" * 75)
+    print("🔥 ФОРМА КОМАНД (последние матчи, средние за матч)")
+    print("=" * 75)
+    print(f"{'Команда':<20} | {'Форма':<6} | {'Очки':<4} | {'ГЗ':<4} | {'ГП':<4} | {'xG':<4} | {'xGA'}")
+    print("-" * 75)
+    
+    fmt = lambda value: f"{value:.1f}" if value is not None else "N/A"
+    for row in forms:
+        print(f"{row['team']:<20} | {row['form']:<6} | {row['points']:<4} | {fmt(row['goals_for']):<4} | "
+              f"{fmt(row['goals_against']):<4} | {fmt(row['xg']):<4} | {fmt(row['xga'])}")
+    
+    if not forms:
+        print("⚠️  Нет данных о форме (python metrics.py пересчитает ее по загруженным матчам)")
+    return forms
+
+def query_per90(stat='goals', min_minutes=900, limit=10):
+    """Лучшие игроки по показателю на 90 минут (таблица player_per90)"""
+    if stat not in ('goals', 'assists', 'xg', 'npxg', 'xag'):
+        raise ValueError(f"Неизвестный показатель: {stat}")
+    # Колонка показателя подставляется в текст запроса, поэтому его нет в каталоге queries.sql
+    players = fetch_rows(f"""
+        SELECT p.name, t.name AS team_name, pp.season, pp.minutes, pp.{stat} AS value
+        FROM player_per90 pp
+        JOIN players p ON pp.player_id = p.id
+        JOIN teams t ON pp.team_id = t.id
+        WHERE pp.minutes >= :min_minutes AND pp.{stat} IS NOT NULL
+        ORDER BY pp.{stat} DESC
+        LIMIT :limit
+    """, {'min_minutes': min_minutes, 'limit': limit})
+    
+    print("\n" + "=" * 70)
+    print(f"⏱️  ТОП-{limit}: {stat} НА 90 МИНУТ (минимум {min_minutes} минут)")
+    print("=" * 70)
+    
+    for idx, row in enumerate(players, 1):
+        print(f"{idx:2d}. {row['name']:<25} | {row['team_name']:<20} | {row['season']} | {row['minutes']:<5} | {row['value']:.2f}")
+    
+    return players
+
+def query_similar_players(player_name, limit=10, metric='cosine', position=None, min_minutes=900):
+    """Игроки, похожие на игрока по показателям на 90 минут (индекс similarity.py)"""
+    from similarity import PlayerSimilarity
+    
+    hits = get_search_index('player').search(player_name, limit=1)
+    if not hits:
+        print(f"❌ Игрок '{player_name}' не найден")
+        return []
+    _, player_id, name = hits[0]
+    
+    try:
+        index = PlayerSimilarity()
+    except FileNotFoundError:
+        print("⚠️  Индекс не построен (python similarity.py)")
+        return []
+    similar = index.similar(player_id, k=limit, metric=metric, position=position, min_minutes=min_minutes)
+    
+    print("\n" + "=" * 75)
+    print(f"👥 ПОХОЖИЕ НА {name} ({metric}{', ' + position if position else ''})")
+    print("=" * 75)
+    
+    names = {row['id']: row['name'] for row in fetch_rows("SELECT id, name FROM players")} if similar else {}
+    teams = {row['id']: row['name'] for row in fetch_rows("SELECT id, name FROM teams")} if similar else {}
+    for idx, (score, key, minutes) in enumerate(similar, 1):
+        print(f"{idx:2d}. {names.get(int(key['player_id']), '?'):<25} | {teams.get(int(key['team_id']), 'N/A'):<20} | "
+              f"{key['season']} | {minutes:<5} | {score:.3f}")
+    
+    if not similar:
+        print("⚠️  Нет данных per-90 для сравнения")
+    return similar
+
 def query_database_info():
     """Общая информация о базе данных"""
-    session = connect_db()
-    
-    teams_count = session.query(Team).count()
-    players_count = session.query(Player).count()
-    matches_count = session.query(Match).count()
-    squad_stats_count = session.query(SquadStat).count()
-    player_stats_count = session.query(PlayerStat).count()
+    counts = fetch_rows(query_sql('database_info'))[0]
     
     print("\n" + "=" * 60)
     print("💾 ИНФОРМАЦИЯ О БАЗЕ ДАННЫХ")
     print("=" * 60)
-    print(f"⚽ Команд:              {teams_count}")
-    print(f"👤 Игроков:            {players_count}")
-    print(f"📅 Матчей:             {matches_count}")
-    print(f"📊 Статистика команд:  {squad_stats_count}")
-    print(f"📈 Статистика игроков: {player_stats_count}")
+    print(f"⚽ Команд:              {counts['teams']}")
+    print(f"👤 Игроков:            {counts['players']}")
+    print(f"📅 Матчей:             {counts['matches']}")
+    print(f"🧾 Матчей по командам: {counts['team_match_stats']}")
+    print(f"📊 Статистика команд:  {counts['squad_stats']}")
+    print(f"📈 Статистика игроков: {counts['player_stats']}")
     print("=" * 60)
+    return counts
 
 def main():
     """Запуск всех примеров запросов"""
@@ -0,0 +1,160 @@
+"""
+Рейтинг Эло команд по сыгранным матчам.
+
+Рейтинг хранится после каждого матча (team_ratings), поэтому рейтинг на любую дату -
+одна индексная выборка, без пересчета истории. Загрузчик вызывает update_for_matches
+для только что сыгранных матчей: пересчитывается только хвост истории, начиная с даты
+самого раннего из них. Полный пересчет (update_ratings без since) - тот же код.
+
+Расчет векторизован по игровым дням: в один день команда играет не больше одного матча,
+поэтому все матчи дня обновляются одной операцией NumPy.
+Кроме обычного Эло считается xG-Эло: результатом матча считается доля xG хозяев.
+"""
+
+import logging
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session, aliased
+from db import Match, TeamMatchStat, TeamRating, copy_rows
+from config import ELO_INITIAL, ELO_K, ELO_HOME_ADVANTAGE
+
+logger = logging.getLogger(__name__)
+
+def goal_difference_multiplier(goal_difference):
+    """Множитель K от разницы мячей (World Football Elo): 1, 1.5, (11 + N) / 8"""
+    gd = np.abs(goal_difference)
+    return np.where(gd <= 1, 1.0, np.where(gd == 2, 1.5, (11.0 + gd) / 8.0))
+
+def compute_elo(day, home, away, home_goals, away_goals, home_xg, away_xg, elo, xg_elo):
+    """
+    Прогоняет матчи (отсортированные по дню) через рейтинги elo/xg_elo - массивы по индексу команды,
+    изменяются на месте. Возвращает рейтинги хозяев и гостей после каждого матча
+    (elo_home, elo_away, xg_elo_home, xg_elo_away) и изменение рейтинга хозяев.
+    """
+    n = len(day)
+    elo_home, elo_away = np.empty(n), np.empty(n)
+    xg_home, xg_away = np.empty(n), np.empty(n)
+    change = np.empty(n)
+
+    # Результат матча для хозяев: 1 / 0.5 / 0 и доля xG (матчи без xG xG-рейтинг не меняют)
+    score = np.where(home_goals > away_goals, 1.0, np.where(home_goals == away_goals, 0.5, 0.0))
+    k = ELO_K * goal_difference_multiplier(home_goals - away_goals)
+    xg_total = home_xg + away_xg
+    has_xg = np.isfinite(xg_total) & (xg_total > 0)
+    xg_score = np.where(has_xg, home_xg / np.where(has_xg, xg_total, 1.0), 0.0)
+    xg_k = np.where(has_xg, ELO_K, 0.0)
+
+    bounds = np.flatnonzero(np.diff(day)) + 1
+    for start, end in zip(np.r_[0, bounds], np.r_[bounds, n]):
+        h, a = home[start:end], away[start:end]
+
+        expected = 1.0 / (1.0 + 10.0 ** ((elo[a] - elo[h] - ELO_HOME_ADVANTAGE) / 400.0))
+        delta = k[start:end] * (score[start:end] - expected)
+        # add.at - на случай, если команда все же сыграла два матча в один день
+        np.add.at(elo, h, delta)
+        np.add.at(elo, a, -delta)
+
+        xg_expected = 1.0 / (1.0 + 10.0 ** ((xg_elo[a] - xg_elo[h] - ELO_HOME_ADVANTAGE) / 400.0))
+        xg_delta = xg_k[start:end] * (xg_score[start:end] - xg_expected)
+        np.add.at(xg_elo, h, xg_delta)
+        np.add.at(xg_elo, a, -xg_delta)
+
+        elo_home[start:end], elo_away[start:end] = elo[h], elo[a]
+        xg_home[start:end], xg_away[start:end] = xg_elo[h], xg_elo[a]
+        change[start:end] = delta
+
+    return elo_home, elo_away, xg_home, xg_away, change
+
+def _completed_matches(session: Session, since=None):
+    """Сыгранные матчи с датой >= since в порядке дат; xG берется из строки любой из команд"""
+    home_stat, away_stat = aliased(TeamMatchStat), aliased(TeamMatchStat)
+    query = session.query(
+        Match.id, Match.date, Match.home_team_id, Match.away_team_id, Match.home_score, Match.away_score,
+        func.coalesce(home_stat.xg, away_stat.xga), func.coalesce(home_stat.xga, away_stat.xg),
+    ).outerjoin(
+        home_stat, (home_stat.match_id == Match.id) & (home_stat.team_id == Match.home_team_id)
+    ).outerjoin(
+        away_stat, (away_stat.match_id == Match.id) & (away_stat.team_id == Match.away_team_id)
+    ).filter(
+        Match.home_score.isnot(None), Match.away_score.isnot(None), Match.date.isnot(None)
+    )
+    if since is not None:
+        query = query.filter(Match.date >= since)
+    return query.order_by(Match.date, Match.id).all()
+
+def _ratings_before(session: Session, since):
+    """Последний рейтинг каждой команды до даты since: {team_id: (elo, xg_elo)}"""
+    if since is None:
+        return {}
+    last = session.query(
+        func.max(TeamRating.id).label('id')
+    ).filter(TeamRating.date < since).group_by(TeamRating.team_id).subquery()
+    rows = session.query(TeamRating.team_id, TeamRating.elo, TeamRating.xg_elo).join(
+        last, TeamRating.id == last.c.id
+    )
+    return {team_id: (elo, xg_elo) for team_id, elo, xg_elo in rows}
+
+def update_ratings(session: Session, since=None):
+    """
+    Пересчитывает рейтинги начиная с даты since (None - вся история).
+    Строки с date >= since удаляются и вставляются заново от состояния на since.
+    Коммит - на стороне вызывающего кода.
+    """
+    matches = _completed_matches(session, since)
+    deleted = session.query(TeamRating)
+    if since is not None:
+        deleted = deleted.filter(TeamRating.date >= since)
+    deleted.delete(synchronize_session=False)
+    if not matches:
+        return 0
+
+    match_id, date, home, away, home_goals, away_goals, home_xg, away_xg = zip(*matches)
+    home, away = np.array(home), np.array(away)
+    size = int(max(home.max(), away.max())) + 1
+    elo, xg_elo = np.full(size, float(ELO_INITIAL)), np.full(size, float(ELO_INITIAL))
+    for team_id, (team_elo, team_xg_elo) in _ratings_before(session, since).items():
+        if team_id < size:
+            elo[team_id] = team_elo
+            xg_elo[team_id] = team_xg_elo if team_xg_elo is not None else ELO_INITIAL
+
+    as_float = lambda values: np.array([np.nan if v is None else v for v in values], dtype=float)
+    elo_home, elo_away, xg_home, xg_away, change = compute_elo(
+        np.array([d.toordinal() for d in date]), home, away,
+        np.array(home_goals), np.array(away_goals), as_float(home_xg), as_float(away_xg),
+        elo, xg_elo
+    )
+
+    rows = []
+    for i in range(len(matches)):
+        rows.append({'team_id': int(home[i]), 'match_id': match_id[i], 'date': date[i],
+                     'elo': float(elo_home[i]), 'elo_change': float(change[i]), 'xg_elo': float(xg_home[i])})
+        rows.append({'team_id': int(away[i]), 'match_id': match_id[i], 'date': date[i],
+                     'elo': float(elo_away[i]), 'elo_change': float(-change[i]), 'xg_elo': float(xg_away[i])})
+    copy_rows(session, TeamRating, rows)
+    return len(matches)
+
+def update_for_matches(session: Session, match_ids):
+    """Обновляет рейтинги после загрузки только что сыгранных матчей (пересчет с самой ранней даты)"""
+    if not match_ids:
+        return 0
+    since = session.query(func.min(Match.date)).filter(Match.id.in_(list(match_ids))).scalar()
+    if since is None:
+        return 0
+    count = update_ratings(session, since)
+    logger.info(f"📈 Рейтинги пересчитаны с {since}: матчей {count}")
+    return count
+
+def main():
+    """Полный пересчет рейтингов"""
+    from db import init_db
+    from config import DB_PATH
+    from log_setup import setup_logging
+    setup_logging(log_file=None)
+    session = init_db(DB_PATH)()
+    count = update_ratings(session)
+    session.commit()
+    session.close()
+    logger.info(f"✅ Рейтинги пересчитаны: матчей {count}")
+
+if __name__ == '__main__':
+    main()
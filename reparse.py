@@ -0,0 +1,204 @@
+"""
+Повторный разбор сохраненных страниц FBref без обращения к сайту.
+
+Страницы берутся из архива страниц (PAGE_ARCHIVE_DIR, последняя версия каждого URL),
+каталога HTML файлов или .zip архива (страницы, сохраненные вручную или старыми версиями скрапера).
+Разбор HTML - самая дорогая часть загрузки, поэтому он выполняется в пуле процессов:
+каждый процесс возвращает нормализованные записи (transform.py), а в базу их пишет
+единственный писатель в главном процессе - SQLite не допускает параллельных записей.
+
+    python reparse.py cache/archive
+    python reparse.py pages/
+    python reparse.py pages.zip --workers 4
+"""
+
+import os
+import re
+import sys
+import zipfile
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from scraper import parse_team_identity, parse_team_stats, parse_match_logs, parse_match_report, page_file_name
+from archive import get_archive
+from transform import normalize_match_logs, normalize_squad_stats, normalize_player_stats
+from log_setup import setup_worker_logging
+from config import DB_PATH, SEASON, COMPETITION, REPARSE_WORKERS
+
+logger = logging.getLogger(__name__)
+
+def is_page_archive(source):
+    return os.path.isdir(source) and os.path.exists(os.path.join(source, 'pages.idx'))
+
+def list_pages(sources):
+    """
+    Собирает страницы из архивов страниц, каталогов и .zip архивов:
+    (путь, номер записи архива страниц / имя в .zip / None)
+    """
+    pages = []
+    for source in sources:
+        if is_page_archive(source):
+            pages.extend((source, number) for number in get_archive(source).latest())
+        elif zipfile.is_zipfile(source):
+            with zipfile.ZipFile(source) as archive:
+                pages.extend((source, name) for name in archive.namelist() if name.endswith('.html'))
+        else:
+            for root, _, files in os.walk(source):
+                pages.extend((os.path.join(root, name), None) for name in sorted(files) if name.endswith('.html'))
+    return pages
+
+def _read_page(page):
+    path, member = page
+    if isinstance(member, int):
+        return get_archive(path).read(member).content.decode('utf-8')
+    if member is None:
+        with open(path, 'rb') as f:
+            return f.read().decode('utf-8')
+    with zipfile.ZipFile(path) as archive:
+        return archive.read(member).decode('utf-8')
+
+def _match_id(name, content):
+    """FBref ID матча из canonical ссылки или имени файла (<id>.html, en__matches__<id>__...)"""
+    found = re.search(r'<link[^>]+rel="canonical"[^>]+/matches/([0-9a-f]{8})', content)
+    if found:
+        return found.group(1)
+    name = os.path.basename(name)
+    found = re.match(r'(?:en__matches__)?([0-9a-f]{8})(?:__.*)?\.html$', name)
+    return found.group(1) if found else None
+
+def reparse_page(page):
+    """
+    Разбирает одну страницу (выполняется в дочернем процессе).
+    Возвращает picklable dict: {'kind': 'team', ...}, {'kind': 'report', ...} или {'kind': 'skip', ...}.
+    """
+    name = page[1] if isinstance(page[1], str) else page[0]
+    try:
+        if isinstance(page[1], int):
+            # Запись архива страниц: имя - по URL, как у сохраненного файла
+            archived = get_archive(page[0]).read(page[1])
+            content, name = archived.content.decode('utf-8'), page_file_name(archived.url)
+        else:
+            content = _read_page(page)
+        team = parse_team_identity(content)
+        if team:
+            match_logs = parse_match_logs(content)
+            stats = parse_team_stats(content)
+            return {
+                'kind': 'team',
+                'page': name,
+                'team': team,
+                'matches': normalize_match_logs(match_logs) if match_logs is not None else [],
+                'squad': normalize_squad_stats(stats['squad']),
+                'players': normalize_player_stats(stats['players'], stats['player_ids']),
+                'hashes': stats['hashes'],
+            }
+
+        match_id = _match_id(name, content)
+        if match_id and 'scorebox' in content:
+            return {'kind': 'report', 'page': name, 'match_id': match_id, 'report': parse_match_report(content)}
+
+        return {'kind': 'skip', 'page': name, 'error': None}
+    except Exception as e:
+        return {'kind': 'skip', 'page': name, 'error': str(e)}
+
+def reparse(sources, db_path=DB_PATH, workers=REPARSE_WORKERS):
+    """
+    Разбирает страницы в пуле процессов и загружает результат в базу.
+    Команды пишутся по мере готовности, отчеты о матчах - после всех команд,
+    чтобы матчи, на которые они ссылаются, уже были в базе.
+    """
+    # Загрузчик импортируется здесь: дочерним процессам он не нужен
+    from staging import writer_lock
+    from main import refresh_derived
+
+    pages = list_pages(sources)
+    logger.info(f"📂 Страниц для разбора: {len(pages)}")
+    if not pages:
+        return
+
+    # Свой запуск журнала изменений - исключительная блокировка писателей (staging.writer_lock)
+    with writer_lock(db_path):
+        teams, loaded_reports, skipped = _load_pages(pages, db_path, workers)
+    # Производные файлы - свои у каждой базы: разбор в черновую базу не трогает файлы рабочей
+    refresh_derived(db_path)
+    logger.info(f"✅ Загружено команд: {teams}, отчетов: {loaded_reports}, пропущено страниц: {skipped}")
+
+def _load_pages(pages, db_path, workers):
+    """Разбор pages в пуле процессов и запись в db_path: (команд, отчетов, пропущено страниц)"""
+    from db import init_db, Match
+    from writer import DBWriter
+    from cdc import start_run, finish_run
+    from validate import run_season_checks
+    from main import load_team, load_report
+
+    SessionLocal = init_db(db_path)
+    session = SessionLocal()
+    # Отчеты, загруженные ранее, повторно не пишутся
+    loaded = {fbref_id for (fbref_id,) in session.query(Match.fbref_id).filter(Match.report_loaded.is_(True))}
+    run_id = start_run(session, 'reparse')
+    session.close()
+
+    reports = {}
+    teams = skipped = 0
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(pages) // (workers * 4))
+
+    status = 'failed'
+    try:
+        # Разбор идет в пуле процессов, запись - в потоке писателя
+        writer = DBWriter(SessionLocal).start()
+        with ProcessPoolExecutor(max_workers=workers, initializer=setup_worker_logging) as pool:
+            for result in pool.map(reparse_page, pages, chunksize=chunksize):
+                if result['kind'] == 'report':
+                    # Один и тот же отчет может встретиться в нескольких источниках
+                    reports[result['match_id']] = result
+                    continue
+                if result['kind'] == 'skip':
+                    if result['error']:
+                        logger.warning(f"⚠️  {result['page']}: {result['error']}")
+                    skipped += 1
+                    continue
+
+                season = result['team']['season'] or SEASON
+                writer.submit(result['page'], load_team, result['team'], result['matches'],
+                              result['squad'], result['players'], season, COMPETITION, result['hashes'])
+                teams += 1
+
+        # Отчеты ставятся в очередь после всех команд: матчи, на которые они ссылаются, уже записаны
+        for match_id, result in reports.items():
+            if match_id not in loaded:
+                writer.submit(f"отчет {match_id}", load_report, match_id, result['report'])
+        writer.close()
+        session = SessionLocal()
+        try:
+            # Страницы могут относиться к разным сезонам - проверяются все сезоны базы
+            run_season_checks(session, run_id)
+        finally:
+            session.close()
+        status = 'failed' if writer.failed else 'success'
+    finally:
+        # Как в main.run_league: открытый запуск писал бы в журнал изменения следующих загрузок
+        session = SessionLocal()
+        try:
+            finish_run(session, run_id, status)
+        finally:
+            session.close()
+
+    failed_reports = sum(1 for name in writer.failed if name.startswith('отчет '))
+    teams -= len(writer.failed) - failed_reports
+    loaded_reports = writer.done - teams
+    return teams, loaded_reports, skipped
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Повторный разбор сохраненных страниц FBref')
+    parser.add_argument('sources', nargs='+', help='архивы страниц, каталоги или .zip архивы со страницами')
+    parser.add_argument('--workers', type=int, default=REPARSE_WORKERS, help='количество процессов')
+    parser.add_argument('--db', default=DB_PATH, help='URL базы данных')
+    args = parser.parse_args(argv)
+
+    from log_setup import setup_logging
+    setup_logging(log_file=None)
+    reparse(args.sources, db_path=args.db, workers=args.workers)
+
+if __name__ == '__main__':
+    sys.exit(main())
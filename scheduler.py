@@ -0,0 +1,249 @@
+"""
+Планировщик обновлений по календарю матчей.
+
+Вместо полного прохода по лиге по расписанию cron планировщик читает из базы будущие матчи
+(строки matches без счета, загруженные из логов матчей) и обновляет страницы только тех команд,
+которые сыграли: через SCHEDULER_MATCH_MINUTES + SCHEDULER_RESULT_DELAY_MINUTES после начала.
+Матчи, заканчивающиеся в пределах SCHEDULER_COALESCE_MINUTES, обновляются одним проходом
+(субботние 15:00 - это один проход на все команды тура). Если FBref еще не выложил счет,
+матч повторяется с растущей паузой; вне игровых недель планировщик спит до ближайшего матча,
+перечитывая базу не чаще раза в SCHEDULER_IDLE_HOURS.
+
+Проход пишет прямо в рабочую базу, без staging: обновляются несколько команд, копировать ради них
+всю базу дорого. Поэтому проход держит исключительную блокировку писателей (staging.writer_lock):
+он не начнется посреди запуска main.py через staging (публикация среза затерла бы его строки)
+и не пересечется с воркерами jobs.py; пока идет проход, они ждут.
+
+    python scheduler.py              # демон
+    python scheduler.py --dry-run    # показать план
+    python scheduler.py --once       # выполнить наступившие обновления и выйти (cron)
+"""
+
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta
+from config import (
+    DB_PATH, SEASON, COMPETITION, SCHEDULER_MATCH_MINUTES, SCHEDULER_RESULT_DELAY_MINUTES, SCHEDULER_COALESCE_MINUTES,
+    SCHEDULER_RETRY_MINUTES, SCHEDULER_RETRY_MAX_MINUTES, SCHEDULER_GIVE_UP_DAYS, SCHEDULER_IDLE_HOURS
+)
+
+logger = logging.getLogger(__name__)
+
+# Время начала, если в логе матчей его нет
+DEFAULT_KICKOFF = '21:00'
+
+def kickoff_time(date, start_time):
+    """date + 'HH:MM' -> datetime начала матча"""
+    try:
+        hour, minute = (int(part) for part in (start_time or DEFAULT_KICKOFF).split(':')[:2])
+    except ValueError:
+        hour, minute = (int(part) for part in DEFAULT_KICKOFF.split(':'))
+    return datetime(date.year, date.month, date.day, hour, minute)
+
+def load_fixtures(session, now):
+    """
+    Матчи без счета, начавшиеся не раньше SCHEDULER_GIVE_UP_DAYS дней назад:
+    [{'match_id', 'kickoff', 'teams': [{'fbref_id', 'name', 'url'}, ...]}]
+    """
+    from sqlalchemy.orm import aliased
+    from db import Match, Team
+    home, away = aliased(Team), aliased(Team)
+    rows = session.query(
+        Match.id, Match.date, Match.start_time,
+        home.fbref_id, home.name, home.url, away.fbref_id, away.name, away.url,
+    ).join(home, Match.home_team_id == home.id).join(away, Match.away_team_id == away.id).filter(
+        Match.home_score.is_(None), Match.date.isnot(None),
+        Match.date >= (now - timedelta(days=SCHEDULER_GIVE_UP_DAYS)).date(),
+    ).all()
+    return [
+        {
+            'match_id': row[0],
+            'kickoff': kickoff_time(row[1], row[2]),
+            'teams': [
+                {'fbref_id': row[3], 'name': row[4], 'url': row[5]},
+                {'fbref_id': row[6], 'name': row[7], 'url': row[8]},
+            ],
+        }
+        for row in rows
+    ]
+
+def plan_refreshes(fixtures, retries=None, now=None):
+    """
+    Группирует матчи в проходы обновления: [{'due', 'matches', 'teams'}] по возрастанию due.
+    retries: match_id -> время следующей попытки для матчей, у которых счета еще не было.
+    Проход начинается после окончания последнего матча группы.
+    """
+    retries = retries or {}
+    window = timedelta(minutes=SCHEDULER_MATCH_MINUTES + SCHEDULER_RESULT_DELAY_MINUTES)
+    give_up = now - timedelta(days=SCHEDULER_GIVE_UP_DAYS) if now else None
+    items = []
+    for fixture in fixtures:
+        if give_up and fixture['kickoff'] < give_up:
+            continue
+        due = fixture['kickoff'] + window
+        if fixture['match_id'] in retries:
+            due = max(due, retries[fixture['match_id']])
+        items.append((due, fixture))
+    items.sort(key=lambda item: (item[0], item[1]['match_id']))
+
+    coalesce = timedelta(minutes=SCHEDULER_COALESCE_MINUTES)
+    plan = []
+    for due, fixture in items:
+        if plan and due - plan[-1]['start'] <= coalesce:
+            batch = plan[-1]
+            batch['due'] = due
+        else:
+            batch = {'start': due, 'due': due, 'matches': [], 'teams': {}}
+            plan.append(batch)
+        batch['matches'].append(fixture['match_id'])
+        for team in fixture['teams']:
+            batch['teams'][team['fbref_id']] = team
+    for batch in plan:
+        del batch['start']
+        batch['teams'] = list(batch['teams'].values())
+    return plan
+
+def next_retry(attempt, now):
+    """Время повтора для матча, у которого после attempt попыток еще нет счета"""
+    minutes = min(SCHEDULER_RETRY_MINUTES * 2 ** (attempt - 1), SCHEDULER_RETRY_MAX_MINUTES)
+    return now + timedelta(minutes=minutes)
+
+def refresh(scraper, SessionLocal, teams, db_path=DB_PATH):
+    """Один проход под блокировкой писателей: страницы команд teams и новые отчеты о матчах, запись через DBWriter"""
+    from staging import writer_lock
+    from main import refresh_derived
+
+    with writer_lock(db_path):
+        failed = _refresh(scraper, SessionLocal, teams)
+    refresh_derived(db_path)
+    return failed
+
+def _refresh(scraper, SessionLocal, teams):
+    from db import Match
+    from cdc import start_run, finish_run
+    from validate import run_season_checks
+    from writer import DBWriter
+    from scraper import MatchReportQueue
+    from log_setup import log_context
+    from main import scrape_team, load_team, load_match_reports, load_table_hashes
+
+    session = SessionLocal()
+    loaded = {fbref_id for (fbref_id,) in session.query(Match.fbref_id).filter(Match.report_loaded.is_(True))}
+    known_hashes = load_table_hashes(session)
+    run_id = start_run(session, 'schedule')
+    session.close()
+
+    report_queue = MatchReportQueue(done=loaded)
+    failed = []
+    status = 'failed'
+    try:
+        writer = DBWriter(SessionLocal).start()
+        for team_info in teams:
+            with log_context(team=team_info['name'], stage='schedule'):
+                try:
+                    matches, squad, players, table_hashes = scrape_team(
+                        scraper, team_info, report_queue, known_hashes.get(team_info['fbref_id'])
+                    )
+                    writer.submit(team_info['name'], load_team, team_info, matches, squad, players,
+                                  SEASON, COMPETITION, table_hashes)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка при обновлении {team_info['name']}: {e}")
+                    failed.append(team_info['name'])
+        load_match_reports(writer, scraper, report_queue)
+        writer.close()
+        failed += writer.failed
+
+        session = SessionLocal()
+        try:
+            run_season_checks(session, run_id, SEASON, COMPETITION)
+        finally:
+            session.close()
+        status = 'failed' if failed else 'success'
+    finally:
+        # Как в main.run_league: открытый запуск писал бы в журнал изменения следующих загрузок
+        session = SessionLocal()
+        try:
+            finish_run(session, run_id, status)
+        finally:
+            session.close()
+    return failed
+
+def run(db_path=DB_PATH, once=False, dry_run=False, scraper=None):
+    """Цикл планировщика: обновления по мере наступления, сон до следующего"""
+    from db import init_db
+    SessionLocal = init_db(db_path)
+    retries, attempts = {}, {}
+
+    while True:
+        now = datetime.now()
+        session = SessionLocal()
+        fixtures = load_fixtures(session, now)
+        session.close()
+        # Матчи, получившие счет (или перенесенные), больше не отслеживаются
+        current = {fixture['match_id'] for fixture in fixtures}
+        retries = {match_id: due for match_id, due in retries.items() if match_id in current}
+        attempts = {match_id: count for match_id, count in attempts.items() if match_id in current}
+        plan = plan_refreshes(fixtures, retries, now)
+
+        if dry_run:
+            for batch in plan:
+                names = ', '.join(team['name'] for team in batch['teams'])
+                logger.info(f"🗓️  {batch['due']:%Y-%m-%d %H:%M}: матчей {len(batch['matches'])}, команды: {names}")
+            return plan
+
+        due = [batch for batch in plan if batch['due'] <= now]
+        if due:
+            # Наступившие проходы (в том числе пропущенные во время сна) объединяются в один
+            teams = {team['fbref_id']: team for batch in due for team in batch['teams']}
+            matches = [match_id for batch in due for match_id in batch['matches']]
+            logger.info(f"⚽ Обновление после матчей ({len(matches)}): команд {len(teams)}")
+            if scraper is None:
+                from scraper import FBRefScraper
+                scraper = FBRefScraper()
+            try:
+                refresh(scraper, SessionLocal, list(teams.values()), db_path)
+            except Exception as e:
+                # Ошибка прохода (база, сеть) не останавливает демона: матчи уйдут на повтор
+                logger.error(f"❌ Ошибка обновления: {e}")
+
+            # Матчи, счет которых еще не появился, - повтор с растущей паузой
+            session = SessionLocal()
+            pending = {fixture['match_id'] for fixture in load_fixtures(session, datetime.now())}
+            session.close()
+            for match_id in matches:
+                if match_id in pending:
+                    attempts[match_id] = attempts.get(match_id, 0) + 1
+                    retries[match_id] = next_retry(attempts[match_id], datetime.now())
+            if pending & set(matches):
+                logger.info(f"⏳ Счет еще не опубликован: матчей {len(pending & set(matches))}, повтор позже")
+            continue
+
+        if once:
+            return plan
+
+        idle = timedelta(hours=SCHEDULER_IDLE_HOURS)
+        wake = min(plan[0]['due'], now + idle) if plan else now + idle
+        if plan:
+            logger.info(f"💤 Следующее обновление {plan[0]['due']:%Y-%m-%d %H:%M} "
+                        f"(команд {len(plan[0]['teams'])}), проверка в {wake:%Y-%m-%d %H:%M}")
+        else:
+            logger.info(f"💤 Матчей без счета нет, проверка в {wake:%Y-%m-%d %H:%M}")
+        time.sleep(max(1.0, (wake - now).total_seconds()))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Обновление данных по календарю матчей')
+    parser.add_argument('--once', action='store_true', help='выполнить наступившие обновления и выйти')
+    parser.add_argument('--dry-run', action='store_true', help='показать план и выйти')
+    parser.add_argument('--db', default=DB_PATH, help='URL базы данных')
+    args = parser.parse_args(argv)
+
+    from log_setup import setup_logging
+    setup_logging()
+    try:
+        run(args.db, once=args.once, dry_run=args.dry_run)
+    except KeyboardInterrupt:
+        logger.info("🛑 Планировщик остановлен")
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,420 @@
 import requests
 import time
 import random
+import re
+import heapq
+import hashlib
+from io import StringIO
 import pandas as pd
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 import logging
+from log_setup import log_context
+from archive import archive_page
+from transport import make_session, accept_encoding, cached_page, conditional_headers, ArchivedResponse
 from config import (
     MIN_REQUEST_DELAY, MAX_REQUEST_DELAY, 
     LONG_PAUSE_INTERVAL, LONG_PAUSE_MIN, LONG_PAUSE_MAX,
-    MAX_RETRIES, RETRY_BASE_DELAY
+    MAX_RETRIES, RETRY_BASE_DELAY, REQUEST_TIMEOUT, PAGE_ARCHIVE_DIR,
+    CONDITIONAL_GET
 )
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+def extract_fbref_id(href, kind):
+    """
+    Extracts the FBref id from a link like /en/<kind>/<id>/...
+    (kind: 'squads', 'players', 'matches'). Returns None if the link doesn't match.
+    """
+    if not isinstance(href, str) or not href:
+        return None
+    parts = href.split('/')
+    if kind in parts:
+        idx = parts.index(kind)
+        if len(parts) > idx + 1 and parts[idx + 1]:
+            return parts[idx + 1]
+    return None
+
+def extract_player_ids(table):
+    """
+    Собирает ID игроков из ссылок /en/players/<id>/ в таблице статистики.
+    Возвращает словарь {имя игрока: fbref_id}.
+    """
+    player_ids = {}
+    for cell in table.find_all(['th', 'td'], {'data-stat': 'player'}):
+        link = cell.find('a')
+        if not link:
+            continue
+        fbref_id = extract_fbref_id(link.get('href'), 'players')
+        if fbref_id:
+            player_ids[link.text.strip()] = fbref_id
+    return player_ids
+
+def _cell_text(cell):
+    return cell[0] if isinstance(cell, tuple) else cell
+
+def _cell_href(cell):
+    return cell[1] if isinstance(cell, tuple) else None
+
+def split_match_log_links(df):
+    """
+    Converts a match log parsed with extract_links='body' back to plain text cells
+    and adds id columns taken from the links (match_id, opponent_id, opponent_url, captain_id).
+    """
+    links = {}
+    for col in ('Match Report', 'Opponent', 'Captain'):
+        if col in df.columns:
+            links[col] = df[col].map(_cell_href)
+        else:
+            links[col] = pd.Series([None] * len(df), index=df.index)
+
+    df = df.map(_cell_text)
+    df['match_id'] = links['Match Report'].map(lambda href: extract_fbref_id(href, 'matches'))
+    df['match_report_url'] = links['Match Report'].where(df['match_id'].notna(), None)
+    df['opponent_id'] = links['Opponent'].map(lambda href: extract_fbref_id(href, 'squads'))
+    df['opponent_url'] = links['Opponent']
+    df['captain_id'] = links['Captain'].map(lambda href: extract_fbref_id(href, 'players'))
+    return df
+
+def parse_team_identity(content):
+    """
+    Определяет команду и сезон по сохраненной странице команды:
+    canonical ссылка /en/squads/<id>/[<season>/]<Name>-Stats и заголовок h1 ('2023-2024 Arsenal Stats').
+    Возвращает dict (fbref_id, name, url, season) или None, если это не страница команды.
+    """
+    soup = BeautifulSoup(content, 'lxml', parse_only=SoupStrainer(['link', 'h1']))
+    canonical = soup.find('link', rel='canonical')
+    href = canonical.get('href') if canonical else None
+    fbref_id = extract_fbref_id(href, 'squads')
+    if not fbref_id:
+        return None
+
+    title = soup.find('h1')
+    title_text = ' '.join(title.text.split()) if title else ''
+    season = re.search(r'\d{4}(?:-\d{4})?', title_text)
+    name = re.sub(r'^\d{4}(?:-\d{4})?\s+', '', title_text)
+    name = re.sub(r'\s+Stats.*$', '', name)
+    return {
+        'fbref_id': fbref_id,
+        'name': name or fbref_id,
+        'url': href.replace('https://fbref.com', ''),
+        'season': season.group(0) if season else None,
+    }
+
+# Таблица целиком: FBref не вкладывает таблицы друг в друга
+TABLE_FRAGMENT_RE = re.compile(r'<table\b[^>]*>.*?</table>', re.S | re.I)
+TABLE_ID_RE = re.compile(r'\bid\s*=\s*["\']([^"\']+)["\']')
+
+def iter_table_fragments(content):
+    """(table_id, HTML фрагмент) для каждой таблицы с id; комментарии FBref уже должны быть сняты"""
+    for found in TABLE_FRAGMENT_RE.finditer(content):
+        fragment = found.group(0)
+        table_id = TABLE_ID_RE.search(fragment[:fragment.index('>') + 1])
+        if table_id:
+            yield table_id.group(1), fragment
+
+def table_hash(fragment):
+    """Хэш HTML таблицы: по нему повторно скачанная страница разбирает только изменившиеся таблицы"""
+    return hashlib.blake2b(fragment.encode('utf-8'), digest_size=16).hexdigest()
+
+def parse_team_stats(content, known_hashes=None):
+    """
+    Extracts squad and player statistics tables from the HTML of a team page.
+    Returns a dict with 'squad', 'players' (table_id -> DataFrame),
+    'player_ids' (player name -> FBref player id) and 'hashes' (table_id -> table_hash).
+    Tables whose hash equals known_hashes[table_id] (the previous load) are not parsed
+    and are listed in 'unchanged'.
+    """
+    # FBref often puts tables in comments to save bandwidth on initial load.
+    # We need to remove comments to see all tables.
+    content = content.replace('<!--', '').replace('-->', '')
+    known_hashes = known_hashes or {}
+    
+    stats_data = {
+        'squad': {},
+        'players': {},
+        'player_ids': {},
+        'hashes': {},
+        'unchanged': set(),
+    }
+    
+    # This is a heuristic mapping. FBref tables are numerous.
+    # Tables are cut out of the page as raw fragments; only changed ones go through BS4 and read_html.
+    tables = list(iter_table_fragments(content))
+    
+    logger.info("   Всего таблиц на странице: %d", len(tables), extra={'stage': 'parse'})
+    
+    # Debug: выводим все ID таблиц (список собирается, только если DEBUG включен)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("   ID всех таблиц: %s", [table_id for table_id, _ in tables], extra={'stage': 'parse'})
+    
+    for table_id, fragment in tables:
+        # Example IDs: 
+        # stats_standard_9 (Standard Stats for players)
+        # stats_squads_standard_for (Standard Stats for squad)
+        # stats_defense_9 (Defensive actions for players)
+        # stats_squads_defense_for (Defensive actions for squad)
+        
+        # Пропускаем таблицы матчей
+        if 'matchlogs' in table_id or 'fixtures' in table_id or 'scores' in table_id:
+            continue
+        
+        # Таблицы команд содержат 'squads' в ID, таблицы игроков - 'stats_' без 'squads'
+        is_squad = 'squads' in table_id.lower()
+        is_players = not is_squad and 'stats_' in table_id
+        if not is_squad and not is_players:
+            continue
+        
+        digest = table_hash(fragment)
+        stats_data['hashes'][table_id] = digest
+        if known_hashes.get(table_id) == digest:
+            stats_data['unchanged'].add(table_id)
+            continue
+            
+        # Convert this specific table to df
+        try:
+            df_list = pd.read_html(StringIO(fragment))
+            if not df_list:
+                continue
+            df = df_list[0]
+        except ValueError:
+            continue
+        
+        if is_squad:
+            stats_data['squad'][table_id] = df
+            logger.debug("   Найдена таблица команды: %s", table_id, extra={'stage': 'table', 'table': table_id})
+        else:
+            stats_data['players'][table_id] = df
+            table = BeautifulSoup(fragment, 'lxml').find('table')
+            stats_data['player_ids'].update(extract_player_ids(table))
+            logger.debug("   Найдена таблица игроков: %s", table_id, extra={'stage': 'table', 'table': table_id})
+    
+    if stats_data['unchanged']:
+        logger.info("   Таблиц без изменений: %d из %d", len(stats_data['unchanged']), len(stats_data['hashes']),
+                    extra={'stage': 'parse'})
+    return stats_data
+
+def parse_match_logs(content):
+    """
+    Extracts the match log (Scores & Fixtures) table from the HTML of a team page
+    (see split_match_log_links for the added id columns). Returns None if there is no such table.
+    """
+    content = content.replace('<!--', '').replace('-->', '')
+    
+    # Look for table with id matching 'matchlogs_for'
+    # It might be 'matchlogs_for' or similar.
+    soup = BeautifulSoup(content, 'lxml')
+    table = soup.find('table', id=lambda x: x and 'matchlogs' in x)
+    if not table:
+        return None
+    
+    # extract_links='body' returns (text, href) tuples for every cell
+    df_list = pd.read_html(StringIO(str(table)), extract_links='body')
+    if not df_list:
+        return None
+    return split_match_log_links(df_list[0])
+
+def page_file_name(url):
+    """'https://fbref.com/en/squads/18bb7c10/Arsenal-Stats' -> 'en__squads__18bb7c10__Arsenal-Stats.html'"""
+    path = re.sub(r'^https?://[^/]+', '', url).split('?')[0].strip('/')
+    return re.sub(r'[^A-Za-z0-9._-]+', '__', path) + '.html'
+
+# Типы событий FBref (класс иконки в #events_wrap)
+EVENT_TYPES = (
+    'goal', 'own_goal', 'penalty_goal', 'penalty_miss',
+    'yellow_card', 'red_card', 'yellow_red_card', 'substitute_in',
+)
+
+class MatchReportQueue:
+    """
+    Очередь отчетов о матчах с приоритетом: сначала самые свежие матчи.
+    Уже загруженные (done) и уже поставленные в очередь матчи пропускаются.
+    """
+
+    def __init__(self, done=None):
+        self._heap = []
+        self._seen = set(done or ())
+        self._counter = 0
+
+    def push(self, match_id, url, date=None):
+        """Ставит отчет в очередь. Возвращает False, если матч уже загружен или в очереди"""
+        if not match_id or not url or match_id in self._seen:
+            return False
+        self._seen.add(match_id)
+        # heapq - min-heap, поэтому более поздняя дата = меньший ключ
+        priority = -pd.Timestamp(date).toordinal() if date is not None and not pd.isna(date) else 0
+        self._counter += 1
+        heapq.heappush(self._heap, (priority, self._counter, match_id, url))
+        return True
+
+    def push_match_logs(self, df):
+        """Находит ссылки Match Report в логе матчей (get_match_logs) и ставит сыгранные матчи в очередь"""
+        if df is None or df.empty or 'match_id' not in df.columns:
+            return 0
+        added = 0
+        for match_id, url, date in zip(df['match_id'], df['match_report_url'], df['Date']):
+            if isinstance(match_id, str) and isinstance(url, str):
+                added += self.push(match_id, url, pd.to_datetime(date, errors='coerce'))
+        return added
+
+    def pop(self):
+        """Возвращает (match_id, url) самого приоритетного отчета"""
+        _, _, match_id, url = heapq.heappop(self._heap)
+        return match_id, url
+
+    def __len__(self):
+        return len(self._heap)
+
+def _parse_minute(text):
+    """'45+2’' -> (45, 2); '23’' -> (23, None)"""
+    found = re.search(r"(\d+)(?:\s*\+\s*(\d+))?", text or '')
+    if not found:
+        return None, None
+    return int(found.group(1)), int(found.group(2)) if found.group(2) else None
+
+def _player_link_id(cell):
+    link = cell.find('a', href=lambda h: h and '/players/' in h) if cell else None
+    if not link:
+        return None, None
+    return extract_fbref_id(link.get('href'), 'players'), link.text.strip()
+
+def _stat_text(row, stat):
+    cell = row.find(['th', 'td'], {'data-stat': stat})
+    text = cell.text.strip() if cell else ''
+    return text or None
+
+def parse_match_report(content):
+    """
+    Разбирает страницу Match Report FBref.
+    Возвращает dict с командами ('home_team_id', 'away_team_id' - FBref ID, и их названиями)
+    и списками 'lineups', 'events', 'shots' (ID игроков и команд - FBref ID).
+    """
+    content = content.replace('<!--', '').replace('-->', '')
+    soup = BeautifulSoup(content, 'lxml')
+
+    # Хозяева и гости - первые два блока scorebox
+    team_ids, team_names = [], []
+    scorebox = soup.find('div', class_='scorebox')
+    if scorebox:
+        for block in scorebox.find_all('div', recursive=False)[:2]:
+            link = block.find('a', href=lambda h: h and '/squads/' in h)
+            team_ids.append(extract_fbref_id(link.get('href'), 'squads') if link else None)
+            team_names.append(link.text.strip() if link else None)
+    while len(team_ids) < 2:
+        team_ids.append(None)
+        team_names.append(None)
+    side_team = {'a': team_ids[0], 'b': team_ids[1]}
+
+    # Минуты и позиции из таблиц stats_<squad_id>_summary
+    summary = {}
+    for table in soup.find_all('table', id=lambda x: x and x.startswith('stats_') and x.endswith('_summary')):
+        for row in table.find_all('tr'):
+            player_id, _ = _player_link_id(row.find(['th', 'td'], {'data-stat': 'player'}))
+            if player_id:
+                minutes = _stat_text(row, 'minutes')
+                summary[player_id] = {
+                    'position': _stat_text(row, 'position'),
+                    'minutes': int(minutes) if minutes and minutes.isdigit() else None,
+                }
+
+    lineups = []
+    for side in ('a', 'b'):
+        lineup = soup.find('div', class_='lineup', id=side)
+        if not lineup:
+            continue
+        is_starter = True
+        for row in lineup.find_all('tr'):
+            header = row.find('th')
+            if header is not None:
+                # Первый заголовок - "Команда (4-3-3)", следующий - "Bench"
+                if 'Bench' in header.text:
+                    is_starter = False
+                continue
+            cells = row.find_all('td')
+            player_id, name = _player_link_id(row)
+            if not player_id:
+                continue
+            number = cells[0].text.strip() if cells else ''
+            details = summary.get(player_id, {})
+            lineups.append({
+                'team_id': side_team[side],
+                'player_id': player_id,
+                'player_name': name,
+                'shirt_number': int(number) if number.isdigit() else None,
+                'is_starter': is_starter,
+                'position': details.get('position'),
+                'minutes': details.get('minutes'),
+            })
+
+    events = []
+    events_wrap = soup.find('div', id='events_wrap')
+    if events_wrap:
+        for event in events_wrap.find_all('div', class_='event'):
+            classes = event.get('class', [])
+            side = 'a' if 'a' in classes else 'b' if 'b' in classes else None
+            icon = event.find('div', class_='event_icon')
+            icon_classes = icon.get('class', []) if icon else []
+            event_type = next((c for c in icon_classes if c in EVENT_TYPES), None)
+            if event_type is None:
+                continue
+            first = event.find('div')
+            minute, added_time = _parse_minute(first.text if first else '')
+            players = [
+                (extract_fbref_id(a.get('href'), 'players'), a.text.strip())
+                for a in event.find_all('a', href=lambda h: h and '/players/' in h)
+            ]
+            events.append({
+                'team_id': side_team.get(side),
+                'minute': minute,
+                'added_time': added_time,
+                'event_type': event_type,
+                'player_id': players[0][0] if players else None,
+                'player_name': players[0][1] if players else None,
+                # Ассистент для гола, заменяемый игрок для замены
+                'secondary_player_id': players[1][0] if len(players) > 1 else None,
+                'secondary_player_name': players[1][1] if len(players) > 1 else None,
+            })
+
+    shots = []
+    shots_table = soup.find('table', id='shots_all')
+    if shots_table and shots_table.find('tbody'):
+        for row in shots_table.find('tbody').find_all('tr'):
+            if 'thead' in (row.get('class') or []) or 'spacer' in (row.get('class') or []):
+                continue
+            player_id, name = _player_link_id(row.find(['th', 'td'], {'data-stat': 'player'}))
+            if not player_id:
+                continue
+            team_cell = row.find('td', {'data-stat': 'squad'}) or row.find('td', {'data-stat': 'team'})
+            team_link = team_cell.find('a') if team_cell else None
+            minute, added_time = _parse_minute(_stat_text(row, 'minute'))
+            xg = _stat_text(row, 'xg_shot')
+            distance = _stat_text(row, 'distance')
+            shots.append({
+                'team_id': extract_fbref_id(team_link.get('href'), 'squads') if team_link else None,
+                'player_id': player_id,
+                'player_name': name,
+                'minute': minute,
+                'added_time': added_time,
+                'xg': float(xg) if xg else None,
+                'outcome': _stat_text(row, 'outcome'),
+                'distance': int(distance) if distance and distance.isdigit() else None,
+                'body_part': _stat_text(row, 'body_part'),
+            })
+
+    return {
+        'home_team_id': team_ids[0],
+        'away_team_id': team_ids[1],
+        'home_team_name': team_names[0],
+        'away_team_name': team_names[1],
+        'lineups': lineups,
+        'events': events,
+        'shots': shots,
+    }
+
 class FBRefScraper:
-    def __init__(self, base_url='https://fbref.com'):
+    def __init__(self, base_url='https://fbref.com', proxy=None):
         self.base_url = base_url
-        self.session = requests.Session()
+        # requests.Session или HTTP/2 сессия httpx (transport.py, HTTP2 в config.py)
+        self.session = make_session(proxy=proxy)
         
         # Список реалистичных User-Agent'ов (последние версии браузеров)
         self.user_agents = [
@@ -32,7 +429,14 @@ class FBRefScraper:
         self.last_request_time = 0
         self.request_delay_min = MIN_REQUEST_DELAY
         self.request_delay_max = MAX_REQUEST_DELAY
+        self.long_pause_min = LONG_PAUSE_MIN
+        self.long_pause_max = LONG_PAUSE_MAX
+        self.read_delay_min = 1.0
+        self.read_delay_max = 3.0
+        self.retry_base_delay = RETRY_BASE_DELAY
+        self.timeout = REQUEST_TIMEOUT
         self.request_count = 0
+        self.not_modified_count = 0
 
     def _update_headers(self):
         """Обновляет заголовки с случайным User-Agent для имитации разных пользователей"""
@@ -40,7 +444,8 @@ class FBRefScraper:
             'User-Agent': random.choice(self.user_agents),
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
             'Accept-Language': 'en-US,en;q=0.9,ru;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
+            # Только кодировки, которые клиент сессии распакует (br - с пакетом brotli, zstd - с zstandard)
+            'Accept-Encoding': accept_encoding(self.session),
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1',
             'Sec-Fetch-Dest': 'document',
@@ -60,8 +465,8 @@ class FBRefScraper:
         
         # Каждые N запросов делаем более длинную паузу (имитация чтения страницы)
         if self.request_count > 0 and self.request_count % LONG_PAUSE_INTERVAL == 0:
-            delay = random.uniform(LONG_PAUSE_MIN, LONG_PAUSE_MAX)
-            logger.info(f"🕐 Длинная пауза для имитации чтения страницы...")
+            delay = random.uniform(self.long_pause_min, self.long_pause_max)
+            logger.info("🕐 Длинная пауза для имитации чтения страницы...")
         
         if elapsed < delay:
             sleep_time = delay - elapsed
@@ -69,7 +474,11 @@ class FBRefScraper:
             time.sleep(sleep_time)
 
     def get(self, url, retry_count=0):
-        """Выполняет GET запрос с имитацией человеческого поведения"""
+        """
+        Выполняет GET запрос с имитацией человеческого поведения.
+        Если страница есть в архиве (PAGE_ARCHIVE_DIR), запрос условный: на ответ 304
+        возвращается ArchivedResponse с телом из архива.
+        """
         self._wait_for_rate_limit()
         
         if not url.startswith('http'):
@@ -86,15 +495,28 @@ class FBRefScraper:
             headers = self.session.headers.copy()
             if self.request_count > 0:
                 headers['Referer'] = self.base_url
+            cached = cached_page(url, PAGE_ARCHIVE_DIR) if CONDITIONAL_GET and PAGE_ARCHIVE_DIR else None
+            if cached is not None:
+                headers.update(conditional_headers(cached))
+            
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
             
-            response = self.session.get(url, headers=headers, timeout=30)
+            if response.status_code == 304 and cached is not None:
+                self.last_request_time = time.time()
+                self.request_count += 1
+                self.not_modified_count += 1
+                logger.info(f"♻️  Страница не изменилась (304), берется из архива от {cached.fetched:%Y-%m-%d %H:%M}")
+                return ArchivedResponse(response, cached)
             
-            if response.status_code == 403:
-                logger.warning(f"⚠️  Получен 403 Forbidden (попытка {retry_count + 1}/{MAX_RETRIES})")
+            if response.status_code in (403, 429):
+                logger.warning(f"⚠️  Получен {response.status_code} (попытка {retry_count + 1}/{MAX_RETRIES})")
                 
                 if retry_count < MAX_RETRIES:
-                    # Экспоненциальная задержка при 403
-                    wait_time = (2 ** retry_count) * RETRY_BASE_DELAY + random.uniform(5, 15)
+                    # Экспоненциальная задержка; при 429 сервер может указать ее сам (Retry-After)
+                    wait_time = (2 ** retry_count + random.uniform(0.5, 1.5)) * self.retry_base_delay
+                    retry_after = response.headers.get('Retry-After', '')
+                    if response.status_code == 429 and retry_after.isdigit():
+                        wait_time = int(retry_after)
                     logger.info(f"⏰ Ожидание {wait_time:.1f}с перед повторной попыткой...")
                     time.sleep(wait_time)
                     
@@ -110,6 +532,9 @@ class FBRefScraper:
             self.request_count += 1
             
             logger.info(f"✅ Успешно получено (статус {response.status_code})")
+            if PAGE_ARCHIVE_DIR:
+                archive_page(url, response.content, response.status_code, PAGE_ARCHIVE_DIR,
+                             response.headers.get('ETag'), response.headers.get('Last-Modified'))
             return response
             
         except requests.exceptions.Timeout:
@@ -117,6 +542,13 @@ class FBRefScraper:
             if retry_count < MAX_RETRIES:
                 return self.get(url, retry_count + 1)
             return None
+        
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+            # Соединение оборвано (в том числе посреди ответа) - страница не дочитана
+            logger.error(f"🔌 Обрыв соединения при запросе {url}: {e}")
+            if retry_count < MAX_RETRIES:
+                return self.get(url, retry_count + 1)
+            return None
             
         except requests.exceptions.RequestException as e:
             logger.error(f"❌ Ошибка при запросе {url}: {e}")
@@ -127,7 +559,7 @@ class FBRefScraper:
         response = self.get(url)
         if response:
             # Имитация времени на "чтение" страницы
-            read_time = random.uniform(1.0, 3.0)
+            read_time = random.uniform(self.read_delay_min, self.read_delay_max)
             logger.info(f"📖 Обработка страницы ({read_time:.1f}с)...")
             time.sleep(read_time)
             return BeautifulSoup(response.content, 'lxml')
@@ -170,149 +602,114 @@ class FBRefScraper:
                     name = link.text.strip()
                     # href is like /en/squads/18bb7c10/Arsenal-Stats
                     # fbref_id is 18bb7c10
-                    parts = href.split('/')
-                    if 'squads' in parts:
-                        idx = parts.index('squads')
-                        if len(parts) > idx + 1:
-                            fbref_id = parts[idx+1]
-                            teams.append({
-                                'name': name,
-                                'url': href,
-                                'fbref_id': fbref_id
-                            })
+                    fbref_id = extract_fbref_id(href, 'squads')
+                    if fbref_id:
+                        teams.append({
+                            'name': name,
+                            'url': href,
+                            'fbref_id': fbref_id
+                        })
         
         return teams
 
-    def get_team_stats(self, team_url):
-        """
-        Fetches the team page and extracts both squad and player statistics.
-        Returns a dict with 'squad_stats' and 'player_stats'.
-        """
+    def get_team_page(self, team_url):
+        """Скачивает страницу команды и возвращает ее HTML (str) или None"""
         if not team_url.startswith('http'):
             team_url = self.base_url + team_url
             
-        logger.info(f"Scraping stats from {team_url}...")
+        logger.info(f"Scraping team page {team_url}...")
         
-        # We need the raw HTML for pandas to parse tables, but we might need soup for some metadata
         # pandas read_html can take a URL but we want to use our session with rate limiting.
         response = self.get(team_url)
         if not response:
             return None
+        return response.content.decode('utf-8')
+
+    def get_team_data(self, team_url, known_hashes=None):
+        """
+        Лог матчей и статистика команды за один запрос страницы: (match_logs, stats)
+        как у get_match_logs и get_team_stats; None для того, что не удалось получить.
+        """
+        content = self.get_team_page(team_url)
+        if content is None:
+            return None, None
+        return self._parse_match_logs(content), self._parse_team_stats(content, known_hashes, team_url)
 
-        # Parse with pandas
+    def _parse_team_stats(self, content, known_hashes, team_url):
         try:
-            # FBref often puts tables in comments to save bandwidth on initial load.
-            # We need to remove comments to see all tables.
-            content = response.content.decode('utf-8')
-            content = content.replace('<!--', '').replace('-->', '')
-            
-            # Use StringIO to avoid FutureWarning
-            from io import StringIO
-            dfs = pd.read_html(StringIO(content))
-            
-            # We also parse with BS4 to map table IDs to dataframes if needed, 
-            # but read_html usually gets all visible tables.
-            # The challenge is identifying which table is which.
-            # Usually tables have captions or we can identify by columns.
-            
-            # For now, let's try to identify 'Standard Stats' and 'Defense' as requested.
-            # We will store them in a dictionary keyed by table type.
-            
-            stats_data = {
-                'squad': {},
-                'players': {}
-            }
-            
-            # This is a heuristic mapping. FBref tables are numerous.
-            # We will look for specific keywords in table attributes if we could, 
-            # but read_html just gives list of DFs.
-            # We can re-parse with BS4 to get table IDs, then map to DFs.
-            
-            soup = BeautifulSoup(content, 'lxml')
-            tables = soup.find_all('table')
-            
-            logger.info(f"   Всего таблиц на странице: {len(tables)}")
-            
-            # Debug: выводим все ID таблиц
-            all_table_ids = [t.get('id', 'NO_ID') for t in tables if t.get('id')]
-            logger.debug(f"   ID всех таблиц: {all_table_ids}")
-            
-            for table in tables:
-                table_id = table.get('id', '')
-                if not table_id:
-                    continue
-                    
-                # Convert this specific table to df
-                try:
-                    from io import StringIO
-                    df_list = pd.read_html(StringIO(str(table)))
-                    if not df_list:
-                        continue
-                    df = df_list[0]
-                except ValueError:
-                    continue
-
-                # Check if it's a squad or player table
-                # Squad tables usually have 'squads' in ID or are small (2 rows: For, Against).
-                # Player tables usually have 'player' in ID or many rows.
-                
-                # Example IDs: 
-                # stats_standard_9 (Standard Stats for players)
-                # stats_squads_standard_for (Standard Stats for squad)
-                # stats_defense_9 (Defensive actions for players)
-                # stats_squads_defense_for (Defensive actions for squad)
-                
-                # Пропускаем таблицы матчей
-                if 'matchlogs' in table_id or 'fixtures' in table_id or 'scores' in table_id:
-                    continue
-                
-                # Таблицы команд содержат 'squads' в ID
-                if 'squads' in table_id.lower():
-                    stats_data['squad'][table_id] = df
-                    logger.debug(f"   Найдена таблица команды: {table_id}")
-                # Таблицы игроков содержат 'stats_' но НЕ 'squads'
-                elif 'stats_' in table_id and 'squads' not in table_id.lower():
-                    stats_data['players'][table_id] = df
-                    logger.debug(f"   Найдена таблица игроков: {table_id}")
-            
-            return stats_data
-            
+            return parse_team_stats(content, known_hashes)
         except Exception as e:
             logger.error(f"Error parsing tables from {team_url}: {e}")
             return None
 
+    def _parse_match_logs(self, content):
+        try:
+            df = parse_match_logs(content)
+            if df is None:
+                logger.warning("Match logs table not found.")
+            return df
+        except Exception as e:
+            logger.error(f"Error parsing match logs: {e}")
+            return None
+
+    def get_team_stats(self, team_url, known_hashes=None):
+        """
+        Fetches the team page and extracts both squad and player statistics.
+        Returns a dict with 'squad', 'players' (table_id -> DataFrame)
+        and 'player_ids' (player name -> FBref player id); see parse_team_stats for known_hashes.
+        Для лога матчей той же страницы - get_team_data (один запрос вместо двух).
+        """
+        content = self.get_team_page(team_url)
+        if content is None:
+            return None
+        return self._parse_team_stats(content, known_hashes, team_url)
+
     def get_match_logs(self, team_url):
         """
         Extracts match logs (Scores & Fixtures) from the team page.
+        Besides the visible columns adds FBref ids parsed from the links:
+        match_id (Match Report), opponent_id / opponent_url (Opponent), captain_id (Captain).
         """
-        if not team_url.startswith('http'):
-            team_url = self.base_url + team_url
-            
-        logger.info(f"Scraping match logs from {team_url}...")
-        response = self.get(team_url)
-        if not response:
+        content = self.get_team_page(team_url)
+        if content is None:
             return None
-            
-        try:
+        return self._parse_match_logs(content)
+
+    def get_match_report(self, match_id, url):
+        """
+        Возвращает разобранный отчет о матче.
+        Страница берется из архива (PAGE_ARCHIVE_DIR), если уже скачана: отчет сыгранного матча
+        не меняется, поэтому повторный запуск его не скачивает.
+        """
+        archived = cached_page(url, PAGE_ARCHIVE_DIR, validators=False) if PAGE_ARCHIVE_DIR else None
+        if archived is not None:
+            content = archived.content.decode('utf-8')
+        else:
+            response = self.get(url)
+            if not response:
+                return None
             content = response.content.decode('utf-8')
-            content = content.replace('<!--', '').replace('-->', '')
-            
-            soup = BeautifulSoup(content, 'lxml')
-            
-            # Look for table with id matching 'matchlogs_for'
-            # It might be 'matchlogs_for' or similar.
-            table = soup.find('table', id=lambda x: x and 'matchlogs' in x)
-            
-            if table:
-                from io import StringIO
-                df_list = pd.read_html(StringIO(str(table)))
-                if df_list:
-                    return df_list[0]
-            
-            logger.warning("Match logs table not found.")
-            return None
-            
+        
+        try:
+            return parse_match_report(content)
         except Exception as e:
-            logger.error(f"Error parsing match logs: {e}")
+            logger.error(f"Error parsing match report {match_id}: {e}")
             return None
 
+    def fetch_match_reports(self, queue, handler, limit=None):
+        """
+        Забирает отчеты из очереди (сначала свежие) и передает каждый в handler(match_id, report).
+        handler сохраняет отчет в БД, поэтому прерванный запуск продолжается с того же места.
+        Возвращает количество обработанных отчетов.
+        """
+        processed = 0
+        while len(queue) and (limit is None or processed < limit):
+            match_id, url = queue.pop()
+            logger.info(f"🧾 Отчет о матче {match_id} (в очереди: {len(queue)})")
+            with log_context(match=match_id, stage='report'):
+                report = self.get_match_report(match_id, url)
+            if report is None:
+                continue
+            handler(match_id, report)
+            processed += 1
+        return processed
@@ -0,0 +1,120 @@
+"""
+Нечеткий поиск команд и игроков по имени.
+
+In-memory индекс триграмм строится один раз при старте (по одному запросу на таблицу).
+Имена нормализуются (без диакритики, регистра и пунктуации), поэтому 'Odegaard'
+находит 'Martin Ødegaard', а псевдонимы из config.TEAM_ALIASES ('Spurs', 'Man Utd')
+ведут на нужную команду. Списки вхождений триграмм хранятся в массивах NumPy,
+так что поиск по десяткам тысяч игроков занимает доли миллисекунды.
+"""
+
+import re
+import unicodedata
+from collections import defaultdict
+import numpy as np
+from config import TEAM_ALIASES
+
+# Буквы, которые не раскладываются NFKD на базовую букву + диакритику
+_SPECIAL_LETTERS = str.maketrans({
+    'ø': 'o', 'Ø': 'o', 'æ': 'ae', 'Æ': 'ae', 'ß': 'ss', 'đ': 'd', 'Đ': 'd',
+    'ł': 'l', 'Ł': 'l', 'ı': 'i', 'þ': 'th', 'ð': 'd', 'œ': 'oe', 'Œ': 'oe',
+})
+
+def fold(text):
+    """'Martin Ødegaard' -> 'martin odegaard'"""
+    text = unicodedata.normalize('NFKD', str(text).translate(_SPECIAL_LETTERS))
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', text).split())
+
+def trigrams(text):
+    """Множество триграмм нормализованной строки (с границами слов)"""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class NameIndex:
+    """
+    Индекс триграмм по именам. Ранжирование - коэффициент Дайса по триграммам
+    с бонусом за точное совпадение имени или псевдонима.
+    """
+
+    def __init__(self):
+        self.ids = []        # ID сущности для каждой записи
+        self.names = []      # Отображаемое имя для каждой записи
+        self._keys = []      # Нормализованное имя/псевдоним
+        self._exact = {}     # нормализованное имя/псевдоним -> номер записи
+        self._postings = defaultdict(list)
+        self._gram_counts = None
+
+    def add(self, entity_id, name, aliases=()):
+        """Добавляет сущность; каждый псевдоним индексируется как отдельная запись с тем же ID"""
+        for key in (name, *aliases):
+            folded = fold(key)
+            if not folded:
+                continue
+            entry = len(self.ids)
+            self.ids.append(entity_id)
+            self.names.append(name)
+            self._keys.append(folded)
+            self._exact.setdefault(folded, entry)
+            for gram in trigrams(folded):
+                self._postings[gram].append(entry)
+
+    def build(self):
+        """Замораживает индекс: списки вхождений -> массивы NumPy"""
+        self._postings = {gram: np.asarray(entries, dtype=np.int32) for gram, entries in self._postings.items()}
+        self._gram_counts = np.fromiter((len(trigrams(k)) for k in self._keys), dtype=np.float32, count=len(self._keys))
+        return self
+
+    def search(self, query, limit=5, min_score=0.3):
+        """
+        Возвращает до limit результатов [(score, entity_id, name)] по убыванию score.
+        Одна сущность возвращается один раз (лучшая из ее записей).
+        """
+        folded = fold(query)
+        if not folded or not self.ids:
+            return []
+
+        grams = trigrams(folded)
+        hits = [self._postings[g] for g in grams if g in self._postings]
+        if not hits:
+            return []
+
+        counts = np.bincount(np.concatenate(hits), minlength=len(self.ids))
+        candidates = np.nonzero(counts)[0]
+        scores = 2.0 * counts[candidates] / (len(grams) + self._gram_counts[candidates])
+
+        exact = self._exact.get(folded)
+        if exact is not None:
+            scores[candidates == exact] += 1.0
+
+        # Берем с запасом: у одной сущности может быть несколько записей (псевдонимы)
+        top = min(len(candidates), limit * 4)
+        best = np.argpartition(-scores, top - 1)[:top]
+        best = best[np.argsort(-scores[best])]
+
+        results, seen = [], set()
+        for i in best:
+            if scores[i] < min_score:
+                break
+            entity_id = self.ids[candidates[i]]
+            if entity_id in seen:
+                continue
+            seen.add(entity_id)
+            results.append((float(scores[i]), entity_id, self.names[candidates[i]]))
+            if len(results) == limit:
+                break
+        return results
+
+def build_team_index(rows):
+    """Индекс команд (строки id, name) с псевдонимами из config.TEAM_ALIASES"""
+    index = NameIndex()
+    for team_id, name in rows:
+        index.add(team_id, name, TEAM_ALIASES.get(name, ()))
+    return index.build()
+
+def build_player_index(rows):
+    """Индекс игроков (строки id, name; одна запись на игрока, независимо от числа сезонов и команд)"""
+    index = NameIndex()
+    for player_id, name in rows:
+        index.add(player_id, name)
+    return index.build()
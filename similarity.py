@@ -0,0 +1,196 @@
+"""
+Поиск похожих игроков по показателям на 90 минут (player_per90).
+
+Матрица показателей хранится в SIMILARITY_DIR как .npy и открывается через mmap,
+рядом - ключи строк (игрок, команда, сезон, турнир), минуты и позиции (битовая маска).
+Стандартизация (z-score по колонкам) выполняется при запросе. Файлы одной сборки - версия
+каталога (versions.py): новая сборка пишется рядом и подменяет текущую атомарно, поэтому
+читатель не видит ключи одной сборки с векторами другой. Если не изменилось ничего,
+файлы не переписываются.
+
+Поиск - полный перебор NumPy (косинусная или евклидова мера) с фильтрами по позиции,
+минутам и сезону; на 50 тыс. игроко-сезонов занимает единицы миллисекунд.
+"""
+
+import os
+import json
+import logging
+import warnings
+import numpy as np
+from config import SIMILARITY_DIR
+from versions import current_version, new_version, publish_version, discard_version
+
+logger = logging.getLogger(__name__)
+
+FEATURES = ['goals', 'assists', 'xg', 'npxg', 'xag']
+POSITION_BITS = {'GK': 1, 'DF': 2, 'MF': 4, 'FW': 8}
+KEY_DTYPE = np.dtype([('player_id', 'i4'), ('team_id', 'i4'), ('season', 'U16'), ('competition', 'U64')])
+
+def position_mask(position):
+    """'FW,MF' -> 12 (битовая маска позиций FBref)"""
+    mask = 0
+    for part in (position or '').replace(' ', '').split(','):
+        mask |= POSITION_BITS.get(part[:2].upper(), 0)
+    return mask
+
+def _path(directory, name):
+    return os.path.join(directory, f'{name}.npy')
+
+def _load_rows(session):
+    """Строки player_per90 с позицией игрока, упорядоченные по ключу"""
+    from db import Player, PlayerPer90
+    rows = session.query(
+        PlayerPer90.player_id, PlayerPer90.team_id, PlayerPer90.season, PlayerPer90.competition,
+        PlayerPer90.minutes, Player.position, *(getattr(PlayerPer90, column) for column in FEATURES)
+    ).join(Player, PlayerPer90.player_id == Player.id).order_by(
+        PlayerPer90.season, PlayerPer90.competition, PlayerPer90.team_id, PlayerPer90.player_id
+    ).all()
+
+    keys = np.array([(r[0], r[1] or 0, r[2], r[3]) for r in rows], dtype=KEY_DTYPE)
+    minutes = np.array([r[4] or 0 for r in rows], dtype=np.int32)
+    positions = np.array([position_mask(r[5]) for r in rows], dtype=np.int8)
+    values = np.array([[np.nan if v is None else v for v in r[6:]] for r in rows], dtype=np.float32)
+    return keys, minutes, positions, values.reshape(len(rows), len(FEATURES))
+
+def _save(directory, arrays):
+    """Записывает файлы сборки в новую версию каталога и делает ее текущей"""
+    path = new_version(directory)
+    try:
+        for name, array in arrays.items():
+            with open(_path(path, name), 'wb') as f:
+                np.save(f, array)
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'features': FEATURES, 'rows': len(arrays['keys'])}, f)
+    except Exception:
+        discard_version(path)
+        raise
+    publish_version(directory, path)
+
+def build_index(session, directory=SIMILARITY_DIR):
+    """
+    Пересобирает матрицу по player_per90.
+    Возвращает 'unchanged', 'updated' (те же строки, другие значения) или 'rebuilt'.
+    """
+    keys, minutes, positions, values = _load_rows(session)
+
+    current = current_version(directory)
+    old_keys, same_features = None, False
+    if current is not None:
+        try:
+            old_keys = np.load(_path(current, 'keys'))
+            with open(os.path.join(current, 'meta.json')) as f:
+                same_features = json.load(f)['features'] == FEATURES
+        except (OSError, ValueError, KeyError):
+            old_keys = None
+
+    same_keys = same_features and old_keys is not None and np.array_equal(old_keys, keys)
+    if same_keys:
+        old_values = np.load(_path(current, 'vectors'), mmap_mode='r')
+        old_minutes = np.load(_path(current, 'minutes'), mmap_mode='r')
+        old_positions = np.load(_path(current, 'positions'), mmap_mode='r')
+        changed = ~(
+            ((old_values == values) | (np.isnan(old_values) & np.isnan(values))).all(axis=1)
+            & (old_minutes == minutes) & (old_positions == positions)
+        )
+        del old_values, old_minutes, old_positions
+        if not changed.any():
+            return 'unchanged'
+
+    _save(directory, {'keys': keys, 'minutes': minutes, 'positions': positions, 'vectors': values})
+    if same_keys:
+        logger.info(f"🧭 Индекс похожих игроков: изменено строк {int(changed.sum())}")
+        return 'updated'
+    logger.info(f"🧭 Индекс похожих игроков пересобран: строк {len(keys)}")
+    return 'rebuilt'
+
+class PlayerSimilarity:
+    """Индекс похожих игроков, открытый через mmap (build_index должен быть выполнен)"""
+
+    def __init__(self, directory=SIMILARITY_DIR):
+        path = current_version(directory)
+        if path is None:
+            raise FileNotFoundError(f"Индекс похожих игроков не построен: {directory}")
+        self.keys = np.load(_path(path, 'keys'), mmap_mode='r')
+        self.minutes = np.load(_path(path, 'minutes'), mmap_mode='r')
+        self.positions = np.load(_path(path, 'positions'), mmap_mode='r')
+        self.vectors = np.load(_path(path, 'vectors'), mmap_mode='r')
+        # Поля ключа для фильтров - непрерывными массивами
+        self.player_ids = np.ascontiguousarray(self.keys['player_id'])
+        self.seasons = np.ascontiguousarray(self.keys['season'])
+        # Статистика колонок по всем строкам (пустые колонки - среднее 0, отклонение 1)
+        if len(self.vectors):
+            with np.errstate(invalid='ignore'), warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                mean, std = np.nanmean(self.vectors, axis=0), np.nanstd(self.vectors, axis=0)
+        else:
+            mean = std = np.zeros(len(FEATURES))
+        self.mean = np.nan_to_num(mean)
+        self.std = np.where(np.nan_to_num(std) > 0, std, 1.0)
+
+    def _normalized(self, rows):
+        """z-score строк rows, пропуски (NaN) - среднее значение колонки (0)"""
+        return np.nan_to_num((self.vectors[rows] - self.mean) / self.std, nan=0.0)
+
+    def rows_of(self, player_id, season=None):
+        """Строки игрока; по умолчанию - одна строка с наибольшим числом минут"""
+        rows = np.flatnonzero(self.player_ids == player_id)
+        if season is not None:
+            rows = rows[self.seasons[rows] == season]
+        return rows
+
+    def similar(self, player_id, k=10, metric='cosine', position=None, min_minutes=0, season=None):
+        """
+        Топ-k игроко-сезонов, похожих на игрока (его сезон с наибольшим числом минут или season).
+        position: 'FW', 'MF,FW' - хотя бы одна из позиций. Возвращает [(score, key, minutes)],
+        score - косинусная близость (больше - ближе) или евклидово расстояние (меньше - ближе).
+        """
+        own = self.rows_of(player_id, season)
+        if not len(own):
+            return []
+        target = own[np.argmax(self.minutes[own])]
+
+        candidates = np.asarray(self.minutes) >= min_minutes
+        if position:
+            candidates &= (np.asarray(self.positions) & position_mask(position)) != 0
+        if season is not None:
+            candidates &= self.seasons == season
+        candidates[self.player_ids == player_id] = False
+        rows = np.flatnonzero(candidates)
+        if not len(rows):
+            return []
+
+        z = self._normalized(np.append(rows, target))
+        matrix, query = z[:-1], z[-1]
+        if metric == 'cosine':
+            norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+            scores = matrix @ query / np.where(norms > 0, norms, 1.0)
+            order = -scores
+        elif metric == 'euclidean':
+            scores = np.linalg.norm(matrix - query, axis=1)
+            order = scores
+        else:
+            raise ValueError(f"Неизвестная мера: {metric}")
+
+        k = min(k, len(rows))
+        top = np.argpartition(order, k - 1)[:k]
+        top = top[np.argsort(order[top])]
+        return [(float(scores[i]), self.keys[rows[i]], int(self.minutes[rows[i]])) for i in top]
+
+def refresh_index(db_path=None, directory=SIMILARITY_DIR):
+    """Пересобирает индекс по базе db_path (по умолчанию DB_PATH) - вызывается в конце запуска ETL"""
+    from db import init_db
+    from config import DB_PATH
+    session = init_db(db_path or DB_PATH)()
+    try:
+        return build_index(session, directory)
+    finally:
+        session.close()
+
+def main():
+    """Пересборка индекса похожих игроков"""
+    from log_setup import setup_logging
+    setup_logging(log_file=None)
+    logger.info(f"✅ Индекс похожих игроков: {refresh_index()}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+Staging база и атомарная публикация результатов запуска (SQLite).
+
+Запуск пишет в копию рабочей базы с отключенным fsync и без вторичных индексов,
+а по завершении загруженный срез (сезон и турнир) переносится в рабочую базу одной транзакцией.
+Рабочая база работает в режиме WAL, поэтому читатели (query_db.py) не блокируются
+и до COMMIT видят предыдущую опубликованную версию данных.
+
+Писатели рабочей базы разводятся блокировкой writer_lock:
+- исключительная - у каждого, кто открывает свой запуск журнала изменений (cdc.start_run):
+  main.py (через staging - от копирования рабочей базы до публикации, иначе публикация затерла бы
+  строки, записанные после копирования), проход планировщика (scheduler.py), reparse.py;
+- разделяемая - у воркеров jobs.py: они пишут прямо в базу в один общий запуск 'jobs',
+  а между собой их разводят транзакции SQLite.
+"""
+
+import os
+import sqlite3
+import logging
+from contextlib import nullcontext
+from sqlalchemy import create_engine
+from db import Base, dispose_engine
+from locks import FileLock
+
+logger = logging.getLogger(__name__)
+
+def sqlite_file(db_url):
+    """'sqlite:///football_data.db' -> 'football_data.db'"""
+    if not db_url.startswith('sqlite:///'):
+        raise ValueError(f"Staging поддерживается только для SQLite: {db_url}")
+    return db_url[len('sqlite:///'):]
+
+def writer_lock(db_url, shared=False):
+    """
+    Блокировка записи в рабочую базу SQLite (файл <база>.writer.lock, locks.FileLock).
+    shared=False - загрузка со своим запуском журнала изменений, shared=True - воркеры jobs.py.
+    Для других СУБД staging и журнал изменений не используются, блокировка не нужна.
+    """
+    if not db_url.startswith('sqlite:///'):
+        return nullcontext()
+    return FileLock(sqlite_file(db_url) + '.writer.lock', shared=shared)
+
+def _secondary_indexes(conn):
+    """Явно созданные индексы (автоиндексы UNIQUE/PRIMARY KEY не трогаем)"""
+    return conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+    ).fetchall()
+
+def prepare_staging(live_url, staging_url):
+    """
+    Создает staging базу как копию рабочей (backup API SQLite) и удаляет в ней
+    вторичные индексы на время загрузки. Возвращает URL staging базы.
+    ID новых строк продолжают последовательности рабочей базы, поэтому публикация
+    не требует перенумерации.
+    """
+    live_path = sqlite_file(live_url)
+    staging_path = sqlite_file(staging_url)
+
+    # Схема рабочей базы должна существовать до копирования
+    engine = create_engine(live_url)
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    if os.path.exists(staging_path):
+        # Соединения прошлого запуска в этом процессе держат удаляемый файл открытым
+        dispose_engine(staging_url)
+        os.remove(staging_path)
+
+    live = sqlite3.connect(live_path)
+    staging = sqlite3.connect(staging_path)
+    try:
+        live.backup(staging)
+        for name, _ in _secondary_indexes(staging):
+            staging.execute(f'DROP INDEX "{name}"')
+        staging.commit()
+    finally:
+        live.close()
+        staging.close()
+
+    logger.info(f"🧪 Staging база подготовлена: {staging_path}")
+    return staging_url
+
+# Строки среза (сезон, турнир) в таблицах с данными сезона; {db} - main или staging
+_SEASON_SLICE = 'season = :season AND competition = :competition'
+_MATCH_SLICE = f'match_id IN (SELECT id FROM {{db}}.matches WHERE {_SEASON_SLICE})'
+SLICE_FILTERS = {
+    'matches': _SEASON_SLICE,
+    'squad_stats': _SEASON_SLICE,
+    'player_stats': _SEASON_SLICE,
+    'player_per90': _SEASON_SLICE,
+    'team_form': _SEASON_SLICE,
+    'table_hashes': 'season = :season',
+    'team_match_stats': _MATCH_SLICE,
+    'team_ratings': _MATCH_SLICE,
+    'match_lineups': _MATCH_SLICE,
+    'match_events': _MATCH_SLICE,
+    'match_shots': _MATCH_SLICE,
+}
+# Журналы дописываются в конец и обрезаются с начала (CDC_RETENTION_RUNS): переносятся новые строки,
+# а строки, удаленные из начала журнала в staging, удаляются и в рабочей базе
+APPEND_ONLY = {'change_log', 'quarantine'}
+
+def publish(staging_url, live_url, season, competition):
+    """
+    Публикует срез (season, competition) staging базы одной транзакцией:
+    - таблицы сезона (SLICE_FILTERS) - строки среза удаляются и вставляются из staging;
+    - справочники (команды, игроки, ...) и etl_runs - upsert по id;
+    - журналы (APPEND_ONLY) - дописываются новые строки, обрезанное начало удаляется.
+    Объем работы - срез и справочники, а не вся база. Вызывается под writer_lock(live_url):
+    staging скопирована с рабочей базы под той же блокировкой, поэтому отличается от нее только
+    изменениями запуска. Индексы рабочей базы остаются на месте. Staging база после успешной
+    публикации удаляется.
+    """
+    live_path = sqlite_file(live_url)
+    staging_path = sqlite_file(staging_url)
+    params = {'season': season, 'competition': competition}
+
+    conn = sqlite3.connect(live_path, isolation_level=None)
+    try:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('ATTACH DATABASE ? AS staging', (staging_path,))
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            tables = Base.metadata.sorted_tables
+            # Сначала удаляются строки среза дочерних таблиц, потом родительских
+            for table in reversed(tables):
+                if table.name in SLICE_FILTERS:
+                    conn.execute(f'DELETE FROM main."{table.name}" '
+                                 f'WHERE {SLICE_FILTERS[table.name].format(db="main")}', params)
+                elif table.name in APPEND_ONLY:
+                    # Пустой журнал staging - обрезан целиком
+                    conn.execute(
+                        f'DELETE FROM main."{table.name}" WHERE id < coalesce('
+                        f'(SELECT min(id) FROM staging."{table.name}"), '
+                        f'(SELECT max(id) + 1 FROM main."{table.name}"))'
+                    )
+            # Вставка - родительские таблицы раньше дочерних; etl_runs - первой: пока в ней нет открытого
+            # запуска, триггеры журнала изменений не пишут перенос строк в change_log
+            for table in sorted(tables, key=lambda t: t.name != 'etl_runs'):
+                columns = [c.name for c in table.columns]
+                names = ', '.join(f'"{c}"' for c in columns)
+                select = f'INSERT INTO main."{table.name}" ({names}) SELECT {names} FROM staging."{table.name}"'
+                if table.name in SLICE_FILTERS:
+                    conn.execute(f'{select} WHERE {SLICE_FILTERS[table.name].format(db="staging")}', params)
+                elif table.name in APPEND_ONLY:
+                    conn.execute(f'{select} WHERE id > (SELECT coalesce(max(id), 0) FROM main."{table.name}")')
+                else:
+                    updates = ', '.join(f'"{c}" = excluded."{c}"' for c in columns if c != 'id')
+                    # WHERE true - без него SQLite принимает ON CONFLICT за часть JOIN
+                    conn.execute(f'{select} WHERE true ON CONFLICT (id) DO UPDATE SET {updates}')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('DETACH DATABASE staging')
+    finally:
+        conn.close()
+
+    # Пул соединений загрузки (init_db(staging_url)) держит файл открытым: утечка дескрипторов,
+    # а на Windows файл не удалится
+    dispose_engine(staging_url)
+    os.remove(staging_path)
+    logger.info(f"📦 Данные {season} {competition} опубликованы в {live_path}")
@@ -0,0 +1,119 @@
+"""Загрузка страниц заглушки FBref (fbref_stub.py) в базу и производные файлы: python -m pytest test_load.py"""
+
+import numpy as np
+import pytest
+import scraper
+from db import init_db
+from fbref_stub import League, StubServer
+from load_test import fast_scraper
+from main import LoaderCache, scrape_team, load_team, load_table_hashes
+from config import PREMIER_LEAGUE_URL, COMPETITION, PER90_MIN_MINUTES
+
+@pytest.fixture
+def SessionLocal(tmp_path, monkeypatch):
+    # Страницы заглушки не попадают в архив рабочего каталога
+    monkeypatch.setattr(scraper, 'PAGE_ARCHIVE_DIR', None)
+    return init_db(f"sqlite:///{tmp_path / 'football_data.db'}")
+
+def load_league(SessionLocal, league):
+    """Страницы команд лиги с заглушки -> база, как шаг 4 main.run_league (без отчетов о матчах)"""
+    with StubServer(league) as server:
+        client = fast_scraper(server.url)
+        session = SessionLocal()
+        cache = LoaderCache()
+        cache.warm(session)
+        known_hashes = load_table_hashes(session, league.season)
+        for team in client.get_league_teams(PREMIER_LEAGUE_URL):
+            matches, squad, players, table_hashes = scrape_team(
+                client, team, scraper.MatchReportQueue(), known_hashes.get(team['fbref_id'])
+            )
+            load_team(session, cache, team, matches, squad, players, league.season, COMPETITION, table_hashes)
+            session.commit()
+        session.close()
+
+def test_similarity_vectors_have_no_missing_features(SessionLocal, tmp_path):
+    from similarity import FEATURES, PlayerSimilarity, build_index
+    load_league(SessionLocal, League(teams=4, players=12, played_rounds=4))
+    directory = str(tmp_path / 'similarity')
+
+    session = SessionLocal()
+    assert build_index(session, directory) == 'rebuilt'
+    assert build_index(session, directory) == 'unchanged'
+    session.close()
+
+    index = PlayerSimilarity(directory)
+    assert index.vectors.shape == (len(index.keys), len(FEATURES))
+    assert len(index.keys) > 0
+    assert not np.isnan(index.vectors).any()
+
+def test_feature_store_keeps_open_version(SessionLocal, tmp_path):
+    from db import get_engine
+    from features import FeatureStore, export_features
+    load_league(SessionLocal, League(teams=4, players=12, played_rounds=4))
+    engine = get_engine(str(SessionLocal.kw['bind'].url))
+    directory = str(tmp_path / 'features')
+
+    export_features(engine, directory)
+    store = FeatureStore(directory)
+    rows = store.manifest['datasets']['player_season']['rows']
+    goals = store.columns('player_season')['goals']
+    # Следующая выгрузка переключает CURRENT; предыдущая версия остается для открытых хранилищ
+    export_features(engine, directory)
+    assert FeatureStore(directory).directory != store.directory
+    assert len(store.columns('player_season')['xg_per90']) == rows
+    # Более старые версии удаляются, но уже открытые mmap остаются валидными
+    export_features(engine, directory)
+    assert len(goals) == rows and np.nansum(goals) > 0
+    assert not np.isnan(FeatureStore(directory).columns('player_season')['xg_per90']).all()
+
+def test_reload_updates_changed_team_stats(SessionLocal):
+    from db import Player, PlayerStat, PlayerPer90, SquadStat, Team
+    load_league(SessionLocal, League(teams=4, players=12, played_rounds=4))
+    # Те же команды и игроки, еще два сыгранных тура - другие минуты, голы и xG
+    league = League(teams=4, players=12, played_rounds=6)
+    load_league(SessionLocal, league)
+
+    session = SessionLocal()
+    stored = {
+        fbref_id: (minutes, goals, assists, xg)
+        for fbref_id, minutes, goals, assists, xg in session.query(
+            Player.fbref_id, PlayerStat.minutes, PlayerStat.goals, PlayerStat.assists, PlayerStat.xg
+        ).join(PlayerStat, PlayerStat.player_id == Player.id)
+    }
+    expected = {
+        player_id: (stats['minutes'], stats['goals'], stats['assists'], stats['xg'])
+        for player_id, stats in league.player_stats.items()
+    }
+    assert stored == expected
+
+    squads = dict(session.query(Team.fbref_id, SquadStat.goals_for).join(SquadStat, SquadStat.team_id == Team.id))
+    assert squads == {
+        team['id']: sum(league.player_stats[player['id']]['goals'] for player in team['players'])
+        for team in league.teams
+    }
+
+    per90 = dict(
+        session.query(Player.fbref_id, PlayerPer90.minutes).join(PlayerPer90, PlayerPer90.player_id == Player.id)
+    )
+    assert per90 == {
+        player_id: stats['minutes'] for player_id, stats in league.player_stats.items()
+        if stats['minutes'] >= PER90_MIN_MINUTES
+    }
+    session.close()
+
+def test_unparsed_player_stats_are_quarantined():
+    import pandas as pd
+    from transform import normalize_player_stats
+    from validate import check_players
+    table = pd.DataFrame({
+        'Player': ['Ok', 'Unused', 'Garbled'],
+        'Playing Time_Min': ['1,234', None, '90'],
+        'Performance_Gls': ['3', None, 'n/a'],
+        'Performance_Ast': ['1', None, '0'],
+    })
+    records = normalize_player_stats({'stats_standard_9': table}, {'Ok': 'a1', 'Unused': 'b2', 'Garbled': 'c3'})
+    assert [(r['goals'], r['minutes']) for r in records] == [(3, 1234), (0, 0), (None, 90)]
+
+    clean, issues = check_players(records, 'team')
+    assert [r['fbref_id'] for r in clean] == ['a1', 'b2']
+    assert [(i['check'], i['key'], i['action']) for i in issues] == [('stats_missing', 'c3', 'quarantined')]
@@ -1,11 +1,6 @@
 from scraper import FBRefScraper
 from config import PREMIER_LEAGUE_URL
-import logging
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+from log_setup import setup_logging
 
 def test_scrape():
     """Тестовый скрипт для проверки работы парсера"""
@@ -61,5 +56,6 @@ def test_scrape():
     print("=" * 60 + "\n")
 
 if __name__ == "__main__":
+    setup_logging(log_file=None)
     test_scrape()
 
@@ -0,0 +1,269 @@
+"""
+Нормализация разобранных таблиц FBref в плоские записи (list of dict) без обращения к БД.
+
+Функции чистые и не зависят от сессии, поэтому их можно выполнять в отдельных
+процессах (reparse.py) и передавать результат единственному писателю в БД.
+ID команд, игроков и матчей в записях - FBref ID, а не ID строк базы.
+"""
+
+import logging
+import pandas as pd
+from config import COMPETITION
+
+logger = logging.getLogger(__name__)
+
+def flatten_columns(df: pd.DataFrame):
+    """Сворачивает MultiIndex колонки FBref в строки вида 'Performance_Gls'"""
+    if not isinstance(df.columns, pd.MultiIndex):
+        return df
+
+    new_cols = []
+    for col in df.columns:
+        if isinstance(col, tuple):
+            # Объединяем непустые части
+            parts = [str(c).strip() for c in col if str(c).strip() and not str(c).startswith('Unnamed')]
+            new_cols.append('_'.join(parts) if parts else str(col[-1]))
+        else:
+            new_cols.append(str(col))
+    df.columns = new_cols
+    return df
+
+def to_int(value):
+    """Приводит значение ячейки FBref ('1,234', '12.0', NaN) к int или None"""
+    if value is None or pd.isna(value):
+        return None
+    value = str(value).replace(',', '')
+    try:
+        return int(float(value))
+    except ValueError:
+        return None
+
+def to_str(value):
+    """Приводит значение ячейки к строке без пробелов или None для пустых/NaN"""
+    if value is None or pd.isna(value):
+        return None
+    value = str(value).strip()
+    return value or None
+
+def to_float(value):
+    """Приводит значение ячейки FBref к float или None"""
+    if value is None or pd.isna(value):
+        return None
+    try:
+        return float(str(value).replace(',', '').replace('%', ''))
+    except ValueError:
+        return None
+
+def normalize_match_logs(df: pd.DataFrame, competition=COMPETITION):
+    """
+    Лог матчей команды (parse_match_logs) -> записи матчей турнира с точки зрения команды.
+    Будущие матчи имеют пустой счет и match_fbref_id.
+    """
+    if df is None or df.empty:
+        return []
+
+    records = []
+    for _, row in df.iterrows():
+        # Basic validation
+        date = to_str(row.get('Date'))
+        if date is None or row.get('Comp') != competition:
+            continue
+
+        opponent_fbref_id = to_str(row.get('opponent_id'))
+        if not opponent_fbref_id:
+            logger.warning(f"⚠️  Не удалось определить соперника: {row.get('Opponent')}")
+            continue
+
+        records.append({
+            'match_fbref_id': to_str(row.get('match_id')),
+            'date': pd.to_datetime(date).date(),
+            'start_time': to_str(row.get('Time')),
+            'round': to_str(row.get('Round')),
+            'is_home': row.get('Venue') == 'Home',
+            # Future matches have empty scores
+            'goals_for': to_int(row.get('GF')),
+            'goals_against': to_int(row.get('GA')),
+            'opponent_fbref_id': opponent_fbref_id,
+            'opponent_name': to_str(row.get('Opponent')),
+            'opponent_url': to_str(row.get('opponent_url')),
+            'attendance': to_int(row.get('Attendance')),
+            'referee': to_str(row.get('Referee')),
+            'xg': to_float(row.get('xG')),
+            'xga': to_float(row.get('xGA')),
+            'possession': to_float(row.get('Poss')),
+            'formation': to_str(row.get('Formation')),
+            'opp_formation': to_str(row.get('Opp Formation')),
+            'captain_fbref_id': to_str(row.get('captain_id')),
+            'captain_name': to_str(row.get('Captain')),
+        })
+    return records
+
+def is_squad_standard_table(table_id):
+    """Стандартная таблица команды (stats_squads_standard_for)"""
+    return 'standard' in table_id.lower() and 'squad' in table_id.lower()
+
+def is_player_standard_table(table_id):
+    """Стандартная таблица игроков (stats_standard_9)"""
+    return 'standard' in table_id.lower() and 'stats_' in table_id.lower() and not is_squad_standard_table(table_id)
+
+def normalize_squad_stats(squad_tables: dict):
+    """
+    Стандартная таблица команды -> {'goals_for', 'possession'} или None, если таблицы нет.
+    Неразобранные значения - None.
+    """
+    # Find standard table
+    standard_df = None
+    for table_id, df in (squad_tables or {}).items():
+        if is_squad_standard_table(table_id):
+            standard_df = df
+            logger.info("✅ Найдена таблица статистики: %s", table_id, extra={'stage': 'table', 'table': table_id})
+            break
+
+    if standard_df is None or standard_df.empty:
+        logger.warning("⚠️  Таблица статистики команды не найдена")
+        return None
+
+    logger.info("📋 Обработка статистики команды, строк: %d, колонок: %d", len(standard_df), len(standard_df.columns),
+                extra={'stage': 'table'})
+
+    # Flatten columns if multi-index; usually row 0 is the team stats
+    flatten_columns(standard_df)
+    row = standard_df.iloc[0]
+
+    logger.debug("   Колонки: %s...", standard_df.columns[:10].tolist(), extra={'stage': 'table'})
+
+    # Extract basic stats
+    gls = None
+    poss = None
+
+    for col in standard_df.columns:
+        col_str = str(col)
+        if 'Gls' in col_str and gls is None: 
+            gls = row[col]
+            logger.debug("   Найдено голов: %s (колонка: %s)", gls, col, extra={'stage': 'table'})
+        if 'Poss' in col_str and poss is None: 
+            poss = row[col]
+            logger.debug("   Найдено владение: %s (колонка: %s)", poss, col, extra={'stage': 'table'})
+
+    # Неразобранное значение - None, а не 0: такую запись отсеет проверка качества (validate.py)
+    goals_for, possession = to_int(gls), to_float(poss)
+    if goals_for is None and to_str(gls) is not None:
+        logger.warning("⚠️  Не удалось разобрать голы команды: %r", gls, extra={'stage': 'table'})
+    return {
+        'goals_for': goals_for,
+        'possession': possession,
+    }
+
+def to_count(value):
+    """
+    Счетчик игрока (голы, передачи, минуты): пустая ячейка - 0 (FBref не пишет минуты
+    не игравшим), неразобранное значение - None, чтобы запись отсеяла проверка качества
+    """
+    if to_str(value) is None:
+        return 0
+    return to_int(value)
+
+def normalize_player_stats(player_tables: dict, player_ids: dict = None):
+    """
+    Стандартная таблица игроков -> записи (fbref_id, name, position, nationality, goals, assists, minutes,
+    xg, npxg, xag). Ожидаемые показатели (группа колонок Expected) есть не у всех турниров - там они None.
+    Голы, передачи и минуты, которые не удалось разобрать (или без своей колонки), - None:
+    такие строки не загружаются, а уходят в карантин (validate.check_players).
+    Игроки идентифицируются по FBref ID (player_ids: имя -> fbref_id); игроки без ID пропускаются.
+    """
+    if not player_tables:
+        return []
+
+    player_ids = player_ids or {}
+
+    # Ищем таблицу со стандартной статистикой игроков
+    standard_table = None
+    for table_id, df in player_tables.items():
+        if is_player_standard_table(table_id):
+            standard_table = df
+            logger.info("✅ Найдена таблица игроков: %s, строк: %d", table_id, len(df),
+                        extra={'stage': 'table', 'table': table_id})
+            break
+
+    if standard_table is None or standard_table.empty:
+        logger.warning("⚠️  Таблица статистики игроков не найдена")
+        return []
+
+    flatten_columns(standard_table)
+
+    logger.debug("   Колонки таблицы игроков: %s...", standard_table.columns[:10].tolist(), extra={'stage': 'table'})
+
+    # Колонки определяем один раз для всей таблицы, а не для каждой строки
+    name_col = goals_col = assists_col = minutes_col = pos_col = nation_col = None
+    # Expected_xG, Expected_npxG, Expected_xAG (не Expected_npxG+xAG и не Per 90 Minutes_xG)
+    expected_cols = {}
+    for col in standard_table.columns:
+        col_str = str(col)
+        if name_col is None and col_str.lower().endswith('player'):
+            name_col = col
+        # Ищем ТОЛЬКО Performance_Gls / Performance_Ast (не Per 90 Minutes)
+        elif 'Performance' in col_str and col_str.endswith('Gls'):
+            goals_col = col
+        elif 'Performance' in col_str and col_str.endswith('Ast'):
+            assists_col = col
+        # Ищем Playing Time_Min
+        elif 'Playing Time' in col_str and 'Min' in col_str and minutes_col is None:
+            minutes_col = col
+        elif col_str.endswith('Pos') and pos_col is None:
+            pos_col = col
+        elif col_str.endswith('Nation') and nation_col is None:
+            nation_col = col
+        elif col_str.startswith('Expected_') and col_str[len('Expected_'):] in ('xG', 'npxG', 'xAG'):
+            expected_cols.setdefault(col_str[len('Expected_'):].lower(), col)
+
+    if name_col is None:
+        logger.warning("⚠️  Колонка с именем игрока не найдена")
+        return []
+
+    records = []
+    players_without_id = unparsed = 0
+
+    for _, row in standard_table.iterrows():
+        player_name = to_str(row[name_col])
+
+        # Пропускаем заголовки, итоговые строки и пустые значения
+        if (player_name is None or
+            player_name == 'Player' or
+            'Squad Total' in player_name or
+            'Total' in player_name):
+            continue
+
+        fbref_id = player_ids.get(player_name)
+        if not fbref_id:
+            players_without_id += 1
+            continue
+
+        nationality = to_str(row[nation_col]) if nation_col is not None else None
+        if nationality:
+            # Значение вида 'eng ENG' - берем код страны
+            nationality = nationality.split()[-1]
+
+        record = {
+            'fbref_id': fbref_id,
+            'name': player_name,
+            'position': to_str(row[pos_col]) if pos_col is not None else None,
+            'nationality': nationality,
+            # Неразобранное значение - None, а не 0: строку отсеет проверка качества (validate.py)
+            'goals': to_count(row[goals_col]) if goals_col is not None else None,
+            'assists': to_count(row[assists_col]) if assists_col is not None else None,
+            'minutes': to_count(row[minutes_col]) if minutes_col is not None else None,
+            'xg': to_float(row[expected_cols['xg']]) if 'xg' in expected_cols else None,
+            'npxg': to_float(row[expected_cols['npxg']]) if 'npxg' in expected_cols else None,
+            'xag': to_float(row[expected_cols['xag']]) if 'xag' in expected_cols else None,
+        }
+        if record['goals'] is None or record['assists'] is None or record['minutes'] is None:
+            unparsed += 1
+        records.append(record)
+
+    if unparsed:
+        logger.warning("⚠️  Не удалось разобрать голы, передачи или минуты у игроков: %d", unparsed,
+                       extra={'stage': 'table'})
+    if players_without_id:
+        logger.warning(f"⚠️  Пропущено игроков без FBref ID: {players_without_id}")
+
+    return records
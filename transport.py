@@ -0,0 +1,138 @@
+"""
+Транспорт FBRefScraper: HTTP сессия, сжатие ответов и условные запросы.
+
+- Accept-Encoding объявляет только кодировки, которые распакует клиент сессии: urllib3 для
+  requests.Session, httpx для Http2Session (наборы зависят от версий и могут различаться).
+  gzip и deflate всегда, br - с пакетом brotli, zstd - с пакетом zstandard. Заголовок
+  'gzip, deflate, br' без brotli позволял серверу прислать тело, которое клиент не распакует.
+- HTTP2 = True: запросы идут через одно HTTP/2 соединение httpx (пакет httpx[http2]),
+  без пакета - HTTP/1.1 через requests. Ответы и ошибки в обоих случаях как у requests.
+- Условный GET (CONDITIONAL_GET): валидаторы прошлой версии страницы (ETag, Last-Modified)
+  берутся из архива страниц (archive.py). На ответ 304 тело отдается из архива, страница
+  заново не скачивается.
+"""
+
+import logging
+import importlib.util
+import requests
+from urllib3.util.request import ACCEPT_ENCODING
+from archive import get_archive
+from config import HTTP2
+
+logger = logging.getLogger(__name__)
+
+def accept_encoding(session=None):
+    """
+    'gzip, deflate[, br][, zstd]' - кодировки, которые умеет распаковать клиент сессии session:
+    httpx для Http2Session, иначе установленный urllib3 (requests.Session).
+    """
+    if isinstance(session, Http2Session):
+        try:
+            from httpx._decoders import SUPPORTED_DECODERS
+            encodings = [name for name in SUPPORTED_DECODERS if name != 'identity']
+        except ImportError:
+            # Внутренний модуль httpx переименован - только кодировки, которые httpx умеет всегда
+            encodings = ['gzip', 'deflate']
+        return ', '.join(encodings)
+    return ', '.join(ACCEPT_ENCODING.split(','))
+
+class Http2Response:
+    """Ответ httpx с интерфейсом requests.Response (status_code, headers, content, raise_for_status)"""
+
+    def __init__(self, response):
+        self.url = str(response.url)
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.content = response.content
+        self.http_version = response.http_version
+
+    def __bool__(self):
+        return self.status_code < 400
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} для {self.url}", response=self)
+
+class Http2Session:
+    """
+    Сессия поверх httpx.Client(http2=True): все запросы к FBref мультиплексируются в одном соединении.
+    Повторяет используемую скрапером часть requests.Session (headers, get) и поднимает исключения requests.
+    """
+
+    def __init__(self, proxy=None):
+        import httpx
+        self._httpx = httpx
+        self.client = httpx.Client(http2=True, proxy=proxy, follow_redirects=True)
+        self.headers = self.client.headers
+
+    def get(self, url, headers=None, timeout=None):
+        httpx = self._httpx
+        try:
+            return Http2Response(self.client.get(url, headers=headers, timeout=timeout))
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e)) from e
+        except httpx.TransportError as e:
+            # Обрыв соединения, в том числе посреди ответа
+            raise requests.exceptions.ConnectionError(str(e)) from e
+        except httpx.HTTPError as e:
+            raise requests.exceptions.RequestException(str(e)) from e
+
+    def close(self):
+        self.client.close()
+
+def make_session(http2=HTTP2, proxy=None):
+    """HTTP сессия скрапера: Http2Session, если включен HTTP2 и установлен httpx[http2], иначе requests.Session"""
+    if http2:
+        # Без h2 httpx молча работает по HTTP/1.1; сам пакет не импортируется, пока не нужен
+        if importlib.util.find_spec('httpx') and importlib.util.find_spec('h2'):
+            return Http2Session(proxy)
+        logger.warning("⚠️  HTTP2 = True, но пакет httpx[http2] не установлен - используется HTTP/1.1")
+
+    session = requests.Session()
+    if proxy:
+        session.proxies.update({'http': proxy, 'https': proxy})
+    return session
+
+class ArchivedResponse:
+    """
+    Ответ 304 Not Modified с телом прошлой версии страницы из архива.
+    content - страница целиком, как у ответа 200; from_archive отличает его от скачанной страницы.
+    """
+
+    from_archive = True
+
+    def __init__(self, response, page):
+        self.url = page.url
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.content = page.content
+        self.fetched_at = page.fetched_at
+
+    def raise_for_status(self):
+        pass
+
+def cached_page(url, path, validators=True):
+    """
+    Последняя успешно скачанная (200) версия страницы в архиве path, иначе None.
+    validators=True - только если у нее есть валидаторы для условного запроса.
+    Ошибка чтения архива не мешает скачиванию: страница просто запрашивается целиком.
+    """
+    try:
+        page = get_archive(path).get(url)
+    except (OSError, ValueError) as e:
+        logger.warning(f"⚠️  Архив страниц недоступен: {e}")
+        return None
+    if page is None or page.status != 200:
+        return None
+    if validators and not (page.etag or page.last_modified):
+        return None
+    return page
+
+def conditional_headers(page):
+    """If-None-Match / If-Modified-Since по валидаторам страницы из архива"""
+    headers = {}
+    if page.etag:
+        headers['If-None-Match'] = page.etag
+    if page.last_modified:
+        headers['If-Modified-Since'] = page.last_modified
+    return headers
@@ -0,0 +1,331 @@
+"""
+Проверки качества данных.
+
+Проверки записей команды (validate_team) выполняются до загрузки, над нормализованными записями
+transform.py: записи таблицы собираются в DataFrame один раз, каждое правило - векторная маска
+по его строкам. Строки, нарушившие правило уровня 'error', не загружаются, а попадают
+в таблицу quarantine вместе с причиной; 'warning' только фиксируется.
+
+Сезонные проверки (check_season) - SQL агрегаты по уже загруженному сезону: голы игроков
+в сумме равны голам команды, обе стороны матча согласны о счете, у каждой команды
+2 * (команд - 1) матчей, минуты игроков не больше сыгранных командой матчей.
+Итог запуска - сводка по проверкам в логе и `python etl.py validate --run N`.
+"""
+
+import json
+import logging
+from datetime import date, datetime
+import pandas as pd
+from sqlalchemy import text, func
+from sqlalchemy.orm import Session
+from db import Quarantine, EtlRun, Match
+from config import (
+    SEASON, COMPETITION, VALIDATION_MATCHES_PER_TEAM, VALIDATION_MAX_GOALS, VALIDATION_MATCH_MINUTES
+)
+
+logger = logging.getLogger(__name__)
+
+def _numeric(df, column):
+    """Колонка кадра как числа (None и мусор -> NaN); отсутствующая колонка - пустая"""
+    if column not in df.columns:
+        return pd.Series(float('nan'), index=df.index)
+    return pd.to_numeric(df[column], errors='coerce')
+
+def _issue(table, check, severity, team, key, detail, record=None):
+    return {
+        'table': table,
+        'check': check,
+        'severity': severity,
+        'action': 'quarantined' if record is not None else 'reported',
+        'team': team,
+        'key': key,
+        'detail': detail,
+        'record': record,
+    }
+
+def _apply_rules(table, df, rules, keys, team, records):
+    """
+    rules: [(check, severity, маска строк, описание)]. Возвращает (записи без ошибок, нарушения).
+    Строки с ошибкой уходят в карантин один раз - с первой нарушенной проверкой.
+    """
+    issues = []
+    rejected = pd.Series(False, index=df.index)
+    for check, severity, mask, detail in rules:
+        mask = mask.fillna(False).astype(bool)
+        if not mask.any():
+            continue
+        for position in mask.to_numpy().nonzero()[0]:
+            row = df.index[position]
+            quarantine = severity == 'error' and not rejected[row]
+            issues.append(_issue(table, check, severity, team, keys[row], detail,
+                                 records[position] if quarantine else None))
+        if severity == 'error':
+            rejected |= mask
+    clean = [record for record, bad in zip(records, rejected.to_numpy()) if not bad]
+    return clean, issues
+
+def check_matches(records, team=None):
+    """Записи лога матчей команды (normalize_match_logs): (прошедшие проверку, нарушения)"""
+    if not records:
+        return records, []
+    df = pd.DataFrame.from_records(records)
+    gf, ga = _numeric(df, 'goals_for'), _numeric(df, 'goals_against')
+    possession, xg, xga = _numeric(df, 'possession'), _numeric(df, 'xg'), _numeric(df, 'xga')
+    played = gf.notna()
+    keys = (df['date'].astype(str) + ' ' + df['opponent_fbref_id'].astype(str)
+            + df['is_home'].map({True: ' H', False: ' A'})).tolist()
+    rules = [
+        ('score_partial', 'error', gf.isna() != ga.isna(), 'известен счет только одной команды'),
+        ('score_negative', 'error', (gf < 0) | (ga < 0), 'отрицательный счет'),
+        # В лиге соперник принимает команду один раз за сезон
+        ('duplicate_fixture', 'error', df.duplicated(['opponent_fbref_id', 'is_home']), 'матч повторяется'),
+        ('score_high', 'warning', (gf > VALIDATION_MAX_GOALS) | (ga > VALIDATION_MAX_GOALS),
+         f'больше {VALIDATION_MAX_GOALS} голов'),
+        ('score_in_future', 'warning', played & (pd.to_datetime(df['date']) > pd.Timestamp(date.today())),
+         'счет у матча в будущем'),
+        ('played_without_id', 'warning', played & df['match_fbref_id'].isna(), 'у сыгранного матча нет ID'),
+        ('possession_range', 'warning', (possession < 0) | (possession > 100), 'владение вне 0..100'),
+        ('xg_negative', 'warning', (xg < 0) | (xga < 0), 'отрицательный xG'),
+    ]
+    return _apply_rules('matches', df, rules, keys, team, records)
+
+def check_squad(record, team=None):
+    """Статистика команды (normalize_squad_stats): (запись или None, нарушения)"""
+    if record is None:
+        return None, []
+    df = pd.DataFrame.from_records([record])
+    goals, possession = _numeric(df, 'goals_for'), _numeric(df, 'possession')
+    rules = [
+        ('goals_missing', 'error', goals.isna(), 'голы команды не разобраны'),
+        ('goals_negative', 'error', goals < 0, 'отрицательные голы'),
+        ('possession_range', 'error', (possession < 0) | (possession > 100), 'владение вне 0..100'),
+        ('possession_missing', 'warning', possession.isna(), 'владение не разобрано'),
+    ]
+    clean, issues = _apply_rules('squad_stats', df, rules, [team], team, [record])
+    return (clean[0] if clean else None), issues
+
+def check_players(records, team=None, max_minutes=None):
+    """
+    Статистика игроков (normalize_player_stats): (прошедшие проверку, нарушения).
+    max_minutes - больше минут за сезон у игрока быть не может (матчей в логе команды * 90).
+    """
+    if not records:
+        return records, []
+    df = pd.DataFrame.from_records(records)
+    goals, assists, minutes = _numeric(df, 'goals'), _numeric(df, 'assists'), _numeric(df, 'minutes')
+    rules = [
+        ('duplicate_player', 'error', df.duplicated('fbref_id'), 'игрок повторяется'),
+        ('stats_missing', 'error', goals.isna() | assists.isna() | minutes.isna(),
+         'голы, передачи или минуты не разобраны'),
+        ('stats_negative', 'error', (goals < 0) | (assists < 0) | (minutes < 0), 'отрицательные показатели'),
+        ('goals_without_minutes', 'warning', ((goals > 0) | (assists > 0)) & (minutes == 0),
+         'голы или передачи без сыгранных минут'),
+    ]
+    if max_minutes:
+        rules.append(('minutes_range', 'error', minutes > max_minutes, f'больше {max_minutes} минут за сезон'))
+    return _apply_rules('player_stats', df, rules, df['fbref_id'].astype(str).tolist(), team, records)
+
+def validate_team(team_data, matches, squad, players):
+    """
+    Проверяет нормализованные записи команды перед загрузкой (load_team).
+    Возвращает (matches, squad, players, нарушения) - записи без строк с ошибками.
+    """
+    team = team_data.get('fbref_id')
+    matches, match_issues = check_matches(matches, team)
+    squad, squad_issues = check_squad(squad, team)
+    # Лог матчей команды - весь ее сезон, включая будущие матчи
+    max_minutes = len(matches) * VALIDATION_MATCH_MINUTES if matches else None
+    players, player_issues = check_players(players, team, max_minutes)
+    issues = match_issues + squad_issues + player_issues
+    quarantined = sum(issue['action'] == 'quarantined' for issue in issues)
+    if issues:
+        logger.warning("🔎 %s: нарушений проверок %d, в карантине записей %d", team_data.get('name'),
+                       len(issues), quarantined, extra={'stage': 'validate'})
+    return matches, squad, players, issues
+
+def _open_run_id(session: Session):
+    return session.query(func.max(EtlRun.id)).filter(EtlRun.finished_at.is_(None)).scalar()
+
+def save_issues(session: Session, issues, run_id=None):
+    """Пишет нарушения в quarantine (по умолчанию - в открытый запуск). Коммит - на стороне вызывающего кода"""
+    if not issues:
+        return
+    run_id = run_id or _open_run_id(session)
+    now = datetime.now()
+    session.execute(Quarantine.__table__.insert(), [
+        {
+            'run_id': run_id,
+            'table_name': issue['table'],
+            'check_name': issue['check'],
+            'severity': issue['severity'],
+            'action': issue['action'],
+            'team_fbref_id': issue['team'],
+            'row_key': issue['key'],
+            'detail': issue['detail'],
+            'record': json.dumps(issue['record'], ensure_ascii=False, default=str) if issue['record'] is not None else None,
+            'created_at': now,
+        }
+        for issue in issues
+    ])
+
+SQUAD_GOALS_SQL = """
+SELECT t.fbref_id, t.name, s.goals_for, COALESCE(SUM(p.goals), 0)
+FROM squad_stats s
+JOIN teams t ON t.id = s.team_id
+LEFT JOIN player_stats p ON p.team_id = s.team_id AND p.season = s.season AND p.competition = s.competition
+WHERE s.season = :season AND s.competition = :competition
+GROUP BY t.fbref_id, t.name, s.goals_for
+HAVING s.goals_for IS NULL OR s.goals_for <> COALESCE(SUM(p.goals), 0)
+"""
+
+FIXTURE_SCORE_SQL = """
+SELECT m.fbref_id, m.date, h.fbref_id, h.name, a.name, m.home_score, m.away_score,
+       hs.goals_for, hs.goals_against, aws.goals_for, aws.goals_against
+FROM matches m
+JOIN teams h ON h.id = m.home_team_id
+JOIN teams a ON a.id = m.away_team_id
+LEFT JOIN team_match_stats hs ON hs.match_id = m.id AND hs.team_id = m.home_team_id
+LEFT JOIN team_match_stats aws ON aws.match_id = m.id AND aws.team_id = m.away_team_id
+WHERE m.season = :season AND m.competition = :competition AND m.home_score IS NOT NULL
+  AND ((hs.id IS NOT NULL AND (hs.goals_for IS NULL OR hs.goals_for <> m.home_score OR hs.goals_against <> m.away_score))
+    OR (aws.id IS NOT NULL AND (aws.goals_for IS NULL OR aws.goals_for <> m.away_score OR aws.goals_against <> m.home_score)))
+"""
+
+TEAM_MATCHES_SQL = """
+WITH sides AS (
+    SELECT home_team_id AS team_id, home_score AS score FROM matches WHERE season = :season AND competition = :competition
+    UNION ALL
+    SELECT away_team_id, away_score FROM matches WHERE season = :season AND competition = :competition
+)
+SELECT t.id, t.fbref_id, t.name, COUNT(*), COUNT(s.score)
+FROM sides s JOIN teams t ON t.id = s.team_id
+GROUP BY t.id, t.fbref_id, t.name
+"""
+
+PLAYER_MINUTES_SQL = """
+WITH played AS (
+    SELECT team_id, COUNT(*) AS matches FROM (
+        SELECT home_team_id AS team_id FROM matches
+        WHERE season = :season AND competition = :competition AND home_score IS NOT NULL
+        UNION ALL
+        SELECT away_team_id FROM matches
+        WHERE season = :season AND competition = :competition AND home_score IS NOT NULL
+    ) sides GROUP BY team_id
+)
+SELECT t.fbref_id, pl.fbref_id, pl.name, p.minutes, COALESCE(pd.matches, 0)
+FROM player_stats p
+JOIN players pl ON pl.id = p.player_id
+JOIN teams t ON t.id = p.team_id
+LEFT JOIN played pd ON pd.team_id = p.team_id
+WHERE p.season = :season AND p.competition = :competition
+  AND p.minutes > COALESCE(pd.matches, 0) * :match_minutes
+"""
+
+LINEUP_MINUTES_SQL = """
+SELECT t.fbref_id, m.fbref_id, pl.fbref_id, pl.name, l.minutes
+FROM match_lineups l
+JOIN matches m ON m.id = l.match_id
+JOIN players pl ON pl.id = l.player_id
+LEFT JOIN teams t ON t.id = l.team_id
+WHERE m.season = :season AND m.competition = :competition
+  AND (l.minutes < 0 OR l.minutes > :match_minutes)
+"""
+
+def check_season(session: Session, season=SEASON, competition=COMPETITION):
+    """Сезонные проверки загруженных данных. Возвращает нарушения (не сохраняет их)"""
+    params = {'season': season, 'competition': competition, 'match_minutes': VALIDATION_MATCH_MINUTES}
+    issues = []
+
+    for team, name, squad_goals, player_goals in session.execute(text(SQUAD_GOALS_SQL), params):
+        issues.append(_issue('squad_stats', 'squad_goals_sum', 'error', team, name,
+                             f'голы команды {squad_goals}, сумма голов игроков {player_goals}'))
+
+    for row in session.execute(text(FIXTURE_SCORE_SQL), params):
+        match_id, match_date, home_id, home, away, home_score, away_score = row[:7]
+        issues.append(_issue('matches', 'fixture_score', 'error', home_id, match_id or f'{match_date} {home}-{away}',
+                             f'{home} - {away} {home_score}:{away_score}, хозяева: {row[7]}:{row[8]}, '
+                             f'гости: {row[9]}:{row[10]}'))
+
+    teams = session.execute(text(TEAM_MATCHES_SQL), params).fetchall()
+    expected = VALIDATION_MATCHES_PER_TEAM or 2 * (len(teams) - 1)
+    for _, team, name, fixtures, played in teams:
+        if fixtures != expected:
+            issues.append(_issue('matches', 'team_fixtures', 'warning', team, name,
+                                 f'матчей в сезоне {fixtures}, ожидается {expected}'))
+
+    for team, player, name, minutes, played in session.execute(text(PLAYER_MINUTES_SQL), params):
+        issues.append(_issue('player_stats', 'season_minutes', 'warning', team, player,
+                             f'{name}: {minutes} минут при {played} сыгранных матчах команды'))
+
+    for team, match_id, player, name, minutes in session.execute(text(LINEUP_MINUTES_SQL), params):
+        issues.append(_issue('match_lineups', 'lineup_minutes', 'warning', team, f'{match_id} {player}',
+                             f'{name}: {minutes} минут в матче'))
+    return issues
+
+def summary(session: Session, run_id):
+    """Сводка нарушений запуска: [(table, check, severity, action, count)]"""
+    return session.query(
+        Quarantine.table_name, Quarantine.check_name, Quarantine.severity, Quarantine.action, func.count()
+    ).filter(Quarantine.run_id == run_id).group_by(
+        Quarantine.table_name, Quarantine.check_name, Quarantine.severity, Quarantine.action
+    ).order_by(Quarantine.severity, Quarantine.table_name, Quarantine.check_name).all()
+
+def log_summary(session: Session, run_id):
+    """Пишет сводку проверок запуска в лог. Возвращает количество нарушений уровня 'error'"""
+    rows = summary(session, run_id)
+    if not rows:
+        logger.info(f"🔎 Проверки качества запуска #{run_id}: нарушений нет")
+        return 0
+    errors = sum(count for _, _, severity, _, count in rows if severity == 'error')
+    warnings = sum(count for _, _, severity, _, count in rows if severity == 'warning')
+    logger.info(f"🔎 Проверки качества запуска #{run_id}: ошибок {errors}, предупреждений {warnings}")
+    for table, check, severity, action, count in rows:
+        log = logger.warning if severity == 'error' else logger.info
+        log(f"   {severity:<8} {table}.{check}: {count} ({action})")
+    return errors
+
+def run_season_checks(session: Session, run_id, season=None, competition=None):
+    """
+    Сезонные проверки в конце запуска: по сезону season или по всем сезонам, матчи которых есть в базе.
+    Сохраняет нарушения в запуск run_id, коммитит сессию и пишет сводку в лог.
+    """
+    if season is None:
+        seasons = session.query(Match.season, Match.competition).distinct().all()
+    else:
+        seasons = [(season, competition or COMPETITION)]
+    for season, competition in seasons:
+        save_issues(session, check_season(session, season, competition), run_id)
+    session.commit()
+    return log_summary(session, run_id)
+
+def main(argv=None):
+    """Сводка проверок запуска или проверка сезона по текущей базе"""
+    import argparse
+    from db import init_db
+    from config import DB_PATH
+    parser = argparse.ArgumentParser(description='Проверки качества данных')
+    parser.add_argument('--run', type=int, help='сводка запуска N (по умолчанию - последнего)')
+    parser.add_argument('--season', help='проверить сезон по текущей базе (без сохранения)')
+    parser.add_argument('--competition', default=COMPETITION)
+    parser.add_argument('--db', default=DB_PATH, help='URL базы данных')
+    args = parser.parse_args(argv)
+
+    session = init_db(args.db)()
+    try:
+        if args.season:
+            for issue in check_season(session, args.season, args.competition):
+                check = f"{issue['table']}.{issue['check']}"
+                print(f"{issue['severity']:<8} {check:<32} {issue['key']}: {issue['detail']}")
+            return
+        run_id = args.run or session.query(func.max(Quarantine.run_id)).scalar()
+        if run_id is None:
+            print("Нарушений проверок нет")
+            return
+        print(f"Запуск #{run_id}")
+        for table, check, severity, action, count in summary(session, run_id):
+            print(f"{severity:<8} {table + '.' + check:<32} {count:>6} {action}")
+    finally:
+        session.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Каталоги производных файлов (similarity.py, features.py) и их версии.
+
+Каждая версия - подкаталог v<N>, текущая указана в файле CURRENT. Новая версия пишется целиком
+в свой подкаталог, после чего CURRENT подменяется через os.replace. Замена файла атомарна, поэтому
+читатель всегда открывает одну целую версию: нет ни момента без каталога, ни смеси старых и новых
+файлов. Предыдущая версия остается для читателей, прочитавших CURRENT до переключения, более старые
+удаляются (уже открытые mmap на POSIX остаются валидными, на Windows занятые файлы пропускаются).
+"""
+
+import os
+import re
+import shutil
+from config import DB_PATH, SIMILARITY_DIR, FEATURE_STORE_DIR
+
+POINTER = 'CURRENT'
+VERSION_RE = re.compile(r'^v(\d+)$')
+
+def derived_dirs(db_path=DB_PATH):
+    """
+    Каталоги производных файлов базы db_path: (индекс похожих игроков, хранилище признаков).
+    Рабочая база DB_PATH - SIMILARITY_DIR и FEATURE_STORE_DIR; другая база SQLite - каталоги рядом
+    с ее файлом, другая база PostgreSQL - с именем базы в суффиксе. Загрузка в черновую базу
+    (reparse.py --db) не подменяет файлы рабочей.
+    """
+    if db_path == DB_PATH:
+        return SIMILARITY_DIR, FEATURE_STORE_DIR
+    if db_path.startswith('sqlite:///'):
+        base = os.path.splitext(db_path[len('sqlite:///'):])[0]
+        return f'{base}.similarity', f'{base}.features'
+    name = re.sub(r'\W+', '_', db_path.rsplit('/', 1)[-1])
+    return f'{SIMILARITY_DIR}-{name}', f'{FEATURE_STORE_DIR}-{name}'
+
+def _versions(directory):
+    """Номера версий в каталоге по возрастанию"""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(int(found.group(1)) for found in map(VERSION_RE.match, names) if found)
+
+def current_version(directory):
+    """Путь к текущей версии или None, если версий еще нет"""
+    try:
+        with open(os.path.join(directory, POINTER), encoding='utf-8') as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    path = os.path.join(directory, name)
+    return path if VERSION_RE.match(name) and os.path.isdir(path) else None
+
+def new_version(directory):
+    """Создает пустой подкаталог следующей версии и возвращает путь к нему"""
+    os.makedirs(directory, exist_ok=True)
+    number = max(_versions(directory), default=0) + 1
+    while True:
+        path = os.path.join(directory, f'v{number}')
+        try:
+            os.makedirs(path)
+            return path
+        except FileExistsError:
+            # Параллельная пересборка заняла номер
+            number += 1
+
+def publish_version(directory, path):
+    """Делает версию path текущей и удаляет версии старше предыдущей"""
+    previous = current_version(directory)
+    tmp_pointer = os.path.join(directory, f'{POINTER}.{os.getpid()}.tmp')
+    with open(tmp_pointer, 'w', encoding='utf-8') as f:
+        f.write(os.path.basename(path))
+    os.replace(tmp_pointer, os.path.join(directory, POINTER))
+
+    published = int(VERSION_RE.match(os.path.basename(path)).group(1))
+    previous = os.path.basename(previous) if previous else None
+    # Версии новее опубликованной - недописанные параллельные выгрузки, их не трогаем
+    for number in _versions(directory):
+        if number < published and f'v{number}' != previous:
+            shutil.rmtree(os.path.join(directory, f'v{number}'), ignore_errors=True)
+
+def discard_version(path):
+    """Удаляет недописанную версию (ошибка при выгрузке)"""
+    shutil.rmtree(path, ignore_errors=True)
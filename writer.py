@@ -0,0 +1,128 @@
+"""
+Асинхронный писатель в БД.
+
+Скрапер (или reparse) передает нормализованные данные писателю через ограниченную очередь,
+а писатель в отдельном потоке применяет их к базе и коммитит крупными транзакциями:
+после WRITER_BATCH_SIZE задач или WRITER_BATCH_SECONDS секунд. Цикл скачивания не ждет
+fsync; если писатель отстает, очередь заполняется и submit блокирует производителя.
+
+Каждая задача выполняется в SAVEPOINT: ошибка откатывает только ее (задача попадает
+в failed), остальные задачи пачки коммитятся.
+
+    with DBWriter(SessionLocal) as writer:
+        writer.submit('Arsenal', load_team, team_info, matches, squad, players)
+    writer.failed  # имена задач с ошибкой
+"""
+
+import time
+import queue
+import logging
+import threading
+from log_setup import log_context
+from config import WRITER_QUEUE_SIZE, WRITER_BATCH_SIZE, WRITER_BATCH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class DBWriter:
+    """
+    Поток-писатель. Задача - функция fn(session, cache, *args); сессия и LoaderCache
+    создаются в потоке писателя и используются только им.
+    """
+
+    def __init__(self, session_factory, queue_size=WRITER_QUEUE_SIZE,
+                 batch_size=WRITER_BATCH_SIZE, batch_seconds=WRITER_BATCH_SECONDS):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
+        self.failed = []
+        self.done = 0
+        self.error = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def submit(self, name, fn, *args):
+        """Ставит задачу в очередь; блокируется, пока писатель не освободит место"""
+        if self.error is not None:
+            raise RuntimeError(f"Писатель БД остановлен с ошибкой: {self.error}") from self.error
+        item = (name, fn, args)
+        try:
+            self._queue.put_nowait(item)
+            return
+        except queue.Full:
+            started = time.monotonic()
+        while True:
+            try:
+                self._queue.put(item, timeout=1.0)
+                break
+            except queue.Full:
+                if self.error is not None:
+                    raise RuntimeError(f"Писатель БД остановлен с ошибкой: {self.error}") from self.error
+        logger.info(f"⏳ Писатель БД отстает: ожидание очереди {time.monotonic() - started:.1f}с")
+
+    def close(self):
+        """Дожидается записи всех задач и последнего коммита"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        if self.error is not None:
+            raise RuntimeError(f"Писатель БД остановлен с ошибкой: {self.error}") from self.error
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _run(self):
+        # Импорт здесь: main импортирует writer
+        from main import LoaderCache
+
+        session = self.session_factory()
+        cache = LoaderCache()
+        pending = 0
+        deadline = None
+        try:
+            cache.warm(session)
+            while True:
+                timeout = max(0.0, deadline - time.monotonic()) if pending else None
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                if item is _STOP:
+                    break
+                if item is not None:
+                    name, fn, args = item
+                    try:
+                        with log_context(task=name), session.begin_nested():
+                            fn(session, cache, *args)
+                        self.done += 1
+                    except Exception as e:
+                        logger.error(f"❌ Ошибка записи {name}: {e}")
+                        self.failed.append(name)
+                        # Откатанные записи не должны остаться в кэше
+                        cache.warm(session)
+                    if not pending:
+                        deadline = time.monotonic() + self.batch_seconds
+                    pending += 1
+
+                if pending and (pending >= self.batch_size or time.monotonic() >= deadline):
+                    session.commit()
+                    logger.debug(f"💾 Коммит пачки: задач {pending}")
+                    pending = 0
+            session.commit()
+        except Exception as e:
+            logger.error(f"❌ Писатель БД остановлен: {e}")
+            self.error = e
+            session.rollback()
+        finally:
+            engine = session.get_bind()
+            session.close()
+            engine.dispose()